@@ -41,6 +41,12 @@ SCHEMA = {
                             'state_thrift_services_port': {'type': 'port'},
                             'config_thrift_services_port': {'type': 'port'},
                             'kernel_route_table': {'type': 'kernel_route_table'},
+                            'kernel_route_grace_period': {'type': 'number', 'min': 0},
+                            'spf_engine': {'type': 'string', 'allowed': ['heap', 'csr']},
+                            'spf_initial_delay': {'type': 'number', 'min': 0},
+                            'spf_secondary_wait': {'type': 'number', 'min': 0},
+                            'spf_max_wait': {'type': 'number', 'min': 0},
+                            'spf_quiet_period': {'type': 'number', 'min': 0},
                             'v4prefixes': {
                                 'type': 'list',
                                 'schema': {
@@ -0,0 +1,133 @@
+import collections
+import copy
+
+import encoding.ttypes
+import packet_common
+
+# Encoded Thrift binary protocol field headers (type I64, field id) of the nonce fields in a LIE
+LIE_NONCE_FIELD_HEADER = b'\x0a\x00\x08'
+LIE_LAST_NEIGHBOR_NONCE_FIELD_HEADER = b'\x0a\x00\x09'
+NONCE_SIZE = 8
+
+class DecodeCache:
+    # Bounded LRU cache of recently decoded LIE and TIE messages, indexed by the received bytes.
+    #
+    # LIEs from the same neighbor are byte-for-byte identical except for the nonces, and the same
+    # TIE is received on each of the parallel links to a neighbor. For such repeated messages the
+    # decoded (and fixed-up) protocol packet is taken from the cache instead of decoding the message
+    # again.
+    #
+    # The nonce fields of a LIE are masked out of the cache key. The offsets of the nonces in the
+    # message are learned when a LIE is decoded the first time, and are remembered per message
+    # length. When the cached LIE is used, the nonces are patched in from the received message.
+    #
+    # Each lookup returns a new protocol packet object; the parts of a cached packet that the
+    # receiver may modify (the LIE itself and the TIE header) are copied. The TIE element is shared.
+
+    DEFAULT_MAX_ENTRIES = 1024
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self._max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lie_nonce_offsets = {}   # (nonce offset, last neighbor nonce offset) by length
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+        self._lie_nonce_offsets.clear()
+
+    def decode(self, message, content_type):
+        # Returns (protocol_packet, cache_hit). The content type is the one reported by
+        # packet_common.decode_protocol_packet_header. The cache_hit is None if the message is not
+        # of a type that is cached. The protocol_packet is None if the message could not be decoded.
+        if content_type == "lie":
+            key = self._lie_key(message)
+        elif content_type == "tie":
+            key = message
+        else:
+            return (packet_common.decode_protocol_packet(message), None)
+        if key is not None:
+            protocol_packet = self._entries.get(key)
+            if protocol_packet is not None:
+                self._entries.move_to_end(key)
+                return (self._copy_protocol_packet(protocol_packet, message), True)
+        protocol_packet = packet_common.decode_protocol_packet(message)
+        if protocol_packet is None:
+            return (None, False)
+        if content_type == "lie":
+            key = self._learn_lie_key(message, protocol_packet.content.lie)
+        if key is None:
+            return (protocol_packet, False)
+        self._entries[key] = protocol_packet
+        if len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+        return (self._copy_protocol_packet(protocol_packet, message), False)
+
+    def _lie_key(self, message):
+        offsets = self._lie_nonce_offsets.get(len(message))
+        if offsets is None:
+            return None
+        (nonce_offset, last_nonce_offset) = offsets
+        if nonce_offset is not None:
+            header_offset = nonce_offset - len(LIE_NONCE_FIELD_HEADER)
+            if message[header_offset:nonce_offset] != LIE_NONCE_FIELD_HEADER:
+                return None
+        if last_nonce_offset is not None:
+            header_offset = last_nonce_offset - len(LIE_LAST_NEIGHBOR_NONCE_FIELD_HEADER)
+            if message[header_offset:last_nonce_offset] != LIE_LAST_NEIGHBOR_NONCE_FIELD_HEADER:
+                return None
+        return (offsets, self._mask_nonces(message, offsets))
+
+    def _learn_lie_key(self, message, lie_packet):
+        if lie_packet is None:
+            return None
+        nonce_offset = self._find_nonce(message, LIE_NONCE_FIELD_HEADER, lie_packet.nonce)
+        if nonce_offset is False:
+            return None
+        last_nonce_offset = self._find_nonce(message, LIE_LAST_NEIGHBOR_NONCE_FIELD_HEADER,
+                                             lie_packet.last_neighbor_nonce)
+        if last_nonce_offset is False:
+            return None
+        offsets = (nonce_offset, last_nonce_offset)
+        self._lie_nonce_offsets[len(message)] = offsets
+        return (offsets, self._mask_nonces(message, offsets))
+
+    @staticmethod
+    def _find_nonce(message, field_header, nonce):
+        # Returns the offset of the nonce value in the message, None if the nonce is not present,
+        # or False if the nonce cannot be located unambiguously.
+        if nonce is None:
+            return None
+        encoded_field = field_header + nonce.to_bytes(NONCE_SIZE, 'big')
+        offset = message.find(encoded_field)
+        if offset == -1 or message.find(encoded_field, offset + 1) != -1:
+            return False
+        return offset + len(field_header)
+
+    @staticmethod
+    def _mask_nonces(message, offsets):
+        masked = bytearray(message)
+        for offset in offsets:
+            if offset is not None:
+                masked[offset:offset + NONCE_SIZE] = bytes(NONCE_SIZE)
+        return bytes(masked)
+
+    @staticmethod
+    def _read_nonce(message, offset):
+        if offset is None:
+            return None
+        return int.from_bytes(message[offset:offset + NONCE_SIZE], 'big')
+
+    def _copy_protocol_packet(self, protocol_packet, message):
+        content = copy.copy(protocol_packet.content)
+        if content.lie is not None:
+            content.lie = copy.copy(content.lie)
+            (nonce_offset, last_nonce_offset) = self._lie_nonce_offsets[len(message)]
+            content.lie.nonce = self._read_nonce(message, nonce_offset)
+            content.lie.last_neighbor_nonce = self._read_nonce(message, last_nonce_offset)
+        if content.tie is not None:
+            content.tie = encoding.ttypes.TIEPacket(header=copy.copy(content.tie.header),
+                                                    element=content.tie.element)
+        return encoding.ttypes.ProtocolPacket(header=protocol_packet.header, content=content)
@@ -8,6 +8,7 @@ import cli_listen_handler
 import cli_session_handler
 import interface
 import node
+import packet_common
 import scheduler
 import table
 
@@ -24,6 +25,8 @@ class Engine:
             filename=log_file_name,
             format='%(asctime)s:%(levelname)s:%(name)s:%(message)s',
             level=log_level)
+        self._log = logging.getLogger('engine')
+        self._log.info("[engine] Thrift codec: %s", packet_common.THRIFT_CODEC)
         self._run_which_nodes = run_which_nodes
         self._interactive = interactive
         self._telnet_port_file = telnet_port_file
@@ -106,6 +109,21 @@ class Engine:
     def command_show_intf_queues(self, cli_session, parameters):
         cli_session.current_node.command_show_intf_queues(cli_session, parameters)
 
+    def command_show_engine(self, cli_session):
+        tab = table.Table(separators=False)
+        tab.add_rows(self.cli_detailed_attributes())
+        cli_session.print(tab.to_string())
+
+    def cli_detailed_attributes(self):
+        return [
+            ["Interactive", self._interactive],
+            ["Telnet Port File", self._telnet_port_file],
+            ["IPv4 Multicast Loopback", self._multicast_loopback],
+            ["Number of Nodes", len(self._nodes)],
+            ["Transmit Source Address", self._tx_src_address],
+            ["Thrift Codec", packet_common.THRIFT_CODEC],
+        ]
+
     def command_show_interface(self, cli_session, parameters):
         cli_session.current_node.command_show_interface(cli_session, parameters)
 
@@ -115,6 +133,9 @@ class Engine:
     def command_show_interfaces(self, cli_session):
         cli_session.current_node.command_show_interfaces(cli_session)
 
+    def command_show_kernel(self, cli_session):
+        cli_session.current_node.command_show_kernel(cli_session)
+
     def command_show_kernel_addresses(self, cli_session):
         cli_session.current_node.command_show_kernel_addresses(cli_session)
 
@@ -168,6 +189,9 @@ class Engine:
     def command_show_forwarding(self, cli_session):
         cli_session.current_node.command_show_forwarding(cli_session)
 
+    def command_show_forwarding_lookup(self, cli_session, parameters):
+        cli_session.current_node.command_show_forwarding_lookup(cli_session, parameters)
+
     def command_show_forwarding_prefix(self, cli_session, parameters):
         cli_session.current_node.command_show_forwarding_prefix(cli_session, parameters)
 
@@ -220,8 +244,10 @@ class Engine:
             "$level": command_set_level,
         },
         "show": {
+            "engine": command_show_engine,
             "forwarding": {
                 "": command_show_forwarding,
+                "$lookup": command_show_forwarding_lookup,
                 "$prefix": command_show_forwarding_prefix,
             },
             "fsm": {
@@ -238,6 +264,7 @@ class Engine:
             },
             "interfaces": command_show_interfaces,
             "kernel": {
+                "": command_show_kernel,
                 "addresses": command_show_kernel_addresses,
                 "links": command_show_kernel_links,
                 "routes": {
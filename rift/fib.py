@@ -1,6 +1,10 @@
+import logging
+
 import sortedcontainers
 
+import constants
 import packet_common
+import prefix_trie
 import route
 import table
 
@@ -14,11 +18,24 @@ class ForwardingTable:
         # Sorted dict of Route objects indexed by prefix. We use the Route class for both the RIB
         # and the FIB, although not all Route attributes are relevant for the FIB.
         self.routes = sortedcontainers.SortedDict()
+        # Patricia trie of the same Route objects, indexed by prefix, for longest prefix match
+        # lookups. It is kept in sync with the sorted dict by put_route and del_route.
+        # Prefixes which only differ in their host bits (e.g. 10.0.0.1/8 and 10.0.0.2/8) are
+        # different keys in the sorted dict, but share the same trie node. The trie node holds the
+        # route of the most recently put prefix.
+        if address_family == constants.ADDRESS_FAMILY_IPV4:
+            self._trie = prefix_trie.PrefixTrie(32)
+        else:
+            assert address_family == constants.ADDRESS_FAMILY_IPV6
+            self._trie = prefix_trie.PrefixTrie(128)
+        # The prefixes in the sorted dict which share each trie node, indexed by trie key, in the
+        # order in which they were put; the last one is the one whose route is in the trie node.
+        self._trie_key_prefixes = {}
         self._log = log
         self._log_id = log_id
 
     def debug(self, msg, *args):
-        if self._log:
+        if self._log and self._log.isEnabledFor(logging.DEBUG):
             self._log.debug("[%s] %s" % (self._log_id, msg), *args)
 
     def get_route(self, prefix):
@@ -32,8 +49,15 @@ class ForwardingTable:
         packet_common.assert_prefix_address_family(rte.prefix, self.address_family)
         self.debug("Put %s", rte)
         self.routes[rte.prefix] = rte
+        key = trie_key(rte.prefix)
+        prefixes = self._trie_key_prefixes.setdefault(key, [])
+        if rte.prefix in prefixes:
+            prefixes.remove(rte.prefix)
+        prefixes.append(rte.prefix)
+        (address, prefixlen) = key
+        self._trie.put(address, prefixlen, rte)
         if self.kernel is not None:
-            self.kernel.put_route(rte)
+            self.kernel.queue_put_route(rte)
 
     def del_route(self, prefix):
         # Returns True if the route was present in the table and False if not.
@@ -43,10 +67,30 @@ class ForwardingTable:
             return False
         self.debug("Delete %s", prefix)
         del self.routes[prefix]
+        key = trie_key(prefix)
+        prefixes = self._trie_key_prefixes[key]
+        prefixes.remove(prefix)
+        (address, prefixlen) = key
+        if prefixes:
+            # Another prefix with the same network still shares the trie node; it takes over
+            self._trie.put(address, prefixlen, self.routes[prefixes[-1]])
+        else:
+            del self._trie_key_prefixes[key]
+            self._trie.delete(address, prefixlen)
         if self.kernel is not None:
-            self.kernel.del_route(prefix)
+            self.kernel.queue_del_route(prefix)
         return True
 
+    def lookup(self, address):
+        # Longest prefix match for the given ipaddress.IPv4Address or ipaddress.IPv6Address.
+        # Returns the route which is used to forward traffic to the address, or None if there is no
+        # such route.
+        if self.address_family == constants.ADDRESS_FAMILY_IPV4:
+            assert address.version == 4
+        else:
+            assert address.version == 6
+        return self._trie.lookup(int(address))
+
     def all_routes(self):
         for _prefix, rte in self.routes.items():
             yield rte
@@ -60,3 +104,17 @@ class ForwardingTable:
 
     def nr_routes(self):
         return len(self.routes)
+
+def trie_key(prefix):
+    # The (address, prefixlen) of an IPPrefixType prefix, with the address as an unsigned integer
+    # and with the host bits cleared, as in the trie node of the prefix
+    if prefix.ipv4prefix is not None:
+        (address, prefixlen) = (prefix.ipv4prefix.address & packet_common.MAX_U32,
+                                prefix.ipv4prefix.prefixlen)
+        address_bits = 32
+    else:
+        address = int.from_bytes(prefix.ipv6prefix.address.rjust(16, b"\x00"), "big")
+        prefixlen = prefix.ipv6prefix.prefixlen
+        address_bits = 128
+    host_bits = address_bits - prefixlen
+    return ((address >> host_bits) << host_bits, prefixlen)
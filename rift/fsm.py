@@ -1,9 +1,11 @@
 import collections
+import logging
 import time
 
 import sortedcontainers
 
 import table
+import utils
 
 # TODO: Check completeness of FSM
 # TODO: Report superfluous transitions (same effect in every state)
@@ -206,15 +208,17 @@ class Fsm:
     _chained_event_queue = collections.deque()
 
     def info(self, msg, *args):
-        if self._log:
+        if self._log and self._log.isEnabledFor(logging.INFO):
             self._log.info("[%s] %s" % (self._log_id, msg), *args)
 
     def info_or_debug(self, debug, msg, *args):
         if self._log:
             if debug:
-                self._log.debug("[%s] %s" % (self._log_id, msg), *args)
+                if self._log.isEnabledFor(logging.DEBUG):
+                    self._log.debug("[%s] %s" % (self._log_id, msg), *args)
             else:
-                self._log.info("[%s] %s" % (self._log_id, msg), *args)
+                if self._log.isEnabledFor(logging.INFO):
+                    self._log.info("[%s] %s" % (self._log_id, msg), *args)
 
     def __init__(self, definition, action_handler, log, log_id):
         self._definition = definition
@@ -299,7 +303,8 @@ class Fsm:
             self._current_record.skipped = self._verbose_records_skipped
             self._verbose_records_skipped = 0
             self._records.appendleft(self._current_record)
-        self.info_or_debug(self._current_record.verbose, self._current_record.log_str())
+        self.info_or_debug(self._current_record.verbose, "%s",
+                           utils.LazyFormat(self._current_record.log_str))
         self._current_record = None
 
     def process_event(self, event, event_data):
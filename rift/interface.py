@@ -2,6 +2,7 @@
 
 import collections
 import enum
+import logging
 import random
 import socket
 
@@ -140,25 +141,30 @@ class Interface:
         self._node.regenerate_my_node_ties(interface_going_down=self)
         # Update the south prefix TIE: we may have to start or stop originating a default route
         self._node.regenerate_my_south_prefix_tie(interface_going_down=self)
+        self._node.forget_received_tides(self.name)
 
-    def send_protocol_packet(self, protocol_packet, flood):
+    def send_protocol_packet(self, protocol_packet, flood, encoded_protocol_packet=None):
+        # If the caller already has the encoded protocol packet (e.g. a TIE from the TIE-DB which
+        # was encoded when it was flooded to another neighbor) it can pass it in to avoid encoding
+        # the protocol packet again.
         if flood:
             handler = self._flood_send_handler
         else:
             handler = self._lie_send_handler
-        to_str = "{}:{}".format(handler.remote_address, handler.port)
-        protocol_packet_str = str(protocol_packet)
-        # TODO: Don't do this expensive to_str if logging is not at level debug
-        encoded_protocol_packet = packet_common.encode_protocol_packet(protocol_packet)
+        # The protocol packet and the destination are only converted to strings if the message is
+        # actually logged.
+        to_str = utils.LazyFormat("{}:{}".format, handler.remote_address, handler.port)
+        if encoded_protocol_packet is None:
+            encoded_protocol_packet = packet_common.encode_protocol_packet(protocol_packet)
         if self._tx_fail:
-            self.tx_debug("Simulated send failure %s to %s", protocol_packet_str, to_str)
+            self.tx_debug("Simulated send failure %s to %s", protocol_packet, to_str)
         else:
             try:
                 handler.send_message(encoded_protocol_packet)
             except socket.error as error:
-                self.tx_error("Error \"%s\" sending %s to %s", error, protocol_packet_str, to_str)
+                self.tx_error("Error \"%s\" sending %s to %s", error, protocol_packet, to_str)
                 return
-            self.tx_debug("Send %s to %s", protocol_packet_str, to_str)
+            self.tx_debug("Send %s to %s", protocol_packet, to_str)
 
     def action_send_lie(self):
         packet_header = encoding.ttypes.PacketHeader(
@@ -526,13 +532,16 @@ class Interface:
         verbose_events=verbose_events)
 
     def info(self, msg, *args):
-        self._log.info("[%s] %s" % (self._log_id, msg), *args)
+        if self._log.isEnabledFor(logging.INFO):
+            self._log.info("[%s] %s" % (self._log_id, msg), *args)
 
     def rx_debug(self, msg, *args):
-        self._rx_log.debug("[%s] %s" % (self._log_id, msg), *args)
+        if self._rx_log.isEnabledFor(logging.DEBUG):
+            self._rx_log.debug("[%s] %s" % (self._log_id, msg), *args)
 
     def rx_info(self, msg, *args):
-        self._rx_log.info("[%s] %s" % (self._log_id, msg), *args)
+        if self._rx_log.isEnabledFor(logging.INFO):
+            self._rx_log.info("[%s] %s" % (self._log_id, msg), *args)
 
     def rx_warning(self, msg, *args):
         self._rx_log.warning("[%s] %s" % (self._log_id, msg), *args)
@@ -541,7 +550,8 @@ class Interface:
         self._rx_log.error("[%s] %s" % (self._log_id, msg), *args)
 
     def tx_debug(self, msg, *args):
-        self._tx_log.debug("[%s] %s" % (self._log_id, msg), *args)
+        if self._tx_log.isEnabledFor(logging.DEBUG):
+            self._tx_log.debug("[%s] %s" % (self._log_id, msg), *args)
 
     def tx_error(self, msg, *args):
         self._tx_log.error("[%s] %s" % (self._log_id, msg), *args)
@@ -573,6 +583,8 @@ class Interface:
                                                       constants.DEFAULT_TIE_PORT)
         self._rx_fail = False
         self._tx_fail = False
+        self._decode_cache_hits = 0
+        self._decode_cache_misses = 0
         self._log = node.log.getChild("if")
         self.info("Create interface")
         self._rx_log = self._log.getChild("rx")
@@ -643,46 +655,63 @@ class Interface:
             return False
         return True
 
-    def receive_message_common(self, message, from_address_and_port):
+    def receive_message_common(self, message, from_address_and_port, port_name,
+                               port_content_types):
+        # Received messages are decoded in two stages. First we only decode the packet header and
+        # determine the type of the packet content. That is enough to reject messages which we are
+        # going to ignore anyway (simulated receive failures, our own looped messages, messages
+        # with a different major version, or messages which should not be received on this port)
+        # without paying the price of decoding the entire message. Only then do we decode the
+        # entire message, unless the same LIE or TIE was recently decoded and is still in the decode
+        # cache of the node.
         (address, port) = from_address_and_port
-        from_str = "{}:{}".format(address, port)
-        protocol_packet = packet_common.decode_protocol_packet(message)
-        if protocol_packet is None:
-            self.rx_error("Could not decode message received from %s", from_str)
-            return None
+        from_str = utils.LazyFormat("{}:{}".format, address, port)
         if self._rx_fail:
-            self.rx_debug("Simulated receive failure %s from %s", protocol_packet, from_str)
+            self.rx_debug("Simulated receive failure from %s", from_str)
             return None
-        if protocol_packet.header.sender == self._node.system_id:
-            self.rx_debug("Looped receive %s from %s", protocol_packet, from_str)
+        decoded_header = packet_common.decode_protocol_packet_header(message)
+        if decoded_header is None:
+            self.rx_error("Could not decode message received from %s", from_str)
             return None
-        self.rx_debug("Receive %s from %s", protocol_packet, from_str)
-        if not protocol_packet.content:
+        (packet_header, content_type) = decoded_header
+        if packet_header.sender == self._node.system_id:
+            self.rx_debug("Looped receive %s from %s", packet_header, from_str)
+            return None
+        if content_type is None:
             self.rx_warning("Received packet without content from %s", from_str)
             return None
-        if protocol_packet.header.major_version != constants.RIFT_MAJOR_VERSION:
+        if packet_header.major_version != constants.RIFT_MAJOR_VERSION:
             self.rx_error("Received different major protocol version from %s (local version %d, "
                           "remote version %d)", from_str, constants.RIFT_MAJOR_VERSION,
-                          protocol_packet.header.major_version)
+                          packet_header.major_version)
             return None
+        if content_type not in port_content_types:
+            self.rx_warning("Received %s packet on %s port (ignored)", content_type.upper(),
+                            port_name)
+            return None
+        (protocol_packet, cache_hit) = self._node.decode_cache.decode(message, content_type)
+        if cache_hit is True:
+            self._decode_cache_hits += 1
+        elif cache_hit is False:
+            self._decode_cache_misses += 1
+        if protocol_packet is None:
+            self.rx_error("Could not decode message received from %s", from_str)
+            return None
+        self.rx_debug("Receive %s from %s", protocol_packet, from_str)
         return protocol_packet
 
     def receive_lie_message(self, message, from_address_and_port):
-        protocol_packet = self.receive_message_common(message, from_address_and_port)
+        protocol_packet = self.receive_message_common(message, from_address_and_port, "LIE",
+                                                      ["lie"])
         if protocol_packet is None:
             return
         if protocol_packet.content.lie:
             event_data = (protocol_packet, from_address_and_port)
             self.fsm.push_event(self.Event.LIE_RECEIVED, event_data)
-        if protocol_packet.content.tie:
-            self.rx_warning("Received TIE packet on LIE port (ignored)")
-        if protocol_packet.content.tide:
-            self.rx_warning("Received TIDE packet on LIE port (ignored)")
-        if protocol_packet.content.tire:
-            self.rx_warning("Received TIRE packet on LIE port (ignored)")
 
     def receive_flood_message(self, message, from_address_and_port):
-        protocol_packet = self.receive_message_common(message, from_address_and_port)
+        protocol_packet = self.receive_message_common(message, from_address_and_port, "flood",
+                                                      ["tie", "tide", "tire"])
         if protocol_packet is None:
             return
         if protocol_packet.content.tie is not None:
@@ -691,8 +720,6 @@ class Interface:
             self.process_received_tide_packet(protocol_packet.content.tide)
         if protocol_packet.content.tire:
             self.process_received_tire_packet(protocol_packet.content.tire)
-        if protocol_packet.content.lie:
-            self.rx_warning("Received LIE packet on flood port (ignored)")
 
     def set_failure(self, tx_fail, rx_fail):
         self._tx_fail = tx_fail
@@ -720,7 +747,7 @@ class Interface:
             self.ack_tie(ack_tie_header)
 
     def process_received_tide_packet(self, tide_packet):
-        result = self._node.process_received_tide_packet(tide_packet)
+        result = self._node.process_received_tide_packet(tide_packet, self.name)
         (request_tie_headers, start_sending_tie_headers, stop_sending_tie_headers) = result
         for tie_header in start_sending_tie_headers:
             self.try_to_transmit_tie(tie_header)
@@ -854,15 +881,11 @@ class Interface:
         if send_now:
             db_tie = self._node.find_tie(tie_header.tieid)
             if db_tie is not None:
-                packet_header = encoding.ttypes.PacketHeader(
-                    sender=self._node.system_id,
-                    level=self._node.level_value())
-                packet_content = encoding.ttypes.PacketContent()
-                protocol_packet = encoding.ttypes.ProtocolPacket(
-                    header=packet_header,
-                    content=packet_content)
-                protocol_packet.content.tie = db_tie
-                self.send_protocol_packet(protocol_packet, flood=True)
+                self.send_tie(db_tie)
+
+    def send_tie(self, db_tie):
+        (protocol_packet, encoded_protocol_packet) = self._node.tie_protocol_packet(db_tie)
+        self.send_protocol_packet(protocol_packet, True, encoded_protocol_packet)
 
     def try_to_transmit_tie(self, tie_header):
         (filtered, reason) = self.is_flood_filtered(tie_header)
@@ -1001,18 +1024,10 @@ class Interface:
     def service_ties_queue(self, queue):
         # Note: we only look at the TIE-ID in the queue and not at the header. If we have a more
         # recent version of the TIE in the TIE-DB than the one requested, we send the one we have.
-        packet_header = encoding.ttypes.PacketHeader(
-            sender=self._node.system_id,
-            level=self._node.level_value())
-        packet_content = encoding.ttypes.PacketContent()
-        protocol_packet = encoding.ttypes.ProtocolPacket(
-            header=packet_header,
-            content=packet_content)
         for tie_id in queue.keys():
             db_tie = self._node.find_tie(tie_id)
             if db_tie is not None:
-                protocol_packet.content.tie = db_tie
-                self.send_protocol_packet(protocol_packet, flood=True)
+                self.send_tie(db_tie)
 
     def service_ties_tx(self):
         self.service_ties_queue(self._ties_tx)
@@ -1070,7 +1085,9 @@ class Interface:
             ["State", self.state_name],
             ["Received LIE Accepted or Rejected", self._lie_accept_or_reject],
             ["Received LIE Accept or Reject Reason", self._lie_accept_or_reject_rule],
-            ["Neighbor", "True" if self.neighbor else "False"]
+            ["Neighbor", "True" if self.neighbor else "False"],
+            ["Decode Cache Hits", self._decode_cache_hits],
+            ["Decode Cache Misses", self._decode_cache_misses]
         ]
 
     def cli_detailed_neighbor_attrs(self):
@@ -1,16 +1,32 @@
+import collections
 import errno
+import ipaddress
+import logging
 import socket
+import time
 
 import pyroute2
+import pyroute2.netlink
+import pyroute2.netlink.rtnl
+import pyroute2.netlink.rtnl.rtmsg
 
+import netlink_handler
 import packet_common
 import table
+import timer
 
 RTPROT_RIFT = 99
 
+# Maximum number of queued route updates programmed into the kernel in a single event-loop iteration
+MAX_ROUTE_BATCH_SIZE = 1000
+
+RT_TABLE_COMPAT = 252
+RT_SCOPE_UNIVERSE = 0
+RTN_UNICAST = 1
+
 class Kernel:
 
-    def __init__(self, table_name, log, log_id):
+    def __init__(self, table_name, log, log_id, grace_period=None):
         self._table_name = table_name
         if isinstance(table_name, int):
             self._table_nr = table_name
@@ -18,7 +34,7 @@ class Kernel:
             self._table_nr = self.table_name_to_nr(table_name)
         self._log = log
         self._log_id = log_id
-        self.debug("Create kernel using route table %s" % table_name)
+        self.debug("Create kernel using route table %s", table_name)
         try:
             self.ipr = pyroute2.IPRoute()
             self.platform_supported = True
@@ -27,9 +43,58 @@ class Kernel:
             self.ipr = None
             self.platform_supported = False
             self.warning("Kernel networking is not supported on this platform")
+        # Route updates which have not yet been programmed into the kernel, in the order in which
+        # they were queued. Indexed by prefix; the value is the Route to put or None to delete the
+        # route. Multiple updates to the same prefix are coalesced into the most recent one.
+        self._route_queue = collections.OrderedDict()
+        # A zero-interval one-shot timer which is running while there are queued route updates, so
+        # that the queue is flushed in the next iteration of the event loop, i.e. after the event
+        # (e.g. an SPF run) which queued the updates is finished.
+        self._flush_timer = None
+        self._queued_count = 0
+        self._coalesced_count = 0
+        self._max_queue_depth = 0
+        self._flush_count = 0
+        self._last_batch_size = 0
+        self._max_batch_size = 0
+        self._batched_count = 0
+        self._last_flush_latency = 0.0
+        self._max_flush_latency = 0.0
+        # Non-blocking netlink socket for programming the queued route updates. Only present if
+        # routes are actually programmed into a kernel route table.
+        if self.platform_supported and self._table_nr != -1:
+            self._netlink = netlink_handler.NetlinkHandler(self.netlink_ready, log, log_id)
+        else:
+            self._netlink = None
+        # RIFT routes which were already in the kernel route table at startup (left behind by a
+        # previous instance), indexed by destination prefix string; the value is the next-hop
+        # signature of the route (see kernel_route_signature). During the grace period, a route
+        # update which is identical to the stale route is not sent to the kernel. When the grace
+        # period expires, the stale routes which have not been updated are deleted.
+        self._stale_routes = {}
+        self._grace_period = grace_period
+        self._grace_timer = None
+        self._skipped_identical_count = 0
+        self._deleted_stale_count = 0
+        if self._netlink is not None and grace_period is not None:
+            self.load_stale_routes()
+
+    def close(self):
+        # Release the netlink sockets; the kernel object cannot be used anymore after this
+        if self._flush_timer is not None:
+            self._flush_timer.stop()
+            self._flush_timer = None
+        if self._grace_timer is not None:
+            self._grace_timer.stop()
+            self._grace_timer = None
+        if self._netlink is not None:
+            self._netlink.close()
+            self._netlink = None
+        if self.ipr is not None:
+            self.ipr.close()
 
     def debug(self, msg, *args):
-        if self._log:
+        if self._log and self._log.isEnabledFor(logging.DEBUG):
             self._log.debug("[%s] %s" % (self._log_id, msg), *args)
 
     def warning(self, msg, *args):
@@ -105,6 +170,284 @@ class Kernel:
             self.debug("Delete route to %s", prefix)
             return True
 
+    def queue_put_route(self, rte):
+        self.queue_route_update(rte.prefix, rte)
+
+    def queue_del_route(self, prefix):
+        self.queue_route_update(prefix, None)
+
+    def queue_route_update(self, prefix, rte):
+        self._queued_count += 1
+        if prefix in self._route_queue:
+            self._coalesced_count += 1
+        self._route_queue[prefix] = rte
+        self._max_queue_depth = max(self._max_queue_depth, len(self._route_queue))
+        self.start_flush_timer()
+
+    def start_flush_timer(self):
+        if self._flush_timer is None:
+            self._flush_timer = timer.Timer(
+                interval=0.0,
+                expire_function=self.flush_timer_expired,
+                periodic=False,
+                start=True)
+
+    def flush_timer_expired(self):
+        self._flush_timer = None
+        self.flush_route_queue()
+
+    def load_stale_routes(self):
+        try:
+            kernel_routes = self.ipr.get_routes(table=self._table_nr)
+        except (pyroute2.netlink.exceptions.NetlinkError, OSError) as err:
+            self.error("Error \"%s\" reading routes from kernel route table %s", err,
+                       self._table_nr)
+            return
+        for kernel_route in kernel_routes:
+            if kernel_route["proto"] != RTPROT_RIFT:
+                continue
+            if kernel_route.get_attr('RTA_TABLE') != self._table_nr:
+                continue
+            dst = self.kernel_route_dst_prefix_str(kernel_route)
+            self._stale_routes[dst] = self.kernel_route_signature(kernel_route)
+        self.debug("Found %d stale routes in kernel route table %s, grace period %s secs",
+                   len(self._stale_routes), self._table_nr, self._grace_period)
+        if self._stale_routes:
+            self._grace_timer = timer.Timer(
+                interval=self._grace_period,
+                expire_function=self.grace_timer_expired,
+                periodic=False,
+                start=True)
+
+    def grace_timer_expired(self):
+        self._grace_timer = None
+        self.delete_stale_routes()
+
+    def delete_stale_routes(self):
+        # The grace period is over: the stale routes which have not been replaced by a route
+        # computed by this instance are left-overs from the previous instance. Delete them.
+        self.debug("Delete %d stale routes", len(self._stale_routes))
+        stale_dsts = list(self._stale_routes.keys())
+        self._stale_routes = {}
+        for dst in stale_dsts:
+            prefix = packet_common.make_ip_prefix(dst)
+            # A queued update for the prefix replaces the stale route when it is sent
+            if prefix in self._route_queue:
+                continue
+            self._deleted_stale_count += 1
+            self.queue_del_route(prefix)
+
+    @staticmethod
+    def kernel_route_signature(kernel_route):
+        # A comparable representation of the next-hops of a route which was read from the kernel
+        # (see next_hops_signature)
+        oif = kernel_route.get_attr('RTA_OIF')
+        multipath = kernel_route.get_attr('RTA_MULTIPATH')
+        if oif is not None:
+            return Kernel.next_hops_signature([(oif, kernel_route.get_attr('RTA_GATEWAY'))])
+        if multipath is None:
+            return ()
+        nhops = []
+        for path in multipath:
+            gateway = None
+            for (attr_name, attr_value) in path.get("attrs", []):
+                if attr_name == "RTA_GATEWAY":
+                    gateway = attr_value
+            nhops.append((path.get("oif"), gateway))
+        return Kernel.next_hops_signature(nhops)
+
+    @staticmethod
+    def next_hops_signature(nhops):
+        # A sorted tuple of (interface index, gateway string or None) tuples. The gateway may be
+        # None for some next-hops and a string for others, so None sorts as the empty string.
+        return tuple(sorted(nhops, key=lambda nhop: (nhop[0] or 0, nhop[1] or "")))
+
+    def netlink_ready(self):
+        # The netlink socket has processed ACKs and can accept more requests
+        if self._route_queue:
+            self.start_flush_timer()
+
+    def flush_route_queue(self):
+        # Program (at most MAX_ROUTE_BATCH_SIZE of) the queued route updates into the kernel. The
+        # requests are written to the non-blocking netlink socket without waiting for the ACKs; if
+        # the socket has too many outstanding requests, we continue when the ACKs have arrived. If
+        # more updates remain, they are programmed in the next iteration of the event loop so that
+        # protocol processing is not blocked while a large number of routes is programmed.
+        if self._netlink is not None:
+            self._netlink.transmit_retries()
+        if not self._route_queue:
+            return
+        start_time = time.time()
+        batch_size = 0
+        while self._route_queue and batch_size < MAX_ROUTE_BATCH_SIZE:
+            if self._netlink is None:
+                (prefix, rte) = self._route_queue.popitem(last=False)
+                if rte is None:
+                    self.del_route(prefix)
+                else:
+                    self.put_route(rte)
+            elif self._netlink.has_capacity():
+                (prefix, rte) = self._route_queue.popitem(last=False)
+                self.send_route_request(prefix, rte)
+            else:
+                break
+            batch_size += 1
+        if batch_size == 0:
+            return
+        latency = time.time() - start_time
+        self._flush_count += 1
+        self._last_batch_size = batch_size
+        self._max_batch_size = max(self._max_batch_size, batch_size)
+        self._batched_count += batch_size
+        self._last_flush_latency = latency
+        self._max_flush_latency = max(self._max_flush_latency, latency)
+        self.debug("Flushed %d route updates in %.6f secs, %d remaining", batch_size, latency,
+                   len(self._route_queue))
+        if self._route_queue and (self._netlink is None or self._netlink.has_capacity()):
+            self.start_flush_timer()
+
+    def send_route_request(self, prefix, rte):
+        # Send a non-blocking netlink request which replaces the route in the kernel (or deletes the
+        # route to the prefix if rte is None)
+        dst = str(prefix)
+        network = ipaddress.ip_network(dst)
+        if network.version == 4:
+            family = socket.AF_INET
+        else:
+            family = socket.AF_INET6
+        msg = pyroute2.netlink.rtnl.rtmsg.rtmsg()
+        msg['family'] = family
+        msg['dst_len'] = network.prefixlen
+        msg['table'] = self._table_nr if self._table_nr < 256 else RT_TABLE_COMPAT
+        msg['proto'] = RTPROT_RIFT
+        msg['scope'] = RT_SCOPE_UNIVERSE
+        msg['type'] = RTN_UNICAST
+        msg['attrs'] = [('RTA_TABLE', self._table_nr),
+                        ('RTA_DST', str(network.network_address))]
+        nhops = None
+        if rte is not None:
+            nhops = self.route_kernel_next_hops(rte, dst)
+        if dst in self._stale_routes:
+            stale_signature = self._stale_routes.pop(dst)
+            if nhops is not None and self.next_hops_signature(nhops) == stale_signature:
+                # The route left behind by the previous instance is identical; keep it
+                self._skipped_identical_count += 1
+                self.debug("Skip replacing identical stale route to %s", dst)
+                return
+        if nhops is None:
+            msg['header']['type'] = pyroute2.netlink.rtnl.RTM_DELROUTE
+            msg['header']['flags'] = pyroute2.netlink.NLM_F_REQUEST | pyroute2.netlink.NLM_F_ACK
+            description = "delete route to {}".format(dst)
+            # It is not an error to delete a non-existing route
+            ignored_errors = (errno.ESRCH,)
+        else:
+            msg['attrs'].extend(self.next_hop_attrs(nhops))
+            msg['header']['type'] = pyroute2.netlink.rtnl.RTM_NEWROUTE
+            msg['header']['flags'] = (pyroute2.netlink.NLM_F_REQUEST |
+                                      pyroute2.netlink.NLM_F_ACK |
+                                      pyroute2.netlink.NLM_F_CREATE |
+                                      pyroute2.netlink.NLM_F_REPLACE)
+            description = "replace route to {}".format(dst)
+            ignored_errors = ()
+        msg.encode()
+        self.debug("Send request to %s", description)
+        self._netlink.send(msg.data, dst, description, ignored_errors)
+
+    def route_kernel_next_hops(self, rte, dst):
+        # Return the list of (interface index, gateway string or None) tuples for the next-hops of
+        # the route, or None if none of the next-hops is usable (in which case the route must be
+        # deleted from the kernel). The interface index is looked up with an ioctl instead of a
+        # (blocking) netlink request.
+        nhops = []
+        for nhop in rte.next_hops:
+            try:
+                oif = socket.if_nametoindex(nhop.interface)
+            except (OSError, TypeError):
+                self.error("Unknown interface \"%s\" replacing route to %s", nhop.interface, dst)
+                continue
+            if nhop.address is None:
+                nhops.append((oif, None))
+            else:
+                nhops.append((oif, str(nhop.address)))
+        if nhops == [] and rte.next_hops != []:
+            return None
+        return nhops
+
+    @staticmethod
+    def next_hop_attrs(nhops):
+        # Return the netlink attributes for the given (interface index, gateway) next-hops
+        if nhops == []:
+            return []
+        if len(nhops) == 1:
+            (oif, gateway) = nhops[0]
+            attrs = [('RTA_OIF', oif)]
+            if gateway is not None:
+                attrs.append(('RTA_GATEWAY', gateway))
+            return attrs
+        multipath = []
+        for (oif, gateway) in nhops:
+            if gateway is None:
+                multipath.append({'oif': oif, 'hops': 1})
+            else:
+                multipath.append({'oif': oif, 'hops': 1, 'attrs': [('RTA_GATEWAY', gateway)]})
+        return [('RTA_MULTIPATH', multipath)]
+
+    def route_queue_depth(self):
+        return len(self._route_queue)
+
+    def cli_route_queue_attributes(self):
+        if self._flush_count == 0:
+            average_batch_size = 0.0
+        else:
+            average_batch_size = self._batched_count / self._flush_count
+        return [
+            ["Queue Depth", len(self._route_queue)],
+            ["Maximum Queue Depth", self._max_queue_depth],
+            ["Queued Updates", self._queued_count],
+            ["Coalesced Updates", self._coalesced_count],
+            ["Flushes", self._flush_count],
+            ["Batch Size Limit", MAX_ROUTE_BATCH_SIZE],
+            ["Last Batch Size", self._last_batch_size],
+            ["Largest Batch Size", self._max_batch_size],
+            ["Average Batch Size", "{:.1f}".format(average_batch_size)],
+            ["Last Flush Latency", "{:.6f} secs".format(self._last_flush_latency)],
+            ["Maximum Flush Latency", "{:.6f} secs".format(self._max_flush_latency)],
+        ]
+
+    def cli_attributes(self):
+        if self._grace_period is None:
+            grace_period_str = "None"
+        else:
+            grace_period_str = "{} secs".format(self._grace_period)
+        if self._grace_timer is None:
+            grace_timer_str = "Stopped"
+        else:
+            grace_timer_str = self._grace_timer.remaining_time_str()
+        return [
+            ["Route Table", self.table_nr_to_name(self._table_nr)],
+            ["Platform Supported", self.platform_supported],
+            ["Stale Route Grace Period", grace_period_str],
+            ["Stale Route Grace Timer", grace_timer_str],
+            ["Stale Routes", len(self._stale_routes)],
+            ["Kept Identical Stale Routes", self._skipped_identical_count],
+            ["Deleted Stale Routes", self._deleted_stale_count],
+        ]
+
+    def command_show_kernel(self, cli_session):
+        cli_session.print("Kernel:")
+        tab = table.Table()
+        tab.add_rows(self.cli_attributes())
+        cli_session.print(tab.to_string())
+        cli_session.print("Kernel Route Queue:")
+        tab = table.Table()
+        tab.add_rows(self.cli_route_queue_attributes())
+        cli_session.print(tab.to_string())
+        if self._netlink is not None:
+            cli_session.print("Kernel Netlink Requests:")
+            tab = table.Table()
+            tab.add_rows(self._netlink.cli_attributes())
+            cli_session.print(tab.to_string())
+
     def nhop_to_kernel_args(self, nhop, dst):
         link = self.ipr.link_lookup(ifname=nhop.interface)
         if link == []:
@@ -0,0 +1,209 @@
+import collections
+import errno
+import logging
+import socket
+import struct
+
+import scheduler
+
+# Netlink message header (struct nlmsghdr): length, type, flags, sequence number, port-id
+NLMSGHDR_FORMAT = "=IHHII"
+NLMSGHDR_SIZE = struct.calcsize(NLMSGHDR_FORMAT)
+NLMSGHDR_SEQ_OFFSET = 8
+NLMSG_ERROR = 2
+
+class NetlinkRequest:
+
+    __slots__ = ['data', 'key', 'description', 'ignored_errors', 'retries']
+
+    def __init__(self, data, key, description, ignored_errors):
+        self.data = bytearray(data)
+        # Requests with the same key (e.g. the same destination prefix) supersede each other
+        self.key = key
+        self.description = description
+        # Errors which are not reported and not retried (e.g. deleting a non-existing route)
+        self.ignored_errors = ignored_errors
+        self.retries = 0
+
+class NetlinkHandler:
+
+    # A non-blocking NETLINK_ROUTE socket which is registered with the scheduler. Requests are
+    # written to the socket without waiting for the acknowledgement (ACK) from the kernel. Each
+    # request is assigned a sequence number, and the ACKs and errors are processed when the socket
+    # becomes readable. Failed requests are retried up to MAX_RETRIES times, unless a more recent
+    # request with the same key has been sent in the meantime.
+    #
+    # The number of outstanding (not yet acknowledged) requests is limited to MAX_OUTSTANDING: the
+    # kernel processes a request as soon as it is written, but drops the ACK if our receive buffer
+    # is full. The owner checks has_capacity() before sending and is notified through the
+    # ready_callback when ACKs have been processed and there is capacity again.
+    #
+    # If the socket itself is full (the send fails with EAGAIN or ENOBUFS), the request is queued
+    # and sent again after the next batch of ACKs has been processed. This is not a failure of the
+    # request, so it is not counted as a retry.
+
+    MAX_OUTSTANDING = 64
+    MAX_RETRIES = 3
+    MAXIMUM_MESSAGE_SIZE = 65535
+
+    def __init__(self, ready_callback, log, log_id):
+        self._ready_callback = ready_callback
+        self._log = log
+        self._log_id = log_id
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        self._sock.bind((0, 0))
+        self._sock.setblocking(False)
+        self._next_seq = 1
+        self._outstanding = {}            # Outstanding requests indexed by sequence number
+        self._latest_by_key = {}          # Most recently sent request for each key
+        self._retry_queue = collections.deque()
+        self._sent_count = 0
+        self._ack_count = 0
+        self._ignored_error_count = 0
+        self._retry_count = 0
+        self._blocked_count = 0
+        self._failed_count = 0
+        self._max_outstanding = 0
+        scheduler.SCHEDULER.register_handler(self, True, False)
+
+    def close(self):
+        scheduler.SCHEDULER.unregister_handler(self)
+        self._sock.close()
+
+    def debug(self, msg, *args):
+        if self._log and self._log.isEnabledFor(logging.DEBUG):
+            self._log.debug("[%s] %s" % (self._log_id, msg), *args)
+
+    def warning(self, msg, *args):
+        if self._log:
+            self._log.warning("[%s] %s" % (self._log_id, msg), *args)
+
+    def error(self, msg, *args):
+        if self._log:
+            self._log.error("[%s] %s" % (self._log_id, msg), *args)
+
+    def rx_fd(self):
+        return self._sock.fileno()
+
+    def has_capacity(self):
+        return len(self._outstanding) + len(self._retry_queue) < self.MAX_OUTSTANDING
+
+    def nr_outstanding(self):
+        return len(self._outstanding)
+
+    def send(self, data, key, description, ignored_errors=()):
+        # Send an encoded netlink request; the sequence number in the header is filled in here.
+        request = NetlinkRequest(data, key, description, ignored_errors)
+        self._latest_by_key[key] = request
+        if not self.transmit(request):
+            self._retry_queue.append(request)
+
+    def transmit(self, request):
+        # Returns False if the socket is full and the request must be sent again later
+        seq = self._next_seq
+        self._next_seq = (self._next_seq % 0xffffffff) + 1
+        struct.pack_into("=I", request.data, NLMSGHDR_SEQ_OFFSET, seq)
+        try:
+            self._sock.send(request.data)
+        except OSError as err:
+            if err.errno in (errno.EAGAIN, errno.ENOBUFS):
+                self._blocked_count += 1
+                return False
+            self.request_failed(request, err.errno)
+            return True
+        self._sent_count += 1
+        self._outstanding[seq] = request
+        self._max_outstanding = max(self._max_outstanding, len(self._outstanding))
+        return True
+
+    def transmit_retries(self):
+        while self._retry_queue and len(self._outstanding) < self.MAX_OUTSTANDING:
+            request = self._retry_queue.popleft()
+            if self._latest_by_key.get(request.key) is not request:
+                # Superseded by a more recent request for the same key while it was queued
+                continue
+            if not self.transmit(request):
+                self._retry_queue.appendleft(request)
+                break
+
+    def request_done(self, request):
+        if self._latest_by_key.get(request.key) is request:
+            del self._latest_by_key[request.key]
+
+    def request_failed(self, request, error):
+        if error in request.ignored_errors:
+            self._ignored_error_count += 1
+            self.request_done(request)
+            return
+        if self._latest_by_key.get(request.key) is not request:
+            # A more recent request for the same key has been sent; retrying this one could undo it
+            self.debug("Not retrying superseded request %s (error %s)", request.description,
+                       errno.errorcode.get(error, error))
+            return
+        if request.retries < self.MAX_RETRIES:
+            request.retries += 1
+            self._retry_count += 1
+            self.warning("Netlink error %s for %s, retry %d", errno.errorcode.get(error, error),
+                         request.description, request.retries)
+            self._retry_queue.append(request)
+        else:
+            self._failed_count += 1
+            self.error("Netlink error %s for %s, giving up after %d retries",
+                       errno.errorcode.get(error, error), request.description, request.retries)
+            self.request_done(request)
+
+    def ready_to_read(self):
+        while True:
+            try:
+                message = self._sock.recv(self.MAXIMUM_MESSAGE_SIZE)
+            except BlockingIOError:
+                break
+            except OSError as err:
+                if err.errno != errno.ENOBUFS:
+                    self.error("Netlink receive error %s", err)
+                    break
+                # Our receive buffer overflowed and ACKs were lost: resend all outstanding requests
+                self.warning("Netlink receive buffer overflow, resending %d requests",
+                             len(self._outstanding))
+                outstanding = list(self._outstanding.values())
+                self._outstanding.clear()
+                for request in outstanding:
+                    self.request_failed(request, errno.ENOBUFS)
+                continue
+            self.process_message(message)
+        self.transmit_retries()
+        if self.has_capacity() and self._ready_callback is not None:
+            self._ready_callback()
+
+    def process_message(self, message):
+        offset = 0
+        while offset + NLMSGHDR_SIZE <= len(message):
+            (length, msg_type, _flags, seq, _port_id) = struct.unpack_from(NLMSGHDR_FORMAT,
+                                                                          message, offset)
+            if length < NLMSGHDR_SIZE:
+                break
+            if msg_type == NLMSG_ERROR:
+                # struct nlmsgerr starts with a negative errno, or zero for an ACK
+                error = -struct.unpack_from("=i", message, offset + NLMSGHDR_SIZE)[0]
+                request = self._outstanding.pop(seq, None)
+                if request is not None:
+                    if error == 0:
+                        self._ack_count += 1
+                        self.request_done(request)
+                    else:
+                        self.request_failed(request, error)
+            offset += (length + 3) & ~3
+
+    def cli_attributes(self):
+        return [
+            ["Outstanding Requests", len(self._outstanding)],
+            ["Maximum Outstanding Requests", self._max_outstanding],
+            ["Outstanding Requests Limit", self.MAX_OUTSTANDING],
+            ["Queued Retries", len(self._retry_queue)],
+            ["Sent Requests", self._sent_count],
+            ["Acknowledged Requests", self._ack_count],
+            ["Ignored Errors", self._ignored_error_count],
+            ["Retries", self._retry_count],
+            ["Blocked Sends", self._blocked_count],
+            ["Failed Requests", self._failed_count],
+        ]
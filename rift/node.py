@@ -1,18 +1,22 @@
 # pylint: disable=too-many-lines
 
+import bisect
 import collections
 import copy
 import enum
+import heapq
 import logging
+import math
 import os
 import socket
+import time
 import uuid
 
-import heapdict
 import sortedcontainers
 
 import common.constants
 import constants
+import decode_cache
 import encoding.ttypes
 import fib
 import fsm
@@ -23,7 +27,9 @@ import offer
 import packet_common
 import rib
 import route
+import spf_csr
 import spf_dest
+import spf_graph
 import table
 import timer
 import utils
@@ -32,12 +38,12 @@ MY_TIE_NR = 1
 
 FLUSH_LIFETIME = 60
 
-# TODO: We currently only store the decoded TIE messages.
-# Also store the encoded TIE messages for the following reasons:
-# - Encode only once, instead of each time the message is sent
-# - Ability to flood the message immediately before it is decoded
+# TODO: We store the decoded TIE messages in the TIE-DB, and we cache the encoded TIE protocol
+# packet that we flood (see Node.tie_protocol_packet) so that it is encoded only once instead of
+# each time the message is sent. We don't (yet) have the ability to flood a received message
+# immediately before it is decoded.
 # Note: the encoded TIE protocol packet that we send is different from the encoded TIE protocol
-# packet that we send (specifically, the content is the same but the header reflect us as the
+# packet that we receive (specifically, the content is the same but the header reflect us as the
 # sender)
 
 # TODO: Make static method of Node
@@ -78,6 +84,11 @@ class Node:
 
     SEND_TIDES_INTERVAL = 2.0
 
+    # Maximum time that an encoded TIDE packet is re-used. The remaining lifetimes in the re-used
+    # TIDE are not updated (the remaining lifetimes in a TIDE that is re-sent to a neighbor can be
+    # up to twice this old), so this must be well below common.constants.lifetime_diff2ignore.
+    TIDE_REFRESH_INTERVAL = 60.0
+
     # TODO: Use constant from Thrift file (it is currently not there, but Tony said he added it)
     # Don't use the actual lowest value 0 (which is enum value Illegal) for direction or tietype,
     # but value 1 (direction South) or value 2 (tietype TieTypeNode). Juniper RIFT doesn't accept
@@ -95,7 +106,20 @@ class Node:
         tietype=common.ttypes.TIETypeType.KeyValueTIEType,
         tie_nr=packet_common.MAX_U32)
 
-    MIN_SPF_INTERVAL = 1.0
+    # Default SPF backoff parameters (in seconds). The first trigger after a quiet period runs SPF
+    # after the initial delay. Subsequent triggers are deferred until the secondary wait after the
+    # previous run has passed; the wait doubles for each deferred run, up to the maximum wait. The
+    # wait is reset to the secondary wait when there are no triggers for the quiet period. The
+    # defaults run the SPF at most once per second without increasing the wait.
+    DEFAULT_SPF_INITIAL_DELAY = 0.0
+    DEFAULT_SPF_SECONDARY_WAIT = 1.0
+    DEFAULT_SPF_MAX_WAIT = 1.0
+    DEFAULT_SPF_QUIET_PERIOD = 10.0
+
+    # When the node starts, RIFT routes which were left in the kernel route table by a previous
+    # instance are kept for the grace period (and only replaced if they differ from the computed
+    # routes); the ones which are not replaced during the grace period are deleted.
+    DEFAULT_KERNEL_ROUTE_GRACE_PERIOD = 30.0
 
     SPF_TRIGGER_HISTORY_LENGTH = 10
 
@@ -280,6 +304,7 @@ class Node:
         self._leaf_only = leaf_only
         self.leaf_2_leaf = leaf_2_leaf
         self._top_of_fabric_flag = top_of_fabric_flag
+        self.tie_db_changed()
 
     def action_purge_offers(self):
         for purged_offer in self._rx_offers.values():
@@ -288,12 +313,15 @@ class Node:
                 purged_offer.removed_reason = "Purged"
 
     def action_update_all_lie_fsms(self):
+        old_derived_level = self._derived_level
         if self._highest_available_level is None:
             self._derived_level = None
         elif self._highest_available_level > 0:
             self._derived_level = self._highest_available_level - 1
         else:
             self._derived_level = 0
+        if self._derived_level != old_derived_level:
+            self.tie_db_changed()
 
     def any_southbound_adjacencies(self):
         # We define a southbound adjacency as any adjacency between this node and a node that has
@@ -399,10 +427,13 @@ class Node:
                 self._kernel_route_table = self._node_nr
             else:
                 self._kernel_route_table = "none"
+        self._kernel_route_grace_period = self.get_config_attribute(
+            "kernel_route_grace_period", self.DEFAULT_KERNEL_ROUTE_GRACE_PERIOD)
         self.kernel = kernel.Kernel(
             self._kernel_route_table,
             self._kernel_log,
-            self.log_id)
+            self.log_id,
+            self._kernel_route_grace_period)
         self.log.info("[%s] Create node", self.log_id)
         self._configured_level_symbol = self.get_config_attribute('level', 'undefined')
         parse_result = self.parse_level_symbol(self._configured_level_symbol)
@@ -446,16 +477,72 @@ class Node:
         self._originating_default = False
         self._my_south_prefix_tie = None
         self.ties = sortedcontainers.SortedDict()  # TIEPacket objects indexed by TIEID
-        self._last_received_tide_end = self.MIN_TIE_ID
+        # Secondary index on the TIE-DB: TIEPacket objects indexed by (direction, originator, tie
+        # type) and then by tie_nr, so that SPF can find the TIEs of a node without a range lookup
+        self._ties_by_originator = {}
+        # The graph of nodes and bi-directional adjacencies for SPF, derived from the node TIEs
+        self._spf_graph = spf_graph.SPFGraph(self.node_ties, self.spf_use_tie_direction)
+        self._tie_expiry_times = {}      # Monotonic clock time when TIE expires indexed by TIEID
+        self._tie_expiry_heap = []       # Heap of (expiry time, TIEID), may contain stale entries
+        self._tie_expiry_timer = None    # One-shot timer for the earliest expiry time in the heap
+        self._tie_expiry_timer_time = None
+        self._tie_protocol_packets = {}  # Cached (tie, level, lifetime, packet, encoded) by TIEID
+        self.decode_cache = decode_cache.DecodeCache()
+        self._last_received_tide_end = {}        # Indexed by interface name
+        self._tie_db_generation = 0              # Incremented whenever the TIE-DB changes
+        self._tide_packets = {}                  # Cached (packet, encoded, time) indexed by range
+        self._tide_tie_headers_by_class = {}     # Valid for generation _tide_tie_headers_generation
+        self._tide_tie_headers_generation = None
+        self._interface_tides = {}               # Last sent TIDEs indexed by interface name
         self._defer_spf_timer = None
+        self._spf_initial_delay = self.get_config_attribute('spf_initial_delay',
+                                                            self.DEFAULT_SPF_INITIAL_DELAY)
+        self._spf_secondary_wait = self.get_config_attribute('spf_secondary_wait',
+                                                             self.DEFAULT_SPF_SECONDARY_WAIT)
+        self._spf_max_wait = max(self.get_config_attribute('spf_max_wait',
+                                                           self.DEFAULT_SPF_MAX_WAIT),
+                                 self._spf_secondary_wait)
+        self._spf_quiet_period = self.get_config_attribute('spf_quiet_period',
+                                                           self.DEFAULT_SPF_QUIET_PERIOD)
+        self._spf_backoff_wait = self._spf_secondary_wait   # Current wait after an SPF run
+        self._spf_in_initial_delay = False       # Is the defer timer running the initial delay?
+        self._spf_last_trigger_time = None
         self._spf_triggers_count = 0
         self._spf_triggers_deferred_count = 0
         self._spf_deferred_trigger_pending = False
         self._spf_runs_count = 0
-        self._spf_trigger_history = collections.deque([], self.SPF_TRIGGER_HISTORY_LENGTH)
+        self._spf_full_runs_count = 0
+        self._spf_partial_runs_count = 0
+        self._spf_direction_runs_count = {constants.DIR_SOUTH: 0, constants.DIR_NORTH: 0}
+        # For each SPF direction: a full SPF run is needed unless only prefix TIEs changed since
+        # the last SPF run; in that case only the prefixes of the originators of the changed prefix
+        # TIEs are recomputed. If nothing changed that affects the direction, the SPF for that
+        # direction is not run at all.
+        self._spf_full_run_needed = {constants.DIR_SOUTH: True, constants.DIR_NORTH: True}
+        self._spf_changed_prefix_originators = {constants.DIR_SOUTH: set(),
+                                                constants.DIR_NORTH: set()}
+        self._spf_trigger_history = {
+            constants.DIR_SOUTH: collections.deque([], self.SPF_TRIGGER_HISTORY_LENGTH),
+            constants.DIR_NORTH: collections.deque([], self.SPF_TRIGGER_HISTORY_LENGTH)
+        }
         self._spf_destinations = {}
         self._spf_destinations[constants.DIR_SOUTH] = {}
         self._spf_destinations[constants.DIR_NORTH] = {}
+        # For each SPF direction, the nodes whose prefixes were considered by the last full SPF run
+        # (index in the order in which they were visited, by system-id), the prefixes of each of
+        # those nodes (set of prefixes by system-id), and the nodes that advertise each prefix (set
+        # of system-ids by prefix)
+        self._spf_originator_order = {constants.DIR_SOUTH: {}, constants.DIR_NORTH: {}}
+        self._spf_originator_prefixes = {constants.DIR_SOUTH: {}, constants.DIR_NORTH: {}}
+        self._spf_prefix_originators = {constants.DIR_SOUTH: {}, constants.DIR_NORTH: {}}
+        # For each SPF direction, the next-hops of the routes that SPF installed in the RIB (list of
+        # next-hops by prefix), so that SPF only needs to install the differences in the RIB
+        self._spf_rib_next_hops = {constants.DIR_SOUTH: {}, constants.DIR_NORTH: {}}
+        # The SPF engine: "heap" (Dijkstra over the SPF graph with a heapq priority queue) or "csr"
+        # (Dijkstra over an array-backed compressed sparse row snapshot of the SPF graph, for very
+        # large topologies). The CSR snapshots are cached per SPF direction.
+        self._spf_engine = self.get_config_attribute('spf_engine', 'heap')
+        self._spf_csr_graphs = {constants.DIR_SOUTH: None, constants.DIR_NORTH: None}
         self._ipv4_fib = fib.ForwardingTable(
             constants.ADDRESS_FAMILY_IPV4,
             self.kernel,
@@ -480,11 +567,6 @@ class Node:
             self.regenerate_my_node_ties()
             self.regenerate_my_north_prefix_tie()
             self.regenerate_my_south_prefix_tie()
-        self._age_ties_timer = timer.Timer(
-            interval=1.0,
-            expire_function=self.age_ties,
-            periodic=True,
-            start=True)
         self.fsm = fsm.Fsm(
             definition=self.fsm_definition,
             action_handler=self,
@@ -647,11 +729,16 @@ class Node:
             ["LIE Send Interval", "{} secs".format(self.lie_send_interval_secs)],
             ["Receive TIE Port", self.rx_tie_port],
             ["Kernel Route Table", self._kernel_route_table],
+            ["SPF Engine", self._spf_engine],
         ]
 
     def cli_statistics_attributes(self):
         return [
             ["SPF Runs", self._spf_runs_count],
+            ["SPF Full Runs", self._spf_full_runs_count],
+            ["SPF Partial Runs", self._spf_partial_runs_count],
+            ["South SPF Runs", self._spf_direction_runs_count[constants.DIR_SOUTH]],
+            ["North SPF Runs", self._spf_direction_runs_count[constants.DIR_NORTH]],
             ["SPF Deferrals", self._spf_triggers_deferred_count]
         ]
 
@@ -857,33 +944,176 @@ class Node:
                 self.remove_tie_from_db(node_tie.header)
                 self.my_node_ties[direction] = None
 
+    def tie_db_changed(self):
+        # Must be called whenever a TIE is added to, removed from, or changed in the TIE-DB (other
+        # than the remaining lifetime), or whenever the level of this node changes. Anything
+        # derived from the TIE-DB which is cached along with the generation is then recomputed.
+        self._tie_db_generation += 1
+
     def send_tides(self):
-        # The current implementation prepares, encodes, and sends a unique TIDE packet for each
-        # individual neighbor. We do NOT (yet) have any optimization that attempts to prepare and
-        # encode a TIDE only once in total or once per direction (N, S, EW). See the comment in the
-        # function is_flood_allowed for a more detailed discussion on why not.
+        # The TIE headers to report in the TIDE packets are decided only once for all neighbors in
+        # the same flooding equivalence class (see tide_tie_headers_for_neighbor). The TIDE packet
+        # for each range of TIE headers is encoded only once and re-used for subsequent rounds and
+        # for other neighbors (see tide_protocol_packets). Forget the TIDE packets which are too
+        # old to be re-used.
         for intf in self._interfaces_by_name.values():
             self.send_tides_on_interface(intf)
+        now = time.monotonic()
+        for (key, (_, _, encode_time)) in list(self._tide_packets.items()):
+            if now - encode_time >= self.TIDE_REFRESH_INTERVAL:
+                del self._tide_packets[key]
 
     def send_tides_on_interface(self, intf):
         if intf.fsm.state != interface.Interface.State.THREE_WAY:
+            self._interface_tides.pop(intf.name, None)
             return
-        tide_packet = self.generate_tide_packet(
-            neighbor_direction=intf.neighbor_direction(),
-            neighbor_system_id=intf.neighbor.system_id,
-            neighbor_level=intf.neighbor.level,
-            neighbor_is_top_of_fabric=intf.neighbor.top_of_fabric(),
-            my_level=self.level_value(),
-            i_am_top_of_fabric=self.top_of_fabric())
-        self.debug("Regenerated TIDE for neighbor %s: %s", intf.neighbor.system_id, tide_packet)
-        packet_content = encoding.ttypes.PacketContent(tide=tide_packet)
-        packet_header = encoding.ttypes.PacketHeader(
-            sender=self.system_id,
-            level=self.level_value())
-        protocol_packet = encoding.ttypes.ProtocolPacket(
-            header=packet_header,
-            content=packet_content)
-        intf.send_protocol_packet(protocol_packet, flood=True)
+        # If the TIE-DB did not change, and the neighbor did not change, since we last sent TIDEs
+        # on this interface, then send the same TIDEs again (unless they are too old).
+        now = time.monotonic()
+        neighbor_key = (intf.neighbor_direction(), intf.neighbor.system_id, intf.neighbor.level,
+                        intf.neighbor.top_of_fabric(), intf.get_mtu())
+        interface_tides = self._interface_tides.get(intf.name)
+        if interface_tides is not None:
+            (tides_neighbor_key, tides_generation, tides_time, tide_protocol_packets) = \
+                interface_tides
+            if (tides_neighbor_key != neighbor_key or
+                    tides_generation != self._tie_db_generation or
+                    now - tides_time >= self.TIDE_REFRESH_INTERVAL):
+                interface_tides = None
+        if interface_tides is None:
+            if self._tide_tie_headers_generation != self._tie_db_generation:
+                self._tide_tie_headers_by_class = {}
+                self._tide_tie_headers_generation = self._tie_db_generation
+            tie_headers = self.tide_tie_headers_for_neighbor(
+                neighbor_direction=intf.neighbor_direction(),
+                neighbor_system_id=intf.neighbor.system_id,
+                neighbor_level=intf.neighbor.level,
+                neighbor_is_top_of_fabric=intf.neighbor.top_of_fabric(),
+                tie_headers_by_class=self._tide_tie_headers_by_class)
+            max_size = packet_common.tide_headers_max_size(intf.get_mtu())
+            tide_protocol_packets = self.tide_protocol_packets(tie_headers, max_size)
+            self.debug("Regenerated %d TIDEs for neighbor %s", len(tide_protocol_packets),
+                       intf.neighbor.system_id)
+            self._interface_tides[intf.name] = (neighbor_key, self._tie_db_generation, now,
+                                                tide_protocol_packets)
+        for (protocol_packet, encoded_protocol_packet) in tide_protocol_packets:
+            intf.send_protocol_packet(protocol_packet, flood=True,
+                                      encoded_protocol_packet=encoded_protocol_packet)
+
+    def tide_tie_headers_for_neighbor(self, neighbor_direction, neighbor_system_id, neighbor_level,
+                                      neighbor_is_top_of_fabric, tie_headers_by_class=None):
+        # Return the sorted list of TIE headers that go into the TIDE packets for a neighbor.
+        #
+        # As explained in is_flood_allowed, only the flooding scope of the non-node S-TIEs that are
+        # originated by the neighbor itself depends on the system ID of the neighbor. All neighbors
+        # with the same direction, level, and top-of-fabric flag (and hence the same flooding
+        # scope for all other TIEs) form a flooding equivalence class. For each class, we decide
+        # only once which TIE headers go into the TIDE (using no neighbor system ID at all). Then,
+        # for each neighbor, we only decide again for the S-TIEs originated by that neighbor, and
+        # splice the result into the list for the class. If the caller passes the same
+        # tie_headers_by_class dict for multiple neighbors, the list for each class is re-used.
+        my_level = self.level_value()
+        i_am_top_of_fabric = self.top_of_fabric()
+        class_key = (neighbor_direction, neighbor_level, neighbor_is_top_of_fabric, my_level,
+                     i_am_top_of_fabric)
+        if tie_headers_by_class is None:
+            tie_headers_by_class = {}
+        if class_key in tie_headers_by_class:
+            (class_tie_headers, class_tie_ids) = tie_headers_by_class[class_key]
+        else:
+            class_tie_headers = self.generate_tide_tie_headers(
+                neighbor_direction, None, neighbor_level, neighbor_is_top_of_fabric, my_level,
+                i_am_top_of_fabric)
+            class_tie_ids = [tie_header.tieid for tie_header in class_tie_headers]
+            tie_headers_by_class[class_key] = (class_tie_headers, class_tie_ids)
+        return self.splice_neighbor_tide_tie_headers(class_tie_headers, class_tie_ids,
+                                                     neighbor_direction, neighbor_system_id,
+                                                     neighbor_level, neighbor_is_top_of_fabric)
+
+    def splice_neighbor_tide_tie_headers(self, class_tie_headers, class_tie_ids,
+                                         neighbor_direction, neighbor_system_id, neighbor_level,
+                                         neighbor_is_top_of_fabric):
+        # Replace the TIE headers for the S-TIEs originated by the neighbor in the list of TIE
+        # headers for the flooding equivalence class of the neighbor (see
+        # tide_tie_headers_for_neighbor). The list for the class is not modified.
+        neighbor_start_id = packet_common.make_tie_id(
+            constants.DIR_SOUTH, neighbor_system_id, common.ttypes.TIETypeType.Illegal, 0)
+        neighbor_end_id = packet_common.make_tie_id(
+            constants.DIR_SOUTH, neighbor_system_id, common.ttypes.TIETypeType.TIETypeMaxValue,
+            packet_common.MAX_U32)
+        neighbor_ties = [self.ties[tie_id]
+                         for tie_id in self.ties.irange(neighbor_start_id, neighbor_end_id)]
+        first = bisect.bisect_left(class_tie_ids, neighbor_start_id)
+        last = bisect.bisect_right(class_tie_ids, neighbor_end_id)
+        if not neighbor_ties and first == last:
+            return class_tie_headers
+        neighbor_tie_headers = self.generate_tide_tie_headers(
+            neighbor_direction, neighbor_system_id, neighbor_level, neighbor_is_top_of_fabric,
+            self.level_value(), self.top_of_fabric(), neighbor_ties)
+        return class_tie_headers[:first] + neighbor_tie_headers + class_tie_headers[last:]
+
+    def tide_protocol_packets(self, tie_headers, max_size):
+        # pylint:disable=too-many-locals
+        #
+        # Split the sorted list of TIE headers into consecutive ranges which each fit into a TIDE
+        # packet (the total encoded size of the TIE headers in each range is at most max_size) and
+        # return a list of (protocol_packet, encoded_protocol_packet) with one TIDE per range.
+        #
+        # The first TIDE starts at MIN_TIE_ID, the last TIDE ends at MAX_TIE_ID, and every other
+        # TIDE starts at its first and ends at its last TIE header. The receiver treats the TIE-IDs
+        # between the end of one TIDE and the start of the next TIDE as a gap, in the same way as
+        # the TIE-IDs between two TIE headers in the same TIDE. Hence, the TIDEs together have the
+        # same meaning as a single TIDE containing all TIE headers.
+        #
+        # The encoded TIDE for a range is re-used as long as the TIE-IDs, the sequence numbers,
+        # and whether or not the remaining lifetime is zero for all TIE headers in the range stay
+        # the same (but not for longer than TIDE_REFRESH_INTERVAL). Thus, when a TIE is added,
+        # removed, or updated, only the TIDE for the range containing that TIE is encoded again.
+        level = self.level_value()
+        now = time.monotonic()
+        protocol_packets = []
+        ranges = []
+        range_first = 0
+        range_size = 0
+        for (index, tie_header) in enumerate(tie_headers):
+            size = packet_common.tide_tie_header_size(tie_header)
+            if range_size + size > max_size and index > range_first:
+                ranges.append((range_first, index))
+                range_first = index
+                range_size = 0
+            range_size += size
+        ranges.append((range_first, len(tie_headers)))
+        for (first, last) in ranges:
+            range_headers = tie_headers[first:last]
+            is_first_range = (first == 0)
+            is_last_range = (last == len(tie_headers))
+            key = (level, is_first_range, is_last_range,
+                   tuple((packet_common.tie_id_key(tie_header.tieid), tie_header.seq_nr,
+                          tie_header.remaining_lifetime == 0) for tie_header in range_headers))
+            cache_entry = self._tide_packets.get(key)
+            if cache_entry is not None:
+                (protocol_packet, encoded_protocol_packet, encode_time) = cache_entry
+                if now - encode_time < self.TIDE_REFRESH_INTERVAL:
+                    protocol_packets.append((protocol_packet, encoded_protocol_packet))
+                    continue
+            start_range = self.MIN_TIE_ID if is_first_range else range_headers[0].tieid
+            end_range = self.MAX_TIE_ID if is_last_range else range_headers[-1].tieid
+            tide_packet = packet_common.make_tide_packet(start_range, end_range)
+            for tie_header in range_headers:
+                # Copy the header, so that the TIDE shows the remaining lifetime that was encoded
+                packet_common.add_tie_header_to_tide(tide_packet, copy.copy(tie_header))
+            self.debug("Encoded TIDE: %s", tide_packet)
+            packet_content = encoding.ttypes.PacketContent(tide=tide_packet)
+            packet_header = encoding.ttypes.PacketHeader(
+                sender=self.system_id,
+                level=level)
+            protocol_packet = encoding.ttypes.ProtocolPacket(
+                header=packet_header,
+                content=packet_content)
+            encoded_protocol_packet = packet_common.encode_protocol_packet(protocol_packet)
+            self._tide_packets[key] = (protocol_packet, encoded_protocol_packet, now)
+            protocol_packets.append((protocol_packet, encoded_protocol_packet))
+        return protocol_packets
 
     @staticmethod
     def cli_summary_headers():
@@ -976,6 +1206,9 @@ class Node:
             tab.add_row(intf.cli_summary_attributes())
         cli_session.print(tab.to_string())
 
+    def command_show_kernel(self, cli_session):
+        self.kernel.command_show_kernel(cli_session)
+
     def command_show_kernel_addresses(self, cli_session):
         self.kernel.command_show_addresses(cli_session)
 
@@ -1099,6 +1332,28 @@ class Node:
         tab.add_row(rte.cli_summary_attributes())
         cli_session.print(tab.to_string())
 
+    def command_show_forwarding_lookup(self, cli_session, parameters):
+        assert "lookup" in parameters
+        address_str = parameters["lookup"]
+        try:
+            address = packet_common.make_ip_address(address_str)
+        except ValueError:
+            cli_session.print('Invalid address "{}" (valid values: ipv4-address, ipv6-address)'
+                              .format(address_str))
+            return
+        if address.version == 4:
+            af_fib = self._ipv4_fib
+        else:
+            af_fib = self._ipv6_fib
+        rte = af_fib.lookup(address)
+        if rte is None:
+            cli_session.print("No route to {}".format(address))
+            return
+        tab = table.Table()
+        tab.add_row(route.Route.cli_summary_headers())
+        tab.add_row(rte.cli_summary_attributes())
+        cli_session.print(tab.to_string())
+
     def command_show_forwarding(self, cli_session):
         self.command_show_forwarding_af(cli_session, constants.ADDRESS_FAMILY_IPV4)
         self.command_show_forwarding_af(cli_session, constants.ADDRESS_FAMILY_IPV6)
@@ -1116,6 +1371,10 @@ class Node:
         cli_session.print("SPF Statistics:")
         tab = self.spf_statistics_table()
         cli_session.print(tab.to_string())
+        cli_session.print("SPF Backoff:")
+        tab = table.Table()
+        tab.add_rows(self.cli_spf_backoff_attributes())
+        cli_session.print(tab.to_string())
         self.command_show_spf_destinations(cli_session, constants.DIR_SOUTH)
         self.command_show_spf_destinations(cli_session, constants.DIR_NORTH)
 
@@ -1263,17 +1522,19 @@ class Node:
         self._interfaces_by_name[interface_name].set_failure(tx_fail, rx_fail)
 
     def debug(self, msg, *args):
-        self.log.debug("[%s] %s" % (self.log_id, msg), *args)
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("[%s] %s" % (self.log_id, msg), *args)
 
     def info(self, msg, *args):
-        self.log.info("[%s] %s" % (self.log_id, msg), *args)
+        if self.log.isEnabledFor(logging.INFO):
+            self.log.info("[%s] %s" % (self.log_id, msg), *args)
 
     def db_debug(self, msg, *args):
-        if self._tie_db_log is not None:
+        if self._tie_db_log is not None and self._tie_db_log.isEnabledFor(logging.DEBUG):
             self._tie_db_log.debug("[%s] %s" % (self.log_id, msg), *args)
 
     def spf_debug(self, msg, *args):
-        if self._spf_log is not None:
+        if self._spf_log is not None and self._spf_log.isEnabledFor(logging.DEBUG):
             self._spf_log.debug("[%s] %s" % (self.log_id, msg), *args)
 
     def ties_differ_enough_for_spf(self, old_tie, new_tie):
@@ -1305,19 +1566,119 @@ class Node:
             trigger_spf = True
             reason = "TIE " + packet_common.tie_id_str(tie_id) + " added"
         self.ties[tie_id] = tie_packet
+        originator_key = (tie_id.direction, tie_id.originator, tie_id.tietype)
+        originator_ties = self._ties_by_originator.get(originator_key)
+        if originator_ties is None:
+            originator_ties = sortedcontainers.SortedDict()
+            self._ties_by_originator[originator_key] = originator_ties
+        originator_ties[tie_id.tie_nr] = tie_packet
+        self.set_tie_expiry_time(tie_id, tie_packet.header.remaining_lifetime)
+        self.invalidate_tie_protocol_packet(tie_id)
+        self.tie_db_changed()
         if trigger_spf:
-            self.trigger_spf(reason)
+            if tie_id.tietype == common.ttypes.TIETypeType.NodeTIEType:
+                self._spf_graph.node_tie_changed(tie_id)
+            self.trigger_spf(reason, tie_id)
 
     def remove_tie(self, tie_id):
         # It is not an error to attempt to delete a TIE which is not in the database
         if tie_id in self.ties:
             del self.ties[tie_id]
+            originator_key = (tie_id.direction, tie_id.originator, tie_id.tietype)
+            originator_ties = self._ties_by_originator[originator_key]
+            del originator_ties[tie_id.tie_nr]
+            if not originator_ties:
+                del self._ties_by_originator[originator_key]
+            del self._tie_expiry_times[tie_id]
+            self.invalidate_tie_protocol_packet(tie_id)
+            self.tie_db_changed()
+            if tie_id.tietype == common.ttypes.TIETypeType.NodeTIEType:
+                self._spf_graph.node_tie_changed(tie_id)
             reason = "TIE " + packet_common.tie_id_str(tie_id) + " removed"
-            self.trigger_spf(reason)
+            self.trigger_spf(reason, tie_id)
 
     def find_tie(self, tie_id):
         # Returns None if tie_id is not in database
-        return self.ties.get(tie_id)
+        db_tie = self.ties.get(tie_id)
+        if db_tie is not None:
+            self.update_remaining_lifetime(db_tie)
+        return db_tie
+
+    def set_tie_expiry_time(self, tie_id, remaining_lifetime):
+        # The remaining lifetime of the TIEs in the TIE-DB is not decremented every second. Instead
+        # we remember the time when each TIE expires, and we only run a timer for the TIE that
+        # expires first. The remaining lifetime in the TIE header is updated on demand (see
+        # update_remaining_lifetime) whenever the TIE header is looked at.
+        expiry_time = time.monotonic() + remaining_lifetime
+        self._tie_expiry_times[tie_id] = expiry_time
+        heapq.heappush(self._tie_expiry_heap, (expiry_time, tie_id))
+        # Entries in the heap for TIEs that were removed or whose expiry time was changed are only
+        # removed when they get to the top of the heap. Rebuild the heap if there are too many.
+        if len(self._tie_expiry_heap) > 2 * len(self._tie_expiry_times) + 100:
+            self._tie_expiry_heap = [(expiry_time, tie_id) for (tie_id, expiry_time)
+                                     in self._tie_expiry_times.items()]
+            heapq.heapify(self._tie_expiry_heap)
+        self.schedule_tie_expiry_timer()
+
+    def update_remaining_lifetime(self, db_tie):
+        expiry_time = self._tie_expiry_times.get(db_tie.header.tieid)
+        if expiry_time is not None:
+            remaining_lifetime = math.ceil(expiry_time - time.monotonic())
+            db_tie.header.remaining_lifetime = max(remaining_lifetime, 0)
+
+    def schedule_tie_expiry_timer(self):
+        heap = self._tie_expiry_heap
+        while heap and self._tie_expiry_times.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+        if not heap:
+            next_expiry_time = None
+        else:
+            next_expiry_time = heap[0][0]
+        if next_expiry_time == self._tie_expiry_timer_time:
+            return
+        if self._tie_expiry_timer is not None:
+            self._tie_expiry_timer.stop()
+            self._tie_expiry_timer = None
+        self._tie_expiry_timer_time = next_expiry_time
+        if next_expiry_time is not None:
+            self._tie_expiry_timer = timer.Timer(
+                interval=max(next_expiry_time - time.monotonic(), 0.0),
+                expire_function=self.age_ties,
+                periodic=False,
+                start=True)
+
+    def tie_protocol_packet(self, db_tie):
+        # Returns a tuple (protocol_packet, encoded_protocol_packet) for flooding the given TIE from
+        # the TIE-DB. The protocol packet is only encoded the first time the TIE is flooded; after
+        # that the encoded protocol packet is taken from the cache, so flooding a TIE to N
+        # neighbors costs one encode instead of N. The cache entry is invalidated whenever the TIE
+        # is changed in the TIE-DB (stored, removed, or re-originated). The packet header contains
+        # our level and the TIE header contains the remaining lifetime, so a cache entry encoded at
+        # a different level or with a different remaining lifetime is not used either.
+        tie_id = db_tie.header.tieid
+        level = self.level_value()
+        self.update_remaining_lifetime(db_tie)
+        lifetime = db_tie.header.remaining_lifetime
+        cache_entry = self._tie_protocol_packets.get(tie_id)
+        if cache_entry is not None:
+            (cached_tie, cached_level, cached_lifetime, protocol_packet,
+             encoded_protocol_packet) = cache_entry
+            if (cached_tie is db_tie) and (cached_level == level) and (cached_lifetime == lifetime):
+                return (protocol_packet, encoded_protocol_packet)
+        packet_header = encoding.ttypes.PacketHeader(
+            sender=self.system_id,
+            level=level)
+        packet_content = encoding.ttypes.PacketContent(tie=db_tie)
+        protocol_packet = encoding.ttypes.ProtocolPacket(
+            header=packet_header,
+            content=packet_content)
+        encoded_protocol_packet = packet_common.encode_protocol_packet(protocol_packet)
+        self._tie_protocol_packets[tie_id] = (db_tie, level, lifetime, protocol_packet,
+                                              encoded_protocol_packet)
+        return (protocol_packet, encoded_protocol_packet)
+
+    def invalidate_tie_protocol_packet(self, tie_id):
+        self._tie_protocol_packets.pop(tie_id, None)
 
     def start_sending_db_ties_in_range(self, start_sending_tie_headers, start_id, start_incl,
                                        end_id, end_incl):
@@ -1325,80 +1686,131 @@ class Node:
         for db_tie_id in db_ties:
             db_tie = self.ties[db_tie_id]
             # TODO: Make sure that lifetime is decreased by at least one before propagating
+            self.update_remaining_lifetime(db_tie)
             start_sending_tie_headers.append(db_tie.header)
 
-    def process_received_tide_packet(self, tide_packet):
+    def forget_received_tides(self, interface_name):
+        # Called when the adjacency on the interface goes down. The first TIDE received after the
+        # adjacency comes back up (possibly with a different neighbor) is not a continuation of
+        # the TIDEs received before.
+        self._last_received_tide_end.pop(interface_name, None)
+
+    def process_received_tide_packet(self, tide_packet, from_interface_name=None):
         request_tie_headers = []
         start_sending_tie_headers = []
         stop_sending_tie_headers = []
-        # It is assumed TIDEs are sent and received in increasing order or range. If we observe
-        # a gap between the end of the range of the last TIDE (if any) and the start of the range
-        # of this TIDE, then we must start sending all TIEs in our database that fall in that gap.
-        if tide_packet.start_range < self._last_received_tide_end:
-            # The neighbor has wrapped around: it has sent its last TIDE and is not sending the
-            # first TIDE again (look for comment "wrap-around" in test_tie_db.py for an example)
-            # Note - I am not completely happy with this rule since it may lead to unnecessarily
-            # putting TIEs on the send queue if TIDEs are received out of order.
-            self._last_received_tide_end = self.MIN_TIE_ID
-        if tide_packet.start_range > self._last_received_tide_end:
-            # There is a gap between the end of the previous TIDE and the start of this TIDE
-            self.start_sending_db_ties_in_range(start_sending_tie_headers,
-                                                self._last_received_tide_end, True,
-                                                tide_packet.start_range, False)
-        self._last_received_tide_end = tide_packet.end_range
-        # The first gap that we need to consider starts at start_range (inclusive)
+        self.process_tide_start_gap(tide_packet, from_interface_name, start_sending_tie_headers)
+        # Both the headers in the TIDE and the TIEs in our TIE DB are sorted by TIE-ID, so we walk
+        # through both in a single pass.
+        db_ties = self.tide_db_ties_snapshot(tide_packet)
+        db_index = 0
+        db_ties_count = len(db_ties)
         last_processed_tie_id = tide_packet.start_range
-        minimum_inclusive = True
         # Process the TIDE
         for header_in_tide in tide_packet.headers:
+            tide_tie_id = header_in_tide.tieid
             # Make sure all tie_ids in the TIDE in the range advertised by the TIDE
-            if header_in_tide.tieid < last_processed_tie_id:
+            if tide_tie_id < last_processed_tie_id:
                 # TODO: Handle error (not sorted)
                 assert False
+            last_processed_tie_id = tide_tie_id
             # Start/mid-gap processing: send TIEs that are in our TIE DB but missing in TIDE
-            self.start_sending_db_ties_in_range(start_sending_tie_headers,
-                                                last_processed_tie_id, minimum_inclusive,
-                                                header_in_tide.tieid, False)
-            last_processed_tie_id = header_in_tide.tieid
-            minimum_inclusive = False
+            while db_index < db_ties_count and db_ties[db_index][0] < tide_tie_id:
+                db_tie = db_ties[db_index][1]
+                # TODO: Make sure that lifetime is decreased by at least one before propagating
+                self.update_remaining_lifetime(db_tie)
+                start_sending_tie_headers.append(db_tie.header)
+                db_index += 1
             # Process all tie_ids in the TIDE
-            db_tie = self.find_tie(header_in_tide.tieid)
-            if db_tie is None:
-                if header_in_tide.tieid.originator == self.system_id:
-                    # Self-originate an empty TIE with a higher sequence number.
+            if db_index < db_ties_count and db_ties[db_index][0] == tide_tie_id:
+                db_tie = db_ties[db_index][1]
+                self.update_remaining_lifetime(db_tie)
+                db_index += 1
+            else:
+                # The TIE is not in the snapshot. It can only be in the TIE DB if it was
+                # re-originated while processing this TIDE (i.e. the TIDE repeats a TIE-ID).
+                db_tie = self.find_tie(tide_tie_id)
+            self.process_tide_header(header_in_tide, db_tie, request_tie_headers,
+                                     start_sending_tie_headers, stop_sending_tie_headers)
+        # End-gap processing: send TIEs that are in our TIE DB but missing in TIDE
+        for (_db_tie_id, db_tie) in db_ties[db_index:]:
+            self.update_remaining_lifetime(db_tie)
+            start_sending_tie_headers.append(db_tie.header)
+        return (request_tie_headers, start_sending_tie_headers, stop_sending_tie_headers)
+
+    def process_tide_start_gap(self, tide_packet, from_interface_name, start_sending_tie_headers):
+        # It is assumed TIDEs are sent and received in increasing order or range. If we observe
+        # a gap between the end of the range of the last TIDE (if any) received on the same
+        # interface and the start of the range of this TIDE, then we must start sending all TIEs in
+        # our database that fall in that gap. The end of the range of the last TIDE itself was
+        # covered by that TIDE, so it is not part of the gap.
+        last_received_tide_end = self._last_received_tide_end.get(from_interface_name)
+        if (last_received_tide_end is not None and
+                tide_packet.start_range < last_received_tide_end):
+            # The neighbor has wrapped around: it has sent its last TIDE and is not sending the
+            # first TIDE again (look for comment "wrap-around" in test_tie_db.py for an example)
+            # Note - I am not completely happy with this rule since it may lead to unnecessarily
+            # putting TIEs on the send queue if TIDEs are received out of order.
+            last_received_tide_end = None
+        if last_received_tide_end is None:
+            (gap_start, gap_start_inclusive) = (self.MIN_TIE_ID, True)
+        else:
+            (gap_start, gap_start_inclusive) = (last_received_tide_end, False)
+        if tide_packet.start_range > gap_start:
+            # There is a gap between the end of the previous TIDE and the start of this TIDE
+            self.start_sending_db_ties_in_range(start_sending_tie_headers,
+                                                gap_start, gap_start_inclusive,
+                                                tide_packet.start_range, False)
+        self._last_received_tide_end[from_interface_name] = tide_packet.end_range
+
+    def tide_db_ties_snapshot(self, tide_packet):
+        # Take a snapshot of the (TIE-ID, TIE) items in our TIE DB in the range of the TIDE (own
+        # TIEs may be re-originated while processing the TIDE). If the TIDE contains headers beyond
+        # the end of its range (it should not), TIEs in our TIE DB before the last header in the
+        # TIDE are also considered to be missing from the TIDE.
+        range_end = tide_packet.end_range
+        if tide_packet.headers and tide_packet.headers[-1].tieid > range_end:
+            range_end = tide_packet.headers[-1].tieid
+        return self.ties.items()[self.ties.bisect_left(tide_packet.start_range):
+                                 self.ties.bisect_right(range_end)]
+
+    def process_tide_header(self, header_in_tide, db_tie, request_tie_headers,
+                            start_sending_tie_headers, stop_sending_tie_headers):
+        # Compare a TIE header in a received TIDE with the TIE in our TIE DB (None if we don't
+        # have it), and add the header to the list of TIEs to request, to start sending, or to
+        # stop sending.
+        tide_tie_id = header_in_tide.tieid
+        if db_tie is None:
+            if tide_tie_id.originator == self.system_id:
+                # Self-originate an empty TIE with a higher sequence number.
+                bumped_own_tie_header = self.bump_own_tie(db_tie, header_in_tide)
+                start_sending_tie_headers.append(bumped_own_tie_header)
+            else:
+                # We don't have the TIE, request it
+                # To request a a missing TIE, we have to set the seq_nr to 0. This is not
+                # mentioned in the RIFT draft, but it is described in ISIS ISO/IEC 10589:1992
+                # section 7.3.15.2 bullet b.4
+                request_header = header_in_tide
+                request_header.seq_nr = 0
+                request_header.remaining_lifetime = 0
+                request_header.origination_time = None
+                request_tie_headers.append(request_header)
+        else:
+            comparison = compare_tie_header_age(db_tie.header, header_in_tide)
+            if comparison < 0:
+                if tide_tie_id.originator == self.system_id:
+                    # Re-originate DB TIE with higher sequence number than the one in TIDE
                     bumped_own_tie_header = self.bump_own_tie(db_tie, header_in_tide)
                     start_sending_tie_headers.append(bumped_own_tie_header)
                 else:
-                    # We don't have the TIE, request it
-                    # To request a a missing TIE, we have to set the seq_nr to 0. This is not
-                    # mentioned in the RIFT draft, but it is described in ISIS ISO/IEC 10589:1992
-                    # section 7.3.15.2 bullet b.4
-                    request_header = header_in_tide
-                    request_header.seq_nr = 0
-                    request_header.remaining_lifetime = 0
-                    request_header.origination_time = None
-                    request_tie_headers.append(request_header)
+                    # We have an older version of the TIE, request the newer version
+                    request_tie_headers.append(header_in_tide)
+            elif comparison > 0:
+                # We have a newer version of the TIE, send it
+                start_sending_tie_headers.append(db_tie.header)
             else:
-                comparison = compare_tie_header_age(db_tie.header, header_in_tide)
-                if comparison < 0:
-                    if header_in_tide.tieid.originator == self.system_id:
-                        # Re-originate DB TIE with higher sequence number than the one in TIDE
-                        bumped_own_tie_header = self.bump_own_tie(db_tie, header_in_tide)
-                        start_sending_tie_headers.append(bumped_own_tie_header)
-                    else:
-                        # We have an older version of the TIE, request the newer version
-                        request_tie_headers.append(header_in_tide)
-                elif comparison > 0:
-                    # We have a newer version of the TIE, send it
-                    start_sending_tie_headers.append(db_tie.header)
-                else:
-                    # We have the same version of the TIE, if we are trying to send it, stop it
-                    stop_sending_tie_headers.append(db_tie.header)
-        # End-gap processing: send TIEs that are in our TIE DB but missing in TIDE
-        self.start_sending_db_ties_in_range(start_sending_tie_headers,
-                                            last_processed_tie_id, minimum_inclusive,
-                                            tide_packet.end_range, True)
-        return (request_tie_headers, start_sending_tie_headers, stop_sending_tie_headers)
+                # We have the same version of the TIE, if we are trying to send it, stop it
+                stop_sending_tie_headers.append(db_tie.header)
 
     def process_received_tire_packet(self, tire_packet):
         request_tie_headers = []
@@ -1423,10 +1835,10 @@ class Node:
         # We have to originate an empty node TIE for the purpose of flushing it. Use the same
         # contents as the real node TIE that we actually originated, except don't report any
         # neighbors.
-        real_node_tie_id = copy.deepcopy(rx_tie_header.tieid)
-        real_node_tie_id.tie_nr = MY_TIE_NR
-        real_node_tie = self.find_tie(real_node_tie_id)
-        assert real_node_tie is not None
+        rx_tie_id = rx_tie_header.tieid
+        originator_key = (rx_tie_id.direction, rx_tie_id.originator, rx_tie_id.tietype)
+        real_node_tie = self._ties_by_originator[originator_key][MY_TIE_NR]
+        self.update_remaining_lifetime(real_node_tie)
         return real_node_tie
 
     def make_according_empty_tie(self, rx_tie_header):
@@ -1477,6 +1889,8 @@ class Node:
         else:
             # Re-originate DB TIE with higher sequence number than the one in RX TIE
             db_tie.header.seq_nr = rx_tie_header.seq_nr + 1
+            self.invalidate_tie_protocol_packet(db_tie.header.tieid)
+            self.tie_db_changed()
             return db_tie.header
 
     def process_received_tie_packet(self, rx_tie):
@@ -1522,7 +1936,7 @@ class Node:
         # the TIE in the TIE-DB. Also, this question can only be asked about Node TIEs (other TIEs
         # don't store the level of the originator in the TIEPacket)
         assert tie_header.tieid.tietype == common.ttypes.TIETypeType.NodeTIEType
-        db_tie = self.find_tie(tie_header.tieid)
+        db_tie = self.ties.get(tie_header.tieid)
         if db_tie is None:
             # Just in case it unexpectedly not in the TIE-DB
             return None
@@ -1540,10 +1954,11 @@ class Node:
         # the neighbor_system_id. If that rule wasn't there we would have been able to encode a TIDE
         # only one per direction (N, S, EW) instead of once per neighbor, and still follow all the
         # flooding scope rules. We have chosen to follow the rules strictly (not doing so causes all
-        # sorts of other complications), so -alas- we swallow the performance overhead of encoding
-        # separate TIDE packets for every individual neighbor. TODO: I may revisit this decision
-        # when the exact nature of the "other complications" (namely persistent oscillations) are
-        # better understood (correctness first, performance later).
+        # sorts of other complications). That rule (and the self-originated rules when the neighbor
+        # is the from-node) only apply to non-node S-TIEs originated by the neighbor. Hence,
+        # tide_tie_headers_for_neighbor evaluates these rules once for all other TIEs for all
+        # neighbors in the same direction, level, and top-of-fabric class, and only evaluates them
+        # per neighbor for the S-TIEs originated by that neighbor.
         # See https://www.dropbox.com/s/b07dnhbxawaizpi/zoom_0.mp4?dl=0 for a video recording of a
         # discussion where these complications were discussed in detail.
         if tie_header.tieid.direction == constants.DIR_SOUTH:
@@ -1668,7 +2083,29 @@ class Node:
                              neighbor_is_top_of_fabric,
                              my_level,
                              i_am_top_of_fabric):
-        # pylint:disable=too-many-locals
+        # Generate a single TIDE packet which covers the entire range and which reports all TIE
+        # headers. The TIDE packets which are actually sent are split into multiple ranges to fit
+        # the MTU of the interface (see tide_protocol_packets).
+        tide_packet = packet_common.make_tide_packet(
+            start_range=self.MIN_TIE_ID,
+            end_range=self.MAX_TIE_ID)
+        tie_headers = self.generate_tide_tie_headers(neighbor_direction, neighbor_system_id,
+                                                     neighbor_level, neighbor_is_top_of_fabric,
+                                                     my_level, i_am_top_of_fabric)
+        for tie_header in tie_headers:
+            packet_common.add_tie_header_to_tide(tide_packet, tie_header)
+        return tide_packet
+
+    def generate_tide_tie_headers(self,
+                                  neighbor_direction,
+                                  neighbor_system_id,
+                                  neighbor_level,
+                                  neighbor_is_top_of_fabric,
+                                  my_level,
+                                  i_am_top_of_fabric,
+                                  ties=None):
+        # Return the sorted list of TIE headers that go into the TIDE packets for a neighbor. Only
+        # the given sorted list of TIEs is considered, or the entire TIE database if it is None.
         #
         # The algorithm for deciding which TIE headers go into a TIDE packet are based on what is
         # described as "the solution to oscillation #1" in slide deck
@@ -1676,18 +2113,14 @@ class Node:
         # 19 Oct 2018, Tony reported that the RIFT specification was already updated with the same
         # rules, but IMHO sections Table 3 / B.3.1. / B.3.2.1 in the draft are still ambiguous and
         # I am not sure if they specify the same behavior.
-        #
-        # We generate a single TIDE packet which covers the entire range and we report all TIE
-        # headers in that single TIDE packet. We simple assume that it will fit in a single UDP
-        # packet which can be up to 64K. And if a single TIE gets added or removed we swallow the
-        # cost of regenerating and resending the entire TIDE packet.
-        tide_packet = packet_common.make_tide_packet(
-            start_range=self.MIN_TIE_ID,
-            end_range=self.MAX_TIE_ID)
+        if ties is None:
+            ties = self.ties.values()
+        tie_headers = []
         # Look at every TIE in our database, and decide whether or not we want to include it in the
         # TIDE packet. This is a rather expensive process, which is why we want to minimize the
         # the number of times this function is run.
-        for tie_packet in self.ties.values():
+        for tie_packet in ties:
+            self.update_remaining_lifetime(tie_packet)
             tie_header = tie_packet.header
             # The first possible reason for including a TIE header in the TIDE is to announce that
             # we have a TIE that we want to send to the neighbor. In other words the TIE in the
@@ -1702,7 +2135,7 @@ class Node:
             if allowed:
                 self.db_debug("Include TIE %s in TIDE because %s (perspective us to neighbor)",
                               tie_header, reason1)
-                packet_common.add_tie_header_to_tide(tide_packet, tie_header)
+                tie_headers.append(tie_header)
                 continue
             # The second possible reason for including a TIE header in the TIDE is because the
             # neighbor might be considering to send the TIE to us, and we want to let the neighbor
@@ -1717,12 +2150,12 @@ class Node:
             if allowed:
                 self.db_debug("Include TIE %s in TIDE because %s (perspective neighbor to us)",
                               tie_header, reason2)
-                packet_common.add_tie_header_to_tide(tide_packet, tie_header)
+                tie_headers.append(tie_header)
                 continue
             # If we get here, we decided not to include the TIE header in the TIDE
             self.db_debug("Exclude TIE %s from TIDE because %s (perspective us to neighbor) and "
                           "%s (perspective neighbor to us)", tie_header, reason1, reason2)
-        return tide_packet
+        return tie_headers
 
     def spf_statistics_table(self):
         tab = table.Table()
@@ -1748,18 +2181,26 @@ class Node:
         tab = table.Table()
         tab.add_row(self.cli_tie_db_summary_headers())
         for tie in self.ties.values():
+            self.update_remaining_lifetime(tie)
             tab.add_row(self.cli_tie_db_summary_attributes(tie))
         return tab
 
     def age_ties(self):
-        expired_key_ids = []
-        for tie_id, db_tie in self.ties.items():
-            db_tie.header.remaining_lifetime -= 1
-            if db_tie.header.remaining_lifetime <= 0:
-                expired_key_ids.append(tie_id)
-        for key_id in expired_key_ids:
+        # Called when the TIE expiry timer expires: remove all TIEs whose remaining lifetime has
+        # run out, and restart the timer for the TIE that expires next.
+        now = time.monotonic()
+        heap = self._tie_expiry_heap
+        expired_tie_ids = []
+        while heap and heap[0][0] <= now:
+            (expiry_time, tie_id) = heapq.heappop(heap)
+            if self._tie_expiry_times.get(tie_id) == expiry_time:
+                expired_tie_ids.append(tie_id)
+        for tie_id in expired_tie_ids:
             # TODO: log a message
-            self.remove_tie(key_id)
+            self.remove_tie(tie_id)
+        self._tie_expiry_timer = None
+        self._tie_expiry_timer_time = None
+        self.schedule_tie_expiry_timer()
 
     @staticmethod
     def cli_tie_db_summary_headers():
@@ -1784,46 +2225,107 @@ class Node:
             packet_common.element_str(tie_id.tietype, tie_packet.element)
         ]
 
-    def trigger_spf(self, reason):
+    def spf_directions_using_tie(self, tie_id):
+        # Which SPF directions use the given TIE? See spf_use_tie_direction and
+        # SPFGraph.node_tie_changed: South-SPF only uses North-TIEs. North-SPF uses South-TIEs,
+        # and also the self-originated North-TIEs.
+        if tie_id.direction == constants.DIR_SOUTH:
+            return [constants.DIR_NORTH]
+        elif tie_id.originator == self.system_id:
+            return [constants.DIR_SOUTH, constants.DIR_NORTH]
+        else:
+            return [constants.DIR_SOUTH]
+
+    def trigger_spf(self, reason, changed_tie_id=None):
+        # If the trigger is not caused by a change in a specific TIE, run a full SPF in both
+        # directions.
         self._spf_triggers_count += 1
-        self._spf_trigger_history.appendleft(reason)
-        if self._defer_spf_timer is None:
-            self.start_defer_spf_timer()
-            self._spf_deferred_trigger_pending = False
-            self.spf_debug("Trigger and run SPF: %s", reason)
-            self.spf_run()
+        if changed_tie_id is None:
+            spf_directions = [constants.DIR_SOUTH, constants.DIR_NORTH]
         else:
+            spf_directions = self.spf_directions_using_tie(changed_tie_id)
+        for spf_direction in spf_directions:
+            if (changed_tie_id is not None and
+                    changed_tie_id.tietype == common.ttypes.TIETypeType.PrefixTIEType):
+                self._spf_changed_prefix_originators[spf_direction].add(changed_tie_id.originator)
+            else:
+                self._spf_full_run_needed[spf_direction] = True
+            self._spf_trigger_history[spf_direction].appendleft(reason)
+        # Reset the backoff wait if there were no triggers for the quiet period
+        now = timer.TIMER_SCHEDULER.now()
+        if ((self._spf_last_trigger_time is None) or
+                (now - self._spf_last_trigger_time >= self._spf_quiet_period)):
+            self._spf_backoff_wait = self._spf_secondary_wait
+        self._spf_last_trigger_time = now
+        if self._defer_spf_timer is not None:
             self._spf_deferred_trigger_pending = True
             self._spf_triggers_deferred_count += 1
             self.spf_debug("Trigger and defer SPF: %s", reason)
+        elif self._spf_initial_delay > 0.0:
+            self._spf_in_initial_delay = True
+            self.start_defer_spf_timer(self._spf_initial_delay)
+            self._spf_deferred_trigger_pending = True
+            self._spf_triggers_deferred_count += 1
+            self.spf_debug("Trigger and delay SPF: %s", reason)
+        else:
+            self.start_defer_spf_timer(self._spf_backoff_wait)
+            self._spf_deferred_trigger_pending = False
+            self.spf_debug("Trigger and run SPF: %s", reason)
+            self.spf_run()
 
-    def start_defer_spf_timer(self):
+    def start_defer_spf_timer(self, interval):
         self._defer_spf_timer = timer.Timer(
-            interval=self.MIN_SPF_INTERVAL,
+            interval=interval,
             expire_function=self.defer_spf_timer_expired,
             periodic=False,
             start=True)
 
     def defer_spf_timer_expired(self):
         self._defer_spf_timer = None
+        if self._spf_in_initial_delay:
+            # The run after the initial delay is followed by the secondary wait
+            self._spf_in_initial_delay = False
+        elif self._spf_deferred_trigger_pending:
+            # SPF is still being triggered: back off
+            self._spf_backoff_wait = min(2.0 * self._spf_backoff_wait, self._spf_max_wait)
         if self._spf_deferred_trigger_pending:
-            self.start_defer_spf_timer()
+            self.start_defer_spf_timer(self._spf_backoff_wait)
             self._spf_deferred_trigger_pending = False
             self.spf_debug("Run deferred SPF")
             self.spf_run()
 
+    def spf_backoff_state_str(self):
+        if self._defer_spf_timer is None:
+            return "Quiet"
+        elif self._spf_in_initial_delay:
+            return "Initial Delay"
+        elif self._spf_deferred_trigger_pending:
+            return "Deferred"
+        else:
+            return "Holding"
+
+    def cli_spf_backoff_attributes(self):
+        if self._defer_spf_timer is None:
+            timer_str = "Stopped"
+        else:
+            timer_str = self._defer_spf_timer.remaining_time_str()
+        return [
+            ["Backoff State", self.spf_backoff_state_str()],
+            ["Initial Delay", "{} secs".format(self._spf_initial_delay)],
+            ["Secondary Wait", "{} secs".format(self._spf_secondary_wait)],
+            ["Maximum Wait", "{} secs".format(self._spf_max_wait)],
+            ["Quiet Period", "{} secs".format(self._spf_quiet_period)],
+            ["Current Wait", "{} secs".format(self._spf_backoff_wait)],
+            ["Defer Timer", timer_str]
+        ]
+
     def ties_of_type(self, direction, system_id, prefix_type):
         # Return an ordered list of TIEs from the given node and in the given direction and of the
         # given type
-        node_ties = []
-        start_tie_id = packet_common.make_tie_id(direction, system_id, prefix_type, 0)
-        end_tie_id = packet_common.make_tie_id(direction, system_id, prefix_type,
-                                               packet_common.MAX_U32)
-        node_tie_ids = self.ties.irange(start_tie_id, end_tie_id, (True, True))
-        for node_tie_id in node_tie_ids:
-            node_tie = self.ties[node_tie_id]
-            node_ties.append(node_tie)
-        return node_ties
+        originator_ties = self._ties_by_originator.get((direction, system_id, prefix_type))
+        if originator_ties is None:
+            return []
+        return list(originator_ties.values())
 
     def node_ties(self, direction, system_id):
         # Return an ordered list of all node TIEs from the given node and in the given direction
@@ -1833,30 +2335,31 @@ class Node:
         # Return an ordered list of all prefix TIEs from the given node and in the given direction
         return self.ties_of_type(direction, system_id, common.ttypes.TIETypeType.PrefixTIEType)
 
-    def node_neighbors(self, node_ties, neighbor_direction):
-        # A generator that yields (nbr_system_id, nbr_tie_element) tuples for all neighbors in the
-        # specified direction of the nodes in the node_ties list.
-        for node_tie in node_ties:
-            node_level = node_tie.element.node.level
-            for nbr_system_id, nbr_tie_element in node_tie.element.node.neighbors.items():
-                nbr_level = nbr_tie_element.level
-                if neighbor_direction == constants.DIR_SOUTH:
-                    correct_direction = (nbr_level < node_level)
-                elif neighbor_direction == constants.DIR_NORTH:
-                    correct_direction = (nbr_level > node_level)
-                elif neighbor_direction == constants.DIR_EAST_WEST:
-                    correct_direction = (nbr_level == node_level)
-                else:
-                    assert False
-                if correct_direction:
-                    yield (nbr_system_id, nbr_tie_element)
-
     def spf_run(self):
         self._spf_runs_count += 1
-        # TODO: Currently we simply always run both North-SPF and South-SPF, but maybe we can be
-        # more intelligent about selectively triggering North-SPF and South-SPF separately.
-        self.spf_run_direction(constants.DIR_SOUTH)
-        self.spf_run_direction(constants.DIR_NORTH)
+        full_run = False
+        partial_run = False
+        for spf_direction in [constants.DIR_SOUTH, constants.DIR_NORTH]:
+            changed_prefix_originators = self._spf_changed_prefix_originators[spf_direction]
+            self._spf_changed_prefix_originators[spf_direction] = set()
+            if self._spf_full_run_needed[spf_direction]:
+                self._spf_full_run_needed[spf_direction] = False
+                self._spf_direction_runs_count[spf_direction] += 1
+                full_run = True
+                if self._spf_engine == 'csr':
+                    self.spf_run_direction_csr(spf_direction)
+                else:
+                    self.spf_run_direction(spf_direction)
+            elif changed_prefix_originators:
+                # Only prefix TIEs changed since the last SPF run, so the paths to the nodes did not
+                # change. Keep the node destinations, and only recompute the prefix destinations.
+                self._spf_direction_runs_count[spf_direction] += 1
+                partial_run = True
+                self.spf_run_direction_partial(spf_direction, changed_prefix_originators)
+        if full_run:
+            self._spf_full_runs_count += 1
+        elif partial_run:
+            self._spf_partial_runs_count += 1
 
     def spf_run_direction(self, spf_direction):
         # Shortest Path First (SPF) uses the Dijkstra algorithm to compute the shortest path to
@@ -1870,97 +2373,258 @@ class Node:
         # indexed by direction (south and north). Each value in the dictionary (i.e.
         # _spf_destinations[direction]) is itself a dictionary again: the values are SPFDest
         # SPFDest objects and the index is the key of the SPFDest object (a system-id or prefix).
-        # It contains both destinations for which the best path has not yet definitely been
-        # determined (so-called candidates) and also destinations for which the best path has
-        # already been definitely been determined. In the latter case the best attribute of the
-        # SPFDest object is set to True. This dictionary is kept around after the SPF run is
-        # completed, and there is a "show spf" CLI command to view it for debugging purposes.
-        self._spf_destinations[spf_direction] = {}
-        dest_table = self._spf_destinations[spf_direction]
-        # Initially, there is only one known destination, namely this node.
-        self_destination = spf_dest.make_node_destination(self.system_id, self.name, 0)
-        dest_table[self.system_id] = self_destination
-        # The variable "candidates" contains the set of destinations (nodes and prefixes) for which
-        # we have already determined some feasible path (which may be an ECMP path) but for which
-        # we have not yet established that the known path is indeed the best path.
-        # For efficiency, candidates is implemented as a priority queue that contains the
-        # destination keys with the best known path cost thus far as the priority.
-        # We use module heapdict (as opposed to the more widely used heapq module) because we need
-        # an efficient way to decrease the priority of an element which is already on the priority
-        # queue. Heapq only allows you to do this by calling the internal method _siftdown (see
-        # http://bit.ly/siftdown)
-        candidates = heapdict.heapdict()
-        # Initially, there is one destination in the candidates heap, namely the starting node (i.e.
-        # this node) with cost zero.
-        candidates[self.system_id] = 0
+        # It is filled in when the SPF run is complete, at which point the best path to every
+        # reachable destination has been determined (the best attribute of each SPFDest object is
+        # set to True). This dictionary is kept around after the SPF run is completed; it is used
+        # by partial SPF runs, and there is a "show spf" CLI command to view it for debugging
+        # purposes.
+        self._spf_originator_order[spf_direction] = {}
+        self._spf_originator_prefixes[spf_direction] = {}
+        self._spf_prefix_originators[spf_direction] = {}
+        # The variable "candidates" contains the state of the destinations (nodes and prefixes) for
+        # which we have already determined some feasible path (which may be an ECMP path), and a
+        # priority queue of the destinations for which we have not yet established that the known
+        # path is indeed the best path. To avoid creating an SPFDest object for every path that is
+        # considered, the destinations are identified by dense integer ids during the run, and the
+        # SPFDest objects are only created for the results. See spf_dest.SPFCandidates for details.
+        # Initially, there is only one candidate, namely the starting node (i.e. this node) with
+        # cost zero.
+        candidates = spf_dest.SPFCandidates()
+        candidates.add_root(self.system_id, self.name)
         # Keep going until we have no more candidates
-        while candidates:
-            # Remove the destination with the lowest cost from the candidate priority queue.
-            (dest_key, dest_cost) = candidates.popitem()
-            # If already have a best path to the destination move on to the next candidate. In this
-            # case the best path should have a strictly lower cost than the candidate's cost.
-            destination = dest_table[dest_key]
-            if destination.best:
-                assert dest_cost > destination.cost
-                continue
-            # Mark that we now have the best path to the destination.
-            destination.best = True
+        while True:
+            # Remove the destination with the lowest cost from the candidate priority queue, and
+            # mark that we now have the best path to the destination.
+            dest_id = candidates.pop()
+            if dest_id is None:
+                break
             # If the destination is a node (i.e. its key is a system-id number rather than an IP
             # prefix), potentially add its neighbor nodes and its prefixes as a new candidate or
             # as a new ECMP path for an existing candidate.
-            if isinstance(dest_key, int):
-                self.spf_add_candidates_from_node(dest_key, dest_cost, candidates, spf_direction)
+            if isinstance(candidates.keys[dest_id], int):
+                self.spf_add_candidates_from_node(dest_id, candidates, spf_direction)
+        dest_table = {}
+        for dest_id, dest_key in enumerate(candidates.keys):
+            dest_table[dest_key] = candidates.make_destination(dest_id)
+        self._spf_destinations[spf_direction] = dest_table
         # SPF run is done. Install the computed routes into the route table (RIB)
         self.spf_install_routes_in_rib(spf_direction)
 
-    def spf_add_candidates_from_node(self, node_system_id, node_cost, candidates, spf_direction):
-        node_ties = self.node_ties(self.spf_use_tie_direction(node_system_id, spf_direction),
-                                   node_system_id)
-        if node_ties == []:
+    def spf_add_candidates_from_node(self, node_dest_id, candidates, spf_direction):
+        node_system_id = candidates.keys[node_dest_id]
+        node_index = self._spf_graph.node_index(node_system_id)
+        edges = self._spf_graph.edges(spf_direction, node_index)
+        if edges is None:
             return
         # Update the name of the node (we take it from the first node TIE)
-        dest_table = self._spf_destinations[spf_direction]
-        dest_table[node_system_id].name = node_ties[0].element.node.name
+        candidates.names[node_dest_id] = self._spf_graph.name(spf_direction, node_index)
         # Add the neighbors of this node as candidates
-        self.spf_add_neighbor_candidates(node_system_id, node_cost, node_ties, candidates,
-                                         spf_direction)
+        self.spf_add_neighbor_candidates(node_dest_id, edges, candidates)
         # Add the prefixes of this node as candidates
-        self.spf_add_prefix_candidates(node_system_id, node_cost, candidates, spf_direction)
-
-    def spf_add_neighbor_candidates(self, node_system_id, node_cost, node_ties, candidates,
-                                    spf_direction):
-        # Consider each neighbor of the visited node in the direction of the SPF
-        for nbr in self.node_neighbors(node_ties, spf_direction):
-            (nbr_system_id, nbr_tie_element) = nbr
-            # Only consider bi-directional adjacencies.
-            if self.is_neighbor_bidirectional(node_system_id, nbr_system_id, nbr_tie_element,
-                                              spf_direction):
-                # We have found a feasible path to the neighbor node; is the best path?
-                cost = node_cost + nbr_tie_element.cost
-                destination = spf_dest.make_node_destination(nbr_system_id, None, cost)
-                self.spf_consider_candidate_dest(destination, nbr_tie_element, node_system_id,
-                                                 candidates, spf_direction)
-
-    def spf_add_prefix_candidates(self, node_system_id, node_cost, candidates, spf_direction):
+        self.spf_add_prefix_candidates(node_system_id, candidates.costs[node_dest_id],
+                                       candidates.next_hops[node_dest_id], candidates,
+                                       spf_direction)
+
+    def spf_add_neighbor_candidates(self, node_dest_id, edges, candidates):
+        node_system_id = candidates.keys[node_dest_id]
+        node_cost = candidates.costs[node_dest_id]
+        node_next_hops = candidates.next_hops[node_dest_id]
+        from_self = (node_system_id == self.system_id)
+        # Consider each neighbor of the visited node in the direction of the SPF. The graph only
+        # contains bi-directional adjacencies.
+        for (nbr_index, edge_cost, interface_ids) in edges:
+            # The next-hops of a neighbor of this node are the interfaces towards the neighbor;
+            # the neighbors of other nodes inherit the next-hops of the visited node.
+            if from_self:
+                next_hops = [self.interface_id_to_next_hop(interface_id)
+                             for interface_id in interface_ids]
+            else:
+                next_hops = node_next_hops
+            candidates.consider(self._spf_graph.system_id(nbr_index), node_cost + edge_cost,
+                                node_system_id, next_hops, None)
+
+    def spf_add_prefix_candidates(self, node_system_id, node_cost, node_next_hops, candidates,
+                                  spf_direction):
+        originator_order = self._spf_originator_order[spf_direction]
+        originator_order[node_system_id] = len(originator_order)
         prefix_ties = self.prefix_ties(self.spf_use_tie_direction(node_system_id, spf_direction),
                                        node_system_id)
+        originator_prefixes = set()
         for prefix_tie in prefix_ties:
             prefixes = prefix_tie.element.prefixes.prefixes
+            originator_prefixes.update(prefixes.keys())
             for prefix, attributes in prefixes.items():
                 # We have found a feasible path to the prefix; is the best path?
-                tags = attributes.tags
-                cost = node_cost + attributes.metric
-                destination = spf_dest.make_prefix_destintation(prefix, tags, cost)
-                self.spf_consider_candidate_dest(destination, None, node_system_id, candidates,
-                                                 spf_direction)
+                candidates.consider(prefix, node_cost + attributes.metric, node_system_id,
+                                    node_next_hops, attributes.tags)
+        self.spf_set_originator_prefixes(node_system_id, originator_prefixes, spf_direction)
+
+    def spf_run_direction_csr(self, spf_direction):
+        # Same as spf_run_direction (it produces the same SPF destinations and routes) but runs
+        # Dijkstra over the arrays of a compressed sparse row (CSR) snapshot of the SPF graph (see
+        # module spf_csr) for the node destinations. The prefix destinations are then determined
+        # from the prefixes of the reached nodes, considering the nodes in the order in which
+        # Dijkstra reached them.
+        self._spf_originator_order[spf_direction] = {}
+        self._spf_originator_prefixes[spf_direction] = {}
+        self._spf_prefix_originators[spf_direction] = {}
+        graph = self._spf_graph
+        csr_graph = self.spf_csr_graph(spf_direction)
+        (costs, predecessors, order) = spf_csr.shortest_paths(
+            csr_graph, graph.node_index(self.system_id))
+        dest_table = {}
+        prefix_candidates = spf_dest.SPFCandidates()
+        for (index, node_next_hops) in self.spf_csr_node_next_hops(spf_direction, costs,
+                                                                   predecessors, order):
+            system_id = graph.system_id(index)
+            destination = self.spf_csr_node_destination(csr_graph, spf_direction, index,
+                                                        costs[index], predecessors[index])
+            destination.next_hops = node_next_hops
+            dest_table[system_id] = destination
+            if csr_graph.present[index]:
+                self.spf_add_prefix_candidates(system_id, costs[index], node_next_hops,
+                                               prefix_candidates, spf_direction)
+        for dest_id, prefix in enumerate(prefix_candidates.keys):
+            destination = prefix_candidates.make_destination(dest_id)
+            destination.best = True
+            dest_table[prefix] = destination
+        self._spf_destinations[spf_direction] = dest_table
+        # SPF run is done. Install the computed routes into the route table (RIB)
+        self.spf_install_routes_in_rib(spf_direction)
 
-    def spf_consider_candidate_dest(self, destination, nbr_tie_element, predecessor_system_id,
+    def spf_csr_graph(self, spf_direction):
+        # The CSR snapshot of the SPF graph, which is rebuilt if the SPF graph changed since the
+        # snapshot was taken
+        csr_graph = self._spf_csr_graphs[spf_direction]
+        if (csr_graph is None) or (csr_graph.version != self._spf_graph.version):
+            csr_graph = spf_csr.CSRGraph(self._spf_graph, spf_direction)
+            self._spf_csr_graphs[spf_direction] = csr_graph
+        return csr_graph
+
+    def spf_csr_node_destination(self, csr_graph, spf_direction, index, cost,
+                                 predecessor_indexes):
+        graph = self._spf_graph
+        if csr_graph.present[index]:
+            name = graph.name(spf_direction, index)
+        elif graph.system_id(index) == self.system_id:
+            name = self.name
+        else:
+            name = None
+        destination = spf_dest.make_node_destination(graph.system_id(index), name, cost)
+        destination.best = True
+        destination.predecessors = [graph.system_id(predecessor_index)
+                                    for predecessor_index in predecessor_indexes]
+        return destination
+
+    def spf_csr_root_next_hops(self, spf_direction, costs):
+        # The next-hops of the neighbors of this node, indexed by neighbor index: the interfaces of
+        # the best edges towards each neighbor
+        graph = self._spf_graph
+        root_index = graph.node_index(self.system_id)
+        root_next_hops = {}
+        for (nbr_index, edge_cost, interface_ids) in graph.edges(spf_direction, root_index) or []:
+            if edge_cost == costs[nbr_index]:
+                nbr_next_hops = root_next_hops.setdefault(nbr_index, [])
+                for interface_id in interface_ids:
+                    nhop = self.interface_id_to_next_hop(interface_id)
+                    if nhop not in nbr_next_hops:
+                        nbr_next_hops.append(nhop)
+        return root_next_hops
+
+    def spf_csr_node_next_hops(self, spf_direction, costs, predecessors, order):
+        # A generator that yields (node index, next-hops) tuples for the nodes reached by the CSR
+        # SPF, in the order in which they were reached. The next-hops of a neighbor of this node
+        # are the interfaces of the best edges towards the neighbor; other nodes inherit the
+        # next-hops of their predecessors.
+        root_index = self._spf_graph.node_index(self.system_id)
+        root_next_hops = self.spf_csr_root_next_hops(spf_direction, costs)
+        next_hops = {}
+        for index in order:
+            node_next_hops = []
+            for predecessor_index in predecessors[index]:
+                if predecessor_index == root_index:
+                    inherited_next_hops = root_next_hops[index]
+                else:
+                    inherited_next_hops = next_hops.get(predecessor_index, [])
+                for nhop in inherited_next_hops:
+                    if nhop not in node_next_hops:
+                        node_next_hops.append(nhop)
+            next_hops[index] = node_next_hops
+            yield (index, node_next_hops)
+
+    def spf_set_originator_prefixes(self, node_system_id, new_prefixes, spf_direction):
+        # Update the prefixes advertised by a node, and return the set of prefixes that were
+        # advertised by the node before or after the update.
+        originator_prefixes = self._spf_originator_prefixes[spf_direction]
+        prefix_originators = self._spf_prefix_originators[spf_direction]
+        old_prefixes = originator_prefixes.get(node_system_id, set())
+        for prefix in old_prefixes - new_prefixes:
+            originators = prefix_originators[prefix]
+            originators.discard(node_system_id)
+            if not originators:
+                del prefix_originators[prefix]
+        for prefix in new_prefixes - old_prefixes:
+            if prefix in prefix_originators:
+                prefix_originators[prefix].add(node_system_id)
+            else:
+                prefix_originators[prefix] = set([node_system_id])
+        originator_prefixes[node_system_id] = new_prefixes
+        return old_prefixes | new_prefixes
+
+    def spf_run_direction_partial(self, spf_direction, changed_prefix_originators):
+        # Recompute the prefix destinations of the prefixes that are advertised (now or in the
+        # last SPF run) by the given nodes, using the node destinations of the last full SPF run.
+        # The result is the same as running the full SPF: the candidate paths to each prefix are
+        # considered in the order in which the full SPF visited the advertising nodes.
+        dest_table = self._spf_destinations[spf_direction]
+        originator_order = self._spf_originator_order[spf_direction]
+        prefix_originators = self._spf_prefix_originators[spf_direction]
+        affected_prefixes = self.spf_affected_prefixes(spf_direction, changed_prefix_originators)
+        # There is no Dijkstra priority queue; the candidates are only recorded and ignored
+        candidates = {}
+        for prefix in affected_prefixes:
+            dest_table.pop(prefix, None)
+            originators = sorted(prefix_originators.get(prefix, []),
+                                 key=originator_order.__getitem__)
+            for node_system_id in originators:
+                node_cost = dest_table[node_system_id].cost
+                for prefix_tie in self.prefix_ties(
+                        self.spf_use_tie_direction(node_system_id, spf_direction), node_system_id):
+                    attributes = prefix_tie.element.prefixes.prefixes.get(prefix)
+                    if attributes is None:
+                        continue
+                    destination = spf_dest.make_prefix_destintation(
+                        prefix, attributes.tags, node_cost + attributes.metric)
+                    self.spf_consider_candidate_dest(destination, None, node_system_id,
+                                                     candidates, spf_direction)
+            if prefix in dest_table:
+                dest_table[prefix].best = True
+        self.spf_install_prefix_routes_in_rib(affected_prefixes, spf_direction)
+
+    def spf_affected_prefixes(self, spf_direction, changed_prefix_originators):
+        # Update the prefixes advertised by the given nodes from their current prefix TIEs, and
+        # return the set of prefixes that were advertised by any of them before or after the update
+        originator_order = self._spf_originator_order[spf_direction]
+        affected_prefixes = set()
+        for node_system_id in changed_prefix_originators:
+            # The prefixes of nodes which were not visited by the full SPF are not used
+            if node_system_id not in originator_order:
+                continue
+            tie_direction = self.spf_use_tie_direction(node_system_id, spf_direction)
+            new_prefixes = set()
+            for prefix_tie in self.prefix_ties(tie_direction, node_system_id):
+                new_prefixes.update(prefix_tie.element.prefixes.prefixes.keys())
+            affected_prefixes |= self.spf_set_originator_prefixes(node_system_id, new_prefixes,
+                                                                  spf_direction)
+        return affected_prefixes
+
+    def spf_consider_candidate_dest(self, destination, interface_ids, predecessor_system_id,
                                     candidates, spf_direction):
         dest_key = destination.key()
         dest_table = self._spf_destinations[spf_direction]
         if dest_key not in dest_table:
             # We did not have any previous path to the destination. Add it.
-            self.set_spf_predecessor(destination, nbr_tie_element, predecessor_system_id,
+            self.set_spf_predecessor(destination, interface_ids, predecessor_system_id,
                                      spf_direction)
             dest_table[dest_key] = destination
             candidates[dest_key] = destination.cost
@@ -1971,7 +2635,7 @@ class Node:
             if destination.cost < old_destination.cost:
                 # The new path is strictly better than the existing path. Replace the existing path
                 # with the new path.
-                self.set_spf_predecessor(destination, nbr_tie_element, predecessor_system_id,
+                self.set_spf_predecessor(destination, interface_ids, predecessor_system_id,
                                          spf_direction)
                 dest_table[dest_key] = destination
                 candidates[dest_key] = destination.cost
@@ -1981,12 +2645,12 @@ class Node:
                 self.add_spf_predecessor(old_destination, predecessor_system_id, spf_direction)
                 old_destination.inherit_tags(destination)
 
-    def set_spf_predecessor(self, destination, nbr_tie_element, predecessor_system_id,
+    def set_spf_predecessor(self, destination, interface_ids, predecessor_system_id,
                             spf_direction):
         destination.add_predecessor(predecessor_system_id)
-        if (nbr_tie_element is not None) and (predecessor_system_id == self.system_id):
-            for link_id_pair in nbr_tie_element.link_ids:
-                nhop = self.interface_id_to_next_hop(link_id_pair.local_id)
+        if (interface_ids is not None) and (predecessor_system_id == self.system_id):
+            for interface_id in interface_ids:
+                nhop = self.interface_id_to_next_hop(interface_id)
                 destination.add_next_hop(nhop)
         else:
             dest_table = self._spf_destinations[spf_direction]
@@ -2025,65 +2689,60 @@ class Node:
             #     prefer the self-originated default route over the received default route route.
             return constants.DIR_NORTH
 
-    def is_neighbor_bidirectional(self, visit_system_id, nbr_system_id, nbr_tie_element,
-                                  spf_direction):
-        # Locate the Node-TIE(s) of the neighbor node in the desired direction. If we can't find
-        # the neighbor's Node-TIE(s), we declare the adjacency to be not bi-directional.
-        reverse_direction = constants.reverse_dir(spf_direction)
-        nbr_node_ties = self.node_ties(reverse_direction, nbr_system_id)
-        if nbr_node_ties == []:
-            return False
-        # Check for bi-directional connectivity: the neighbor must report the visited node
-        # as an adjacency with the same link-id pair (in reverse).
-        bidirectional = False
-        for nbr_nbr in self.node_neighbors(nbr_node_ties, reverse_direction):
-            (nbr_nbr_system_id, nbr_nbr_tie_element) = nbr_nbr
-            # Does the neighbor report the visited node as its neighbor?
-            if nbr_nbr_system_id != visit_system_id:
-                continue
-            # Are the link_ids bidirectional?
-            if not self.are_link_ids_bidirectional(nbr_tie_element, nbr_nbr_tie_element):
-                continue
-            # Yes, connectivity is bidirectional
-            bidirectional = True
-            break
-        return bidirectional
-
-    def are_link_ids_bidirectional(self, nbr_tie_element_1, nbr_tie_element_2):
-        # Does the set link_ids_1 contain any link-id (local_id, remote_id) which is present in
-        # reverse (remote_id, local_id) in set link_ids_2?
-        for id1 in nbr_tie_element_1.link_ids:
-            for id2 in nbr_tie_element_2.link_ids:
-                if (id1.local_id == id2.remote_id) and (id1.remote_id == id2.local_id):
-                    return True
-        return False
-
-    def spf_install_routes_in_rib(self, spf_direction):
+    @staticmethod
+    def spf_owner(spf_direction):
         if spf_direction == constants.DIR_NORTH:
-            owner = constants.OWNER_N_SPF
+            return constants.OWNER_N_SPF
         else:
-            owner = constants.OWNER_S_SPF
-        self._ipv4_rib.mark_owner_routes_stale(owner)
-        self._ipv6_rib.mark_owner_routes_stale(owner)
+            return constants.OWNER_S_SPF
+
+    def spf_rib_next_hops(self, dest):
+        # The next-hops of the route that SPF installs in the RIB for a prefix destination, or
+        # None if SPF does not install a route for the prefix destination.
+        if (dest is None) or (dest.predecessors in [[], [self.system_id]]):
+            # Unreachable or local prefix destination, don't install in RIB as result of SPF
+            return None
+        return dest.next_hops
+
+    def spf_update_rib_route(self, prefix, next_hops, spf_direction):
+        # Install, update, or (if next_hops is None) remove the route that SPF installed in the RIB
+        # for the prefix, but only if it is different from the route that is already installed.
+        installed_next_hops = self._spf_rib_next_hops[spf_direction]
+        old_next_hops = installed_next_hops.get(prefix)
+        if next_hops == old_next_hops:
+            return
+        if prefix.ipv4prefix is not None:
+            route_table = self._ipv4_rib
+        else:
+            assert prefix.ipv6prefix is not None
+            route_table = self._ipv6_rib
+        owner = self.spf_owner(spf_direction)
+        if next_hops is None:
+            del installed_next_hops[prefix]
+            route_table.del_route(prefix, owner)
+        else:
+            installed_next_hops[prefix] = next_hops
+            route_table.put_route(route.Route(prefix, owner, next_hops))
+
+    def spf_install_prefix_routes_in_rib(self, prefixes, spf_direction):
         dest_table = self._spf_destinations[spf_direction]
+        for prefix in prefixes:
+            next_hops = self.spf_rib_next_hops(dest_table.get(prefix))
+            self.spf_update_rib_route(prefix, next_hops, spf_direction)
+
+    def spf_install_routes_in_rib(self, spf_direction):
+        # Only install the differences between the result of this SPF run and the routes that were
+        # installed after the previous SPF run: the routes for prefixes that were added, removed, or
+        # whose next-hops changed.
+        dest_table = self._spf_destinations[spf_direction]
+        removed_prefixes = set(self._spf_rib_next_hops[spf_direction].keys())
         for dest_key, dest in dest_table.items():
             if isinstance(dest_key, int):
                 # Destination is a node, do nothing
-                pass
-            elif dest.predecessors == []:
-                # Local node destination, don't install in RIB as result of SPF
-                pass
-            elif dest.predecessors == [self.system_id]:
-                # Local prefix destination, don't install in RIB as result of SPF
-                pass
-            else:
-                prefix = dest_key
-                rte = route.Route(prefix, owner, dest.next_hops)
-                if prefix.ipv4prefix is not None:
-                    route_table = self._ipv4_rib
-                else:
-                    assert prefix.ipv6prefix is not None
-                    route_table = self._ipv6_rib
-                route_table.put_route(rte)
-        self._ipv4_rib.del_stale_routes()
-        self._ipv6_rib.del_stale_routes()
+                continue
+            next_hops = self.spf_rib_next_hops(dest)
+            if next_hops is not None:
+                removed_prefixes.discard(dest_key)
+            self.spf_update_rib_route(dest_key, next_hops, spf_direction)
+        for prefix in removed_prefixes:
+            self.spf_update_rib_route(prefix, None, spf_direction)
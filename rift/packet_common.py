@@ -1,8 +1,9 @@
-import copy
+import importlib.util
 import ipaddress
 import sortedcontainers
 
 import thrift.protocol.TBinaryProtocol
+import thrift.Thrift
 import thrift.transport.TTransport
 
 import common.ttypes
@@ -31,6 +32,91 @@ def tie_header_tup(tie_header):
     return (tie_header.tieid, tie_header.seq_nr, tie_header.remaining_lifetime,
             tie_header.origination_time)
 
+# TIE-IDs and IP prefixes are used as keys in (sorted) dictionaries such as the TIE-DB and the
+# route tables, so they are hashed and compared very often. Instead of building a tuple for every
+# hash or comparison, they are hashed and compared using a key which is computed only once (the
+# first time it is needed) and then cached in the _key attribute of the object (the class attribute
+# _key is None). Like any other dictionary key, a TIE-ID or IP prefix must not be modified after it
+# has been used as a key.
+#
+# The integer fields are masked to their unsigned value, so the key does not change when the
+# unsigned integer fixes (see below) are applied to a decoded or to-be-encoded packet.
+#
+# The functions below are installed as methods of the Thrift classes, so accessing the _key
+# attribute of the other object is not an access to a protected member of another class. The
+# attribute name starts with an underscore so that it cannot clash with a Thrift field name.
+# pylint: disable=protected-access
+
+def tie_id_key(tie_id):
+    key = ((tie_id.direction << 104) |
+           ((tie_id.originator & MAX_U64) << 40) |
+           (tie_id.tietype << 32) |
+           (tie_id.tie_nr & MAX_U32))
+    tie_id.__dict__['_key'] = key
+    return key
+
+def tie_id_hash(tie_id):
+    return hash(tie_id._key or tie_id_key(tie_id))
+
+def tie_id_eq(tie_id_1, tie_id_2):
+    return (tie_id_1._key or tie_id_key(tie_id_1)) == (tie_id_2._key or tie_id_key(tie_id_2))
+
+def tie_id_lt(tie_id_1, tie_id_2):
+    return (tie_id_1._key or tie_id_key(tie_id_1)) < (tie_id_2._key or tie_id_key(tie_id_2))
+
+def ipv4_prefix_key(ipv4_prefix):
+    key = ((ipv4_prefix.address & MAX_U32) << 8) | (ipv4_prefix.prefixlen & MAX_U8)
+    ipv4_prefix.__dict__['_key'] = key
+    return key
+
+def ipv6_prefix_key(ipv6_prefix):
+    key = (ipv6_prefix.address, ipv6_prefix.prefixlen & MAX_U8)
+    ipv6_prefix.__dict__['_key'] = key
+    return key
+
+def ip_prefix_hash(ip_prefix):
+    ipv4_prefix = ip_prefix.ipv4prefix
+    if ipv4_prefix is not None:
+        return hash(ipv4_prefix._key or ipv4_prefix_key(ipv4_prefix))
+    ipv6_prefix = ip_prefix.ipv6prefix
+    return hash(ipv6_prefix._key or ipv6_prefix_key(ipv6_prefix))
+
+def ip_prefix_eq(ip_prefix_1, ip_prefix_2):
+    ipv4_prefix_1 = ip_prefix_1.ipv4prefix
+    ipv4_prefix_2 = ip_prefix_2.ipv4prefix
+    if ipv4_prefix_1 is not None:
+        if ipv4_prefix_2 is None:
+            return False
+        return ((ipv4_prefix_1._key or ipv4_prefix_key(ipv4_prefix_1)) ==
+                (ipv4_prefix_2._key or ipv4_prefix_key(ipv4_prefix_2)))
+    if ipv4_prefix_2 is not None:
+        return False
+    ipv6_prefix_1 = ip_prefix_1.ipv6prefix
+    ipv6_prefix_2 = ip_prefix_2.ipv6prefix
+    return ((ipv6_prefix_1._key or ipv6_prefix_key(ipv6_prefix_1)) ==
+            (ipv6_prefix_2._key or ipv6_prefix_key(ipv6_prefix_2)))
+
+def ip_prefix_lt(ip_prefix_1, ip_prefix_2):
+    # IPv4 prefixes sort before IPv6 prefixes
+    ipv4_prefix_1 = ip_prefix_1.ipv4prefix
+    ipv4_prefix_2 = ip_prefix_2.ipv4prefix
+    if ipv4_prefix_1 is not None:
+        if ipv4_prefix_2 is None:
+            return True
+        return ((ipv4_prefix_1._key or ipv4_prefix_key(ipv4_prefix_1)) <
+                (ipv4_prefix_2._key or ipv4_prefix_key(ipv4_prefix_2)))
+    if ipv4_prefix_2 is not None:
+        return False
+    ipv6_prefix_1 = ip_prefix_1.ipv6prefix
+    ipv6_prefix_2 = ip_prefix_2.ipv6prefix
+    return ((ipv6_prefix_1._key or ipv6_prefix_key(ipv6_prefix_1)) <
+            (ipv6_prefix_2._key or ipv6_prefix_key(ipv6_prefix_2)))
+# pylint: enable=protected-access
+
+def repr_without_cached_key(struct):
+    fields = ['%s=%r' % (key, value) for key, value in vars(struct).items() if key != '_key']
+    return '%s(%s)' % (struct.__class__.__name__, ', '.join(fields))
+
 def link_id_pair_tup(link_id_pair):
     return (link_id_pair.local_id, link_id_pair.remote_id)
 
@@ -39,31 +125,34 @@ def timestamp_tup(timestamp):
 
 def add_missing_methods_to_thrift():
     # See http://bit.ly/thrift-missing-hash for details about why this is needed
+    # pylint:disable=protected-access
+    common.ttypes.IPv4PrefixType._key = None
     common.ttypes.IPv4PrefixType.__hash__ = (
-        lambda self: hash(ipv4_prefix_tup(self)))
+        lambda self: hash(self._key or ipv4_prefix_key(self)))
     common.ttypes.IPv4PrefixType.__eq__ = (
-        lambda self, other: ipv4_prefix_tup(self) == ipv4_prefix_tup(other))
+        lambda self, other: ((self._key or ipv4_prefix_key(self)) ==
+                             (other._key or ipv4_prefix_key(other))))
+    common.ttypes.IPv4PrefixType.__repr__ = repr_without_cached_key
+    common.ttypes.IPv6PrefixType._key = None
     common.ttypes.IPv6PrefixType.__hash__ = (
-        lambda self: hash(ipv6_prefix_tup(self)))
+        lambda self: hash(self._key or ipv6_prefix_key(self)))
     common.ttypes.IPv6PrefixType.__eq__ = (
-        lambda self, other: ipv6_prefix_tup(self) == ipv6_prefix_tup(other))
-    common.ttypes.IPPrefixType.__hash__ = (
-        lambda self: hash(ip_prefix_tup(self)))
-    common.ttypes.IPPrefixType.__eq__ = (
-        lambda self, other: ip_prefix_tup(self) == ip_prefix_tup(other))
+        lambda self, other: ((self._key or ipv6_prefix_key(self)) ==
+                             (other._key or ipv6_prefix_key(other))))
+    common.ttypes.IPv6PrefixType.__repr__ = repr_without_cached_key
+    common.ttypes.IPPrefixType.__hash__ = ip_prefix_hash
+    common.ttypes.IPPrefixType.__eq__ = ip_prefix_eq
     common.ttypes.IPPrefixType.__str__ = ip_prefix_str
-    common.ttypes.IPPrefixType.__lt__ = (
-        lambda self, other: ip_prefix_tup(self) < ip_prefix_tup(other))
+    common.ttypes.IPPrefixType.__lt__ = ip_prefix_lt
     common.ttypes.IEEE802_1ASTimeStampType.__hash__ = (
         lambda self: hash(timestamp_tup(self)))
     common.ttypes.IEEE802_1ASTimeStampType.__eq__ = (
         lambda self, other: timestamp_tup(self) == timestamp_tup(other))
-    encoding.ttypes.TIEID.__hash__ = (
-        lambda self: hash(tie_id_tup(self)))
-    encoding.ttypes.TIEID.__eq__ = (
-        lambda self, other: tie_id_tup(self) == tie_id_tup(other))
-    encoding.ttypes.TIEID.__lt__ = (
-        lambda self, other: tie_id_tup(self) < tie_id_tup(other))
+    encoding.ttypes.TIEID._key = None
+    encoding.ttypes.TIEID.__hash__ = tie_id_hash
+    encoding.ttypes.TIEID.__eq__ = tie_id_eq
+    encoding.ttypes.TIEID.__lt__ = tie_id_lt
+    encoding.ttypes.TIEID.__repr__ = repr_without_cached_key
     encoding.ttypes.TIEHeader.__hash__ = (
         lambda self: hash(tie_header_tup(self)))
     encoding.ttypes.TIEHeader.__eq__ = (
@@ -77,30 +166,78 @@ def add_missing_methods_to_thrift():
     encoding.ttypes.LinkIDPair.__lt__ = (
         lambda self, other: link_id_pair_tup(self) < link_id_pair_tup(other))
 
+# Use the C-accelerated Thrift binary protocol (fastbinary) if it is available, and transparently
+# fall back to the pure Python Thrift binary protocol if it is not. Both produce exactly the same
+# encoding, and in both cases the unsigned integer fixes (see below) are applied to the packet
+# before it is encoded and after it is decoded.
+#
+# The fastbinary module being importable is not enough: the generated encoding code passes the
+# Thrift type specifications to fastbinary, and not all versions of the Thrift library accept the
+# type specifications generated by all versions of the Thrift compiler. So, we also check that a
+# sample packet is encoded identically by both protocols and that it can be decoded again.
+
+def accelerated_thrift_protocol_problem():
+    # Returns None if the accelerated protocol can be used, or a string describing the problem
+    if importlib.util.find_spec("thrift.protocol.fastbinary") is None:
+        return "fastbinary not available"
+    sample_protocol_packet = encoding.ttypes.ProtocolPacket(
+        header=encoding.ttypes.PacketHeader(sender=1, level=0),
+        content=encoding.ttypes.PacketContent(
+            lie=encoding.ttypes.LIEPacket(name="sample", local_id=1, flood_port=10001)))
+    encodings = []
+    # Thrift is prone to throw any unpredictable exception if the encode or decode fails,
+    # so disable pylint warning "No exception type(s) specified"
+    # pylint: disable=W0702
+    try:
+        for protocol_class in [thrift.protocol.TBinaryProtocol.TBinaryProtocol,
+                               thrift.protocol.TBinaryProtocol.TBinaryProtocolAccelerated]:
+            transport_out = thrift.transport.TTransport.TMemoryBuffer()
+            sample_protocol_packet.write(protocol_class(transport_out))
+            encodings.append(transport_out.getvalue())
+        transport_in = thrift.transport.TTransport.TMemoryBuffer(encodings[1])
+        decoded_protocol_packet = encoding.ttypes.ProtocolPacket()
+        decoded_protocol_packet.read(
+            thrift.protocol.TBinaryProtocol.TBinaryProtocolAccelerated(transport_in))
+    except:
+        return "fastbinary not compatible with generated encoding code"
+    if (encodings[0] != encodings[1]) or (decoded_protocol_packet != sample_protocol_packet):
+        return "fastbinary encoding not consistent"
+    return None
+
+def select_thrift_protocol(accelerated_problem):
+    # Returns the tuple (protocol class, codec description) to use, given the result of
+    # accelerated_thrift_protocol_problem
+    if accelerated_problem is None:
+        return (thrift.protocol.TBinaryProtocol.TBinaryProtocolAccelerated,
+                "Accelerated binary protocol (fastbinary)")
+    return (thrift.protocol.TBinaryProtocol.TBinaryProtocol,
+            "Pure Python binary protocol ({})".format(accelerated_problem))
+
+ACCELERATED_THRIFT_PROTOCOL_PROBLEM = accelerated_thrift_protocol_problem()
+
+(THRIFT_PROTOCOL_CLASS, THRIFT_CODEC) = select_thrift_protocol(ACCELERATED_THRIFT_PROTOCOL_PROBLEM)
+
 def encode_protocol_packet(protocol_packet):
     # Since Thrift does not support unsigned integer, we need to "fix" unsigned integers to be
     # encoded as signed integers.
-    # We have to make a deep copy of the non-encoded packet, but this "fixing" involves changing
-    # various fields in the non-encoded packet from the range (0...MAX_UNSIGNED_INT) to
-    # (MIN_SIGNED_INT...MAX_SIGNED_INT) for various sizes of integers.
-    # For the longest time, I tried to avoid making a deep copy of the non-encoded packets, at least
-    # for some of the packets. For transient messages (e.g. LIEs) that is easier than for persistent
-    # messages (e.g. TIE which are stored in the database, or TIDEs which are encoded once and sent
-    # multiple times). However, in the end this turned out to be impossible or at least a
-    # bountiful source of bugs, because transient messages contain direct or indirect references
-    # to persistent objects.
-    # So, I gave up, and now always do a deep copy of the message to be encoded.
-    fixed_protocol_packet = copy.deepcopy(protocol_packet)
-    fix_prot_packet_before_encode(fixed_protocol_packet)
+    # This "fixing" involves changing various fields in the non-encoded packet from the range
+    # (0...MAX_UNSIGNED_INT) to (MIN_SIGNED_INT...MAX_SIGNED_INT) for various sizes of integers.
+    # We must not change the non-encoded packet itself: transient messages (e.g. LIEs) contain
+    # direct or indirect references to persistent objects (e.g. TIEs which are stored in the
+    # database, or TIDEs which are encoded once and sent multiple times). For the longest time,
+    # we made a deep copy of the entire packet before fixing it, but that is expensive. Instead, the
+    # compiled encode fixer (see compile_struct_fix below) returns a fixed copy of only those parts
+    # of the packet that actually contain fields that need fixing, and shares the rest.
+    fixed_protocol_packet = PROTOCOL_PACKET_ENCODE_FIXER(protocol_packet)
     transport_out = thrift.transport.TTransport.TMemoryBuffer()
-    protocol_out = thrift.protocol.TBinaryProtocol.TBinaryProtocol(transport_out)
+    protocol_out = THRIFT_PROTOCOL_CLASS(transport_out)
     fixed_protocol_packet.write(protocol_out)
     encoded_protocol_packet = transport_out.getvalue()
     return encoded_protocol_packet
 
 def decode_protocol_packet(encoded_protocol_packet):
     transport_in = thrift.transport.TTransport.TMemoryBuffer(encoded_protocol_packet)
-    protocol_in = thrift.protocol.TBinaryProtocol.TBinaryProtocol(transport_in)
+    protocol_in = THRIFT_PROTOCOL_CLASS(transport_in)
     protocol_packet = encoding.ttypes.ProtocolPacket()
     # Thrift is prone to throw any unpredictable exception if the decode fails,
     # so disable pylint warning "No exception type(s) specified"
@@ -110,9 +247,60 @@ def decode_protocol_packet(encoded_protocol_packet):
     except:
         # Decoding error
         return None
-    fix_prot_packet_after_decode(protocol_packet)
+    PROTOCOL_PACKET_DECODE_FIXER(protocol_packet)
     return protocol_packet
 
+# The name of each field in PacketContent, indexed by Thrift field id
+PACKET_CONTENT_FIELD_NAMES = {field_spec[0]: field_spec[2]
+                              for field_spec in encoding.ttypes.PacketContent.thrift_spec
+                              if field_spec is not None}
+
+def decode_protocol_packet_header(encoded_protocol_packet):
+    # This is the first stage of a two-stage decode of a received protocol packet. It only decodes
+    # the packet header, and it determines the type of the packet content (i.e. the name of the
+    # first field that is present in the PacketContent: "lie", "tide", "tire", or "tie") without
+    # decoding the content itself. This is sufficient to cheaply reject packets that we are going
+    # to ignore anyway (e.g. our own looped packets) before the entire packet is decoded (the second
+    # stage) using decode_protocol_packet.
+    # Returns a tuple (packet_header, content_type) where content_type is None if the packet has no
+    # content, or returns None if the packet header could not be decoded.
+    transport_in = thrift.transport.TTransport.TMemoryBuffer(encoded_protocol_packet)
+    protocol_in = THRIFT_PROTOCOL_CLASS(transport_in)
+    packet_header = None
+    content_type = None
+    content_seen = False
+    # Thrift is prone to throw any unpredictable exception if the decode fails,
+    # so disable pylint warning "No exception type(s) specified"
+    # pylint: disable=W0702
+    try:
+        protocol_in.readStructBegin()
+        while (packet_header is None) or (not content_seen):
+            (_, field_type, field_id) = protocol_in.readFieldBegin()
+            if field_type == thrift.Thrift.TType.STOP:
+                break
+            if (field_id == 1) and (field_type == thrift.Thrift.TType.STRUCT):
+                packet_header = encoding.ttypes.PacketHeader()
+                packet_header.read(protocol_in)
+            elif (field_id == 2) and (field_type == thrift.Thrift.TType.STRUCT):
+                content_seen = True
+                protocol_in.readStructBegin()
+                (_, content_field_type, content_field_id) = protocol_in.readFieldBegin()
+                if content_field_type != thrift.Thrift.TType.STOP:
+                    content_type = PACKET_CONTENT_FIELD_NAMES.get(content_field_id)
+                    if packet_header is None:
+                        # The content came before the header; skip over the rest of the content
+                        protocol_in.skip(content_field_type)
+                        protocol_in.skip(thrift.Thrift.TType.STRUCT)
+            else:
+                protocol_in.skip(field_type)
+    except:
+        # Decoding error
+        return None
+    if packet_header is None:
+        return None
+    PACKET_HEADER_DECODE_FIXER(packet_header)
+    return (packet_header, content_type)
+
 # What follows are some horrible hacks to deal with the fact that Thrift only support signed 8, 16,
 # 32, and 64 bit numbers and not unsigned 8, 16, 32, and 64 bit numbers. The RIFT specification has
 # several fields are intended to contain an unsigned numbers, but that are actually specified in the
@@ -340,6 +528,84 @@ def fix_prot_packet_before_encode(protocol_packet):
 def fix_prot_packet_after_decode(protocol_packet):
     fix_packet_after_decode(protocol_packet, PROTOCOL_PACKET_FIXES)
 
+# The fix_... functions above interpret the fixes specification for every field of every packet
+# that is encoded or decoded, and they fix the packet in place (which is why the packet used to be
+# deep-copied before encoding). The compile_... functions below interpret the fixes specification
+# only once, and return a tree of specialized fixer functions (one struct fixer for each type of
+# struct in the specification, e.g. one for LIE packets, one for TIE headers, etc.)
+#
+# An encode fixer never modifies the value it is given. It returns a shallow copy of each struct
+# that has fields that need fixing, with the fixed values filled in, and shares all other values
+# with the original. A decode fixer fixes the freshly decoded struct in place.
+
+ENCODE_INT_FIXERS = {8: u8_to_s8, 16: u16_to_s16, 32: u32_to_s32, 64: u64_to_s64}
+
+DECODE_INT_FIXERS = {8: s8_to_u8, 16: s16_to_u16, 32: s32_to_u32, 64: s64_to_u64}
+
+def compile_fix(fix, encode):
+    if isinstance(fix, int):
+        if encode:
+            element_fixer = ENCODE_INT_FIXERS[fix]
+        else:
+            element_fixer = DECODE_INT_FIXERS[fix]
+    elif isinstance(fix, tuple):
+        element_fixer = compile_dict_fix(fix, encode)
+    elif isinstance(fix, list):
+        element_fixer = compile_struct_fix(fix, encode)
+    else:
+        assert False
+    # The fixes specification does not say whether a field is a container (set or list) of values
+    # or a single value, so that still needs to be checked each time.
+    def value_fixer(value):
+        if isinstance(value, list):
+            return [element_fixer(element) for element in value]
+        if isinstance(value, set):
+            return {element_fixer(element) for element in value}
+        return element_fixer(value)
+    return value_fixer
+
+def compile_dict_fix(dict_fixes, encode):
+    (key_fixes, value_fixes) = dict_fixes
+    key_fixer = compile_fix(key_fixes, encode)
+    value_fixer = compile_fix(value_fixes, encode)
+    def dict_fixer(old_dict):
+        return {key_fixer(key): value_fixer(value) for key, value in old_dict.items()}
+    return dict_fixer
+
+def compile_struct_fix(fixes, encode):
+    field_fixers = [(field_name, compile_fix(field_fix, encode)) for field_name, field_fix in fixes]
+    if encode:
+        def encode_struct_fixer(struct):
+            struct_class = struct.__class__
+            fixed_struct = struct_class.__new__(struct_class)
+            fixed_struct_vars = vars(fixed_struct)
+            fixed_struct_vars.update(vars(struct))
+            for field_name, field_fixer in field_fixers:
+                field_value = fixed_struct_vars.get(field_name)
+                if field_value is not None:
+                    fixed_struct_vars[field_name] = field_fixer(field_value)
+            return fixed_struct
+        return encode_struct_fixer
+    else:
+        def decode_struct_fixer(struct):
+            struct_vars = vars(struct)
+            for field_name, field_fixer in field_fixers:
+                field_value = struct_vars.get(field_name)
+                if field_value is not None:
+                    struct_vars[field_name] = field_fixer(field_value)
+            return struct
+        return decode_struct_fixer
+
+# The compiled fixers are module constants, even though their values are functions (which pylint
+# expects to be named in snake_case)
+# pylint: disable=invalid-name
+PROTOCOL_PACKET_ENCODE_FIXER = compile_struct_fix(PROTOCOL_PACKET_FIXES, True)
+
+PROTOCOL_PACKET_DECODE_FIXER = compile_struct_fix(PROTOCOL_PACKET_FIXES, False)
+
+PACKET_HEADER_DECODE_FIXER = compile_struct_fix(dict(PROTOCOL_PACKET_FIXES)['header'], False)
+# pylint: enable=invalid-name
+
 def make_tie_id(direction, originator, tie_type, tie_nr):
     tie_id = encoding.ttypes.TIEID(
         direction=direction,
@@ -439,6 +705,50 @@ def make_tide_packet(start_range, end_range):
 def add_tie_header_to_tide(tide_packet, tie_header):
     tide_packet.headers.append(tie_header)
 
+# The size of an IPv6 header plus a UDP header. The UDP payload that fits in the MTU of an interface
+# is at least the MTU minus this (IPv4 headers are smaller than IPv6 headers).
+IP_AND_UDP_HEADERS_SIZE = 48
+
+def encoded_tide_sizes():
+    # Returns the encoded size of a protocol packet containing a TIDE without any TIE headers, the
+    # encoded size of each TIE header in the TIDE without any optional fields, and the additional
+    # encoded size of each of the optional fields origination_time and origination_lifetime. The
+    # binary protocol encodes integers with a fixed size, so these sizes don't depend on the values.
+    max_tie_id = make_tie_id(common.ttypes.TieDirectionType.North, MAX_U64,
+                             common.ttypes.TIETypeType.KeyValueTIEType, MAX_U32)
+    tide_packet = make_tide_packet(max_tie_id, max_tie_id)
+    protocol_packet = encoding.ttypes.ProtocolPacket(
+        header=encoding.ttypes.PacketHeader(sender=MAX_U64, level=0),
+        content=encoding.ttypes.PacketContent(tide=tide_packet))
+    sizes = [len(encode_protocol_packet(protocol_packet))]
+    tie_header = encoding.ttypes.TIEHeader(tieid=max_tie_id, seq_nr=MAX_U32,
+                                           remaining_lifetime=MAX_U32)
+    add_tie_header_to_tide(tide_packet, tie_header)
+    sizes.append(len(encode_protocol_packet(protocol_packet)))
+    tie_header.origination_time = common.ttypes.IEEE802_1ASTimeStampType(AS_sec=MAX_U64,
+                                                                         AS_nsec=MAX_U32)
+    sizes.append(len(encode_protocol_packet(protocol_packet)))
+    tie_header.origination_lifetime = MAX_U32
+    sizes.append(len(encode_protocol_packet(protocol_packet)))
+    return (sizes[0], sizes[1] - sizes[0], sizes[2] - sizes[1], sizes[3] - sizes[2])
+
+(TIDE_OVERHEAD_SIZE, TIDE_TIE_HEADER_SIZE, TIDE_ORIGINATION_TIME_SIZE,
+ TIDE_ORIGINATION_LIFETIME_SIZE) = encoded_tide_sizes()
+
+def tide_tie_header_size(tie_header):
+    # The encoded size of a TIE header in a TIDE
+    size = TIDE_TIE_HEADER_SIZE
+    if tie_header.origination_time is not None:
+        size += TIDE_ORIGINATION_TIME_SIZE
+    if tie_header.origination_lifetime is not None:
+        size += TIDE_ORIGINATION_LIFETIME_SIZE
+    return size
+
+def tide_headers_max_size(mtu):
+    # The maximum total encoded size of the TIE headers in a TIDE, such that the TIDE fits in a
+    # single UDP packet on an interface with the given MTU.
+    return mtu - IP_AND_UDP_HEADERS_SIZE - TIDE_OVERHEAD_SIZE
+
 def make_tire_packet():
     tire_packet = encoding.ttypes.TIREPacket(headers=set())
     return tire_packet
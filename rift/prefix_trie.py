@@ -0,0 +1,144 @@
+class _TrieNode:
+
+    __slots__ = ['address', 'prefixlen', 'value', 'children']
+
+    def __init__(self, address, prefixlen, value):
+        self.address = address
+        self.prefixlen = prefixlen
+        # The value stored for this prefix, or None for a glue node (a node which only exists to
+        # branch into its two children)
+        self.value = value
+        self.children = [None, None]
+
+class PrefixTrie:
+
+    # A path-compressed binary (Patricia) trie of prefixes for a single address family, which
+    # supports longest prefix match lookups. Addresses are represented as unsigned integers of
+    # address_bits bits (32 for IPv4 and 128 for IPv6), and prefixes as (address, prefixlen) tuples.
+    # The root node is always present and represents the default route (prefix length zero). Every
+    # other node has either a value or two children, so the depth of the trie is bounded by the
+    # number of prefixes on the path instead of by the number of bits in the address.
+
+    def __init__(self, address_bits):
+        self._address_bits = address_bits
+        self._root = _TrieNode(0, 0, None)
+        self._nr_values = 0
+
+    def _mask(self, address, prefixlen):
+        host_bits = self._address_bits - prefixlen
+        return (address >> host_bits) << host_bits
+
+    def _bit(self, address, position):
+        # The bit at the given position, counting from the most significant bit (position 0)
+        return (address >> (self._address_bits - 1 - position)) & 1
+
+    def _common_prefixlen(self, address_1, address_2):
+        return self._address_bits - (address_1 ^ address_2).bit_length()
+
+    def _covers(self, node, address):
+        # Is the address covered by the prefix of the node?
+        return (node.address ^ address) >> (self._address_bits - node.prefixlen) == 0
+
+    def put(self, address, prefixlen, value):
+        assert value is not None
+        assert 0 <= prefixlen <= self._address_bits
+        address = self._mask(address, prefixlen)
+        node = self._root
+        while True:
+            if node.prefixlen == prefixlen:
+                # The prefix is already in the trie (possibly as a glue node); replace the value.
+                if node.value is None:
+                    self._nr_values += 1
+                node.value = value
+                return
+            bit = self._bit(address, node.prefixlen)
+            child = node.children[bit]
+            if child is None:
+                # No more specific prefixes in this direction. Add a leaf.
+                node.children[bit] = _TrieNode(address, prefixlen, value)
+                self._nr_values += 1
+                return
+            common = min(child.prefixlen, prefixlen,
+                         self._common_prefixlen(child.address, address))
+            if common == child.prefixlen:
+                # The child covers the prefix; descend.
+                node = child
+                continue
+            new_node = _TrieNode(address, prefixlen, value)
+            self._nr_values += 1
+            if common == prefixlen:
+                # The prefix covers the child; insert the new node between the node and the child.
+                new_node.children[self._bit(child.address, prefixlen)] = child
+                node.children[bit] = new_node
+            else:
+                # The prefix and the child diverge; insert a glue node where they diverge.
+                glue = _TrieNode(self._mask(address, common), common, None)
+                glue.children[self._bit(address, common)] = new_node
+                glue.children[self._bit(child.address, common)] = child
+                node.children[bit] = glue
+            return
+
+    def get(self, address, prefixlen):
+        # Exact match. Returns None if the prefix is not in the trie.
+        address = self._mask(address, prefixlen)
+        node = self._root
+        while node is not None and node.prefixlen < prefixlen:
+            node = node.children[self._bit(address, node.prefixlen)]
+            if node is not None and not self._covers(node, address):
+                return None
+        if node is None or node.prefixlen != prefixlen:
+            return None
+        return node.value
+
+    def delete(self, address, prefixlen):
+        # Returns True if the prefix was present in the trie and False if not.
+        address = self._mask(address, prefixlen)
+        grandparent = None
+        parent = None
+        node = self._root
+        while node.prefixlen < prefixlen:
+            grandparent = parent
+            parent = node
+            node = node.children[self._bit(address, node.prefixlen)]
+            if node is None or not self._covers(node, address):
+                return False
+        if node.prefixlen != prefixlen or node.value is None:
+            return False
+        node.value = None
+        self._nr_values -= 1
+        if parent is None:
+            # The root node (default route) stays in the trie, even without a value
+            return True
+        # A node without a value is only kept if it branches into two children
+        self._splice_if_redundant(parent, node)
+        # Removing a leaf may leave its parent as a glue node with a single child
+        if grandparent is not None and parent.value is None:
+            self._splice_if_redundant(grandparent, parent)
+        return True
+
+    def _splice_if_redundant(self, parent, node):
+        # Replace a node without a value by its only child (or by nothing if it has no children)
+        if node.children[0] is not None and node.children[1] is not None:
+            return
+        if node.children[0] is not None:
+            only_child = node.children[0]
+        else:
+            only_child = node.children[1]
+        parent.children[self._bit(node.address, parent.prefixlen)] = only_child
+
+    def lookup(self, address):
+        # Longest prefix match. Returns the value of the most specific prefix which covers the
+        # address, or None if there is no such prefix.
+        best = self._root.value
+        node = self._root
+        address_bits = self._address_bits
+        while node.prefixlen < address_bits:
+            node = node.children[(address >> (address_bits - 1 - node.prefixlen)) & 1]
+            if node is None or (node.address ^ address) >> (address_bits - node.prefixlen):
+                break
+            if node.value is not None:
+                best = node.value
+        return best
+
+    def __len__(self):
+        return self._nr_values
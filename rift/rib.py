@@ -1,3 +1,5 @@
+import logging
+
 import sortedcontainers
 
 import packet_common
@@ -11,12 +13,17 @@ class RouteTable:
         self.address_family = address_family
         # Sorted dict of _Destination objects indexed by prefix
         self.destinations = sortedcontainers.SortedDict()
+        # Dict of Route objects indexed by prefix, for each owner (indexed by owner)
+        self._owner_routes = {}
+        # Set of owners whose routes were marked stale and not yet swept by del_stale_routes
+        self._stale_owners = set()
+        self._nr_routes = 0
         self.fib = fib
         self._log = log
         self._log_id = log_id
 
     def debug(self, msg, *args):
-        if self._log:
+        if self._log and self._log.isEnabledFor(logging.DEBUG):
             self._log.debug("[%s] %s" % (self._log_id, msg), *args)
 
     def get_route(self, prefix, owner):
@@ -37,6 +44,13 @@ class RouteTable:
             destination = _Destination(prefix)
             self.destinations[prefix] = destination
         destination.put_route(rte, self.fib)
+        owner_routes = self._owner_routes.get(rte.owner)
+        if owner_routes is None:
+            owner_routes = {}
+            self._owner_routes[rte.owner] = owner_routes
+        if prefix not in owner_routes:
+            self._nr_routes += 1
+        owner_routes[prefix] = rte
 
     def del_route(self, prefix, owner):
         # Returns True if the route was present in the table and False if not.
@@ -49,6 +63,8 @@ class RouteTable:
         else:
             deleted = False
         if deleted:
+            del self._owner_routes[owner][prefix]
+            self._nr_routes -= 1
             self.debug("Delete %s", prefix)
         else:
             self.debug("Attempted delete %s (not present)", prefix)
@@ -59,6 +75,11 @@ class RouteTable:
             for rte in destination.routes:
                 yield rte
 
+    def all_owner_routes(self, owner):
+        owner_routes = self._owner_routes.get(owner)
+        if owner_routes is not None:
+            yield from owner_routes.values()
+
     def all_prefix_routes(self, prefix):
         packet_common.assert_prefix_address_family(prefix, self.address_family)
         if prefix in self.destinations:
@@ -75,22 +96,24 @@ class RouteTable:
 
     def mark_owner_routes_stale(self, owner):
         # Mark all routes of a given owner as stale. Returns number of routes marked.
-        # A possible more efficient implementation is to have a list of routes for each owner.
-        # For now, this is good enough.
         count = 0
-        for rte in self.all_routes():
-            if rte.owner == owner:
-                rte.stale = True
-                count += 1
+        for rte in self.all_owner_routes(owner):
+            rte.stale = True
+            count += 1
+        if count > 0:
+            self._stale_owners.add(owner)
         return count
 
     def del_stale_routes(self):
-        # Delete all routes still marked as stale. Returns number of deleted routes.
+        # Delete all routes still marked as stale. Returns number of deleted routes. Only the routes
+        # of the owners whose routes were marked stale are visited.
         # Cannot delete routes while iterating over routes, so prepare a delete list
         routes_to_delete = []
-        for rte in self.all_routes():
-            if rte.stale:
-                routes_to_delete.append((rte.prefix, rte.owner))
+        for owner in self._stale_owners:
+            for rte in self.all_owner_routes(owner):
+                if rte.stale:
+                    routes_to_delete.append((rte.prefix, rte.owner))
+        self._stale_owners = set()
         # Now delete the routes in the prepared list
         count = len(routes_to_delete)
         if count > 0:
@@ -103,10 +126,13 @@ class RouteTable:
         return len(self.destinations)
 
     def nr_routes(self):
-        count = 0
-        for destination in self.destinations.values():
-            count += len(destination.routes)
-        return count
+        return self._nr_routes
+
+    def nr_owner_routes(self, owner):
+        owner_routes = self._owner_routes.get(owner)
+        if owner_routes is None:
+            return 0
+        return len(owner_routes)
 
 class _Destination:
 
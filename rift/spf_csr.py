@@ -0,0 +1,86 @@
+import array
+import heapq
+
+# Cost of a node which has not been reached (yet)
+UNREACHED = -1
+
+class CSRGraph:
+
+    # A compressed sparse row (CSR) representation of the SPF graph in one SPF direction, for the
+    # array-backed SPF engine. The edges of all nodes are stored in two flat arrays (neighbor index
+    # and cost), and the edges of the node with index i are at positions offsets[i] up to (but not
+    # including) offsets[i+1]. Nodes are identified by their index in the SPF graph. The CSR graph
+    # is a snapshot of the SPF graph: it must be rebuilt when the version of the SPF graph changes.
+    #
+    # A node may report the same neighbor more than once (e.g. in different node TIEs). Only the
+    # cheapest of these parallel edges is stored, so that Dijkstra does not record the node more
+    # than once as a predecessor of the neighbor.
+
+    def __init__(self, spf_graph, spf_direction):
+        self.version = spf_graph.version
+        self.offsets = array.array('l', [0])
+        self.targets = array.array('l')
+        self.costs = array.array('q')
+        # Does the node have node TIEs in the direction used by the SPF (1) or not (0)?
+        self.present = bytearray()
+        # Deriving the edges of a node may assign indexes to new neighbor nodes, so the number of
+        # nodes can grow while we are building the arrays.
+        index = 0
+        while index < spf_graph.nr_nodes():
+            edges = spf_graph.edges(spf_direction, index)
+            if edges is None:
+                self.present.append(0)
+            else:
+                self.present.append(1)
+                nbr_costs = {}
+                for (nbr_index, cost, _interface_ids) in edges:
+                    if nbr_index not in nbr_costs or cost < nbr_costs[nbr_index]:
+                        nbr_costs[nbr_index] = cost
+                for (nbr_index, cost) in nbr_costs.items():
+                    self.targets.append(nbr_index)
+                    self.costs.append(cost)
+            self.offsets.append(len(self.targets))
+            index += 1
+        self.nr_nodes = index
+
+def shortest_paths(csr_graph, root_index):
+    # Run Dijkstra from the given root node over the CSR graph. Returns a tuple (costs,
+    # predecessors, order): the cost of the best path to each node (UNREACHED if there is no path),
+    # the list of predecessor indexes on the (ECMP) best paths to each node (None if there is no
+    # path), and the list of the reached nodes in the order in which their best path was
+    # determined.
+    nr_nodes = csr_graph.nr_nodes
+    present = csr_graph.present
+    costs = array.array('q', [UNREACHED]) * nr_nodes
+    predecessors = [None] * nr_nodes
+    done = bytearray(nr_nodes)
+    order = []
+    costs[root_index] = 0
+    predecessors[root_index] = []
+    heap = [(0, root_index)]
+    while heap:
+        (cost, index) = heapq.heappop(heap)
+        # Skip stale heap entries (lazy deletion)
+        if done[index]:
+            continue
+        done[index] = 1
+        order.append(index)
+        if present[index]:
+            relax_edges(csr_graph, index, cost, costs, predecessors, heap)
+    return (costs, predecessors, order)
+
+def relax_edges(csr_graph, index, cost, costs, predecessors, heap):
+    # Consider the paths via the node with the given index (whose best path has the given cost) to
+    # each of its neighbors: record a better path or an additional ECMP path.
+    targets = csr_graph.targets
+    edge_costs = csr_graph.costs
+    for position in range(csr_graph.offsets[index], csr_graph.offsets[index + 1]):
+        nbr_index = targets[position]
+        nbr_cost = cost + edge_costs[position]
+        old_cost = costs[nbr_index]
+        if old_cost == UNREACHED or nbr_cost < old_cost:
+            costs[nbr_index] = nbr_cost
+            predecessors[nbr_index] = [index]
+            heapq.heappush(heap, (nbr_cost, nbr_index))
+        elif nbr_cost == old_cost:
+            predecessors[nbr_index].append(index)
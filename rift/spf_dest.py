@@ -1,3 +1,5 @@
+import heapq
+
 import packet_common
 import utils
 
@@ -101,3 +103,104 @@ class SPFDest:
             tags_str,
             [str(next_hop) for next_hop in sorted(self.next_hops)]
         ]
+
+class SPFCandidates:
+
+    # The destinations of a single (full) SPF run. Each destination (node or prefix) is identified
+    # by a dense integer id, and the state of the destination is kept in lists indexed by that id
+    # instead of in an SPFDest object. SPFDest objects are only created for the results of the run
+    # (see make_destination), not for every candidate path that is considered.
+    #
+    # The candidate priority queue is a heapq of (cost, id) tuples. Module heapq does not support
+    # decreasing the priority of an element; instead we push a new entry when a better path to a
+    # destination is found and skip the stale entry when it is popped (lazy deletion).
+
+    def __init__(self):
+        self.ids = {}              # Destination id indexed by key (system-id or prefix)
+        self.keys = []             # Key of the destination indexed by id
+        self.names = []            # Name of the node (None for prefixes) indexed by id
+        self.costs = []            # Cost of best-known path indexed by id
+        self.best = []             # Has the best path been determined, indexed by id
+        self.predecessors = []     # List of predecessor system-ids indexed by id
+        self.next_hops = []        # List of next-hops indexed by id
+        self.tags = []             # Prefix tags (None for nodes) indexed by id
+        self._heap = []            # Heap of (cost, id), may contain stale entries
+
+    def add_root(self, system_id, name):
+        # Add the node which runs the SPF, with cost zero and without predecessors or next-hops
+        self.consider(system_id, 0, None, [], None)
+        self.names[0] = name
+        self.predecessors[0] = []
+
+    def consider(self, key, cost, predecessor_system_id, next_hops, tags):
+        # We have found a feasible path to the destination; is it the best path?
+        dest_id = self.ids.get(key)
+        if dest_id is None:
+            # We did not have any previous path to the destination. Add it.
+            dest_id = len(self.keys)
+            self.ids[key] = dest_id
+            self.keys.append(key)
+            self.names.append(None)
+            self.costs.append(cost)
+            self.best.append(False)
+            self.predecessors.append([predecessor_system_id])
+            self.next_hops.append(unique_next_hops(next_hops))
+            self.tags.append(tags)
+            heapq.heappush(self._heap, (cost, dest_id))
+            return
+        old_cost = self.costs[dest_id]
+        if cost < old_cost:
+            # The new path is strictly better than the existing path. Replace the existing path
+            # with the new path.
+            self.costs[dest_id] = cost
+            self.predecessors[dest_id] = [predecessor_system_id]
+            self.next_hops[dest_id] = unique_next_hops(next_hops)
+            self.tags[dest_id] = tags
+            heapq.heappush(self._heap, (cost, dest_id))
+        elif cost == old_cost:
+            # The new path is equal cost to the existing path. Add an ECMP path to the existing
+            # path.
+            self.predecessors[dest_id].append(predecessor_system_id)
+            dest_next_hops = self.next_hops[dest_id]
+            for next_hop in next_hops:
+                if next_hop not in dest_next_hops:
+                    dest_next_hops.append(next_hop)
+            if tags is not None:
+                old_tags = self.tags[dest_id]
+                if old_tags is None:
+                    self.tags[dest_id] = set(tags)
+                else:
+                    self.tags[dest_id] = old_tags.union(tags)
+
+    def pop(self):
+        # Remove the destination with the lowest cost from the candidates, mark that we now have
+        # the best path to it, and return its id. Return None if there are no more candidates.
+        heap = self._heap
+        best = self.best
+        while heap:
+            (_cost, dest_id) = heapq.heappop(heap)
+            # A stale entry for a destination for which we already have a best path (which has a
+            # strictly lower cost than the stale entry)
+            if best[dest_id]:
+                continue
+            best[dest_id] = True
+            return dest_id
+        return None
+
+    def make_destination(self, dest_id):
+        key = self.keys[dest_id]
+        if isinstance(key, int):
+            destination = make_node_destination(key, self.names[dest_id], self.costs[dest_id])
+        else:
+            destination = make_prefix_destintation(key, self.tags[dest_id], self.costs[dest_id])
+        destination.best = self.best[dest_id]
+        destination.predecessors = self.predecessors[dest_id]
+        destination.next_hops = self.next_hops[dest_id]
+        return destination
+
+def unique_next_hops(next_hops):
+    result = []
+    for next_hop in next_hops:
+        if next_hop not in result:
+            result.append(next_hop)
+    return result
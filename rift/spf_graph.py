@@ -0,0 +1,174 @@
+import constants
+
+def node_neighbors(node_ties, neighbor_direction):
+    # A generator that yields (nbr_system_id, nbr_tie_element) tuples for all neighbors in the
+    # specified direction of the nodes in the node_ties list.
+    for node_tie in node_ties:
+        node_level = node_tie.element.node.level
+        for nbr_system_id, nbr_tie_element in node_tie.element.node.neighbors.items():
+            nbr_level = nbr_tie_element.level
+            if neighbor_direction == constants.DIR_SOUTH:
+                correct_direction = (nbr_level < node_level)
+            elif neighbor_direction == constants.DIR_NORTH:
+                correct_direction = (nbr_level > node_level)
+            elif neighbor_direction == constants.DIR_EAST_WEST:
+                correct_direction = (nbr_level == node_level)
+            else:
+                assert False
+            if correct_direction:
+                yield (nbr_system_id, nbr_tie_element)
+
+def link_id_pairs(nbr_tie_element):
+    # The set of (local_id, remote_id) tuples of the link-ids of a neighbor
+    return set((link_id_pair.local_id, link_id_pair.remote_id)
+               for link_id_pair in nbr_tie_element.link_ids)
+
+def reverse_link_id_pairs(nbr_tie_element):
+    # The set of (remote_id, local_id) tuples of the link-ids of a neighbor
+    return set((link_id_pair.remote_id, link_id_pair.local_id)
+               for link_id_pair in nbr_tie_element.link_ids)
+
+class SPFGraph:
+
+    # The graph of nodes and bi-directional adjacencies on which the SPF runs, for both SPF
+    # directions. It is derived from the node TIEs in the TIE-DB, and it is updated incrementally:
+    # when a node TIE is added, changed, or removed the nodes whose edges may be affected are
+    # marked dirty, and the edges of a dirty node are re-derived from its node TIEs when the SPF
+    # in that direction visits the node. Nodes which are not reachable are never re-derived.
+    #
+    # Nodes are identified by a dense integer index (assigned when a system-id is first seen), and
+    # the edges of a node are a plain list of (neighbor index, cost, next-hop interface-ids)
+    # tuples. The next-hop interface-ids are the local link-ids of the adjacency; they are only
+    # used for the edges of the node running the SPF.
+
+    def __init__(self, node_ties_function, use_tie_direction_function):
+        # Function (direction, system_id) which returns the node TIEs of a node
+        self._node_ties = node_ties_function
+        # Function (system_id, spf_direction) which returns the direction of the node TIEs that
+        # the SPF in the given direction uses for the given node
+        self._use_tie_direction = use_tie_direction_function
+        self._node_indexes = {}      # Node index indexed by system-id
+        self._system_ids = []        # System-id indexed by node index
+        self._names = {}             # Per SPF direction: node name indexed by node index
+        self._edges = {}             # Per SPF direction: list of edges indexed by node index
+        self._reported_nbrs = {}     # Per SPF direction: set of indexes of the neighbors reported
+                                     # by a node, indexed by node index
+        self._reporting_nodes = {}   # Per SPF direction: set of indexes of the nodes which report
+                                     # the node as a neighbor, indexed by node index
+        self._dirty = {}             # Per SPF direction: set of indexes of dirty nodes
+        self.version = 0             # Incremented whenever nodes are marked dirty
+        for spf_direction in [constants.DIR_SOUTH, constants.DIR_NORTH]:
+            self._names[spf_direction] = []
+            self._edges[spf_direction] = []
+            self._reported_nbrs[spf_direction] = {}
+            self._reporting_nodes[spf_direction] = {}
+            self._dirty[spf_direction] = set()
+
+    def node_index(self, system_id):
+        # Return the index of the node with the given system-id, assigning one if needed
+        index = self._node_indexes.get(system_id)
+        if index is None:
+            index = len(self._system_ids)
+            self._node_indexes[system_id] = index
+            self._system_ids.append(system_id)
+            for spf_direction in [constants.DIR_SOUTH, constants.DIR_NORTH]:
+                self._names[spf_direction].append(None)
+                self._edges[spf_direction].append(None)
+        return index
+
+    def nr_nodes(self):
+        return len(self._system_ids)
+
+    def system_id(self, index):
+        return self._system_ids[index]
+
+    def name(self, spf_direction, index):
+        return self._names[spf_direction][index]
+
+    def edges(self, spf_direction, index):
+        # Return the list of (neighbor index, cost, next-hop interface-ids) tuples of the
+        # bi-directional adjacencies of the node in the given SPF direction, or None if the SPF in
+        # that direction has no node TIEs for the node.
+        if index in self._dirty[spf_direction]:
+            self.update_node(spf_direction, index)
+        return self._edges[spf_direction][index]
+
+    def node_tie_changed(self, tie_id):
+        # A node TIE was added, changed, or removed. The edges of the originator are derived from
+        # its node TIEs in the direction used by the SPF. The bi-directional check of the edges
+        # towards the originator uses the originator's node TIEs in the reverse SPF direction.
+        originator = tie_id.originator
+        index = self.node_index(originator)
+        self.version += 1
+        for spf_direction in [constants.DIR_SOUTH, constants.DIR_NORTH]:
+            dirty = self._dirty[spf_direction]
+            if tie_id.direction == self._use_tie_direction(originator, spf_direction):
+                dirty.add(index)
+            if tie_id.direction == constants.reverse_dir(spf_direction):
+                dirty.update(self._reporting_nodes[spf_direction].get(index, ()))
+
+    def mark_all_dirty(self):
+        self.version += 1
+        for spf_direction in [constants.DIR_SOUTH, constants.DIR_NORTH]:
+            self._dirty[spf_direction].update(range(len(self._system_ids)))
+
+    def update_node(self, spf_direction, index):
+        # Re-derive the edges of a dirty node from its node TIEs
+        self._dirty[spf_direction].discard(index)
+        system_id = self._system_ids[index]
+        reported_nbrs = self._reported_nbrs[spf_direction]
+        reporting_nodes = self._reporting_nodes[spf_direction]
+        for nbr_index in reported_nbrs.pop(index, ()):
+            nbr_reporting_nodes = reporting_nodes[nbr_index]
+            nbr_reporting_nodes.discard(index)
+            if not nbr_reporting_nodes:
+                del reporting_nodes[nbr_index]
+        node_ties = self._node_ties(self._use_tie_direction(system_id, spf_direction), system_id)
+        if node_ties == []:
+            self._names[spf_direction][index] = None
+            self._edges[spf_direction][index] = None
+            return
+        # The name of the node is taken from the first node TIE
+        self._names[spf_direction][index] = node_ties[0].element.node.name
+        edges = []
+        nbr_indexes = set()
+        for nbr_system_id, nbr_tie_element in node_neighbors(node_ties, spf_direction):
+            nbr_index = self.node_index(nbr_system_id)
+            nbr_indexes.add(nbr_index)
+            # Only keep bi-directional adjacencies.
+            if self.is_neighbor_bidirectional(system_id, nbr_system_id, nbr_tie_element,
+                                              spf_direction):
+                interface_ids = tuple(link_id_pair.local_id
+                                      for link_id_pair in nbr_tie_element.link_ids)
+                edges.append((nbr_index, nbr_tie_element.cost, interface_ids))
+        self._edges[spf_direction][index] = edges
+        if nbr_indexes:
+            reported_nbrs[index] = nbr_indexes
+            for nbr_index in nbr_indexes:
+                if nbr_index in reporting_nodes:
+                    reporting_nodes[nbr_index].add(index)
+                else:
+                    reporting_nodes[nbr_index] = set([index])
+
+    def is_neighbor_bidirectional(self, visit_system_id, nbr_system_id, nbr_tie_element,
+                                  spf_direction):
+        # Locate the Node-TIE(s) of the neighbor node in the desired direction. If we can't find
+        # the neighbor's Node-TIE(s), we declare the adjacency to be not bi-directional.
+        reverse_direction = constants.reverse_dir(spf_direction)
+        nbr_node_ties = self._node_ties(reverse_direction, nbr_system_id)
+        if nbr_node_ties == []:
+            return False
+        # Check for bi-directional connectivity: the neighbor must report the visited node
+        # as an adjacency with the same link-id pair (in reverse).
+        link_ids = reverse_link_id_pairs(nbr_tie_element)
+        for nbr_nbr_system_id, nbr_nbr_tie_element in node_neighbors(nbr_node_ties,
+                                                                     reverse_direction):
+            # Does the neighbor report the visited node as its neighbor?
+            if nbr_nbr_system_id != visit_system_id:
+                continue
+            # Are the link_ids bidirectional?
+            if link_ids.isdisjoint(link_id_pairs(nbr_nbr_tie_element)):
+                continue
+            # Yes, connectivity is bidirectional
+            return True
+        return False
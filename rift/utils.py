@@ -16,3 +16,19 @@ def system_id_str(system_id):
         return "{:d}".format(system_id)
     else:
         return "{:016x}".format(system_id)
+
+class LazyFormat:
+    # Defers calling a string formatting function until the string is actually needed. Pass an
+    # instance of this class as an argument to a logging call instead of an already formatted
+    # string: the logging module only converts its arguments to strings if the message is actually
+    # emitted, so the cost of formatting (e.g. a Thrift object) is not paid when the logger is not
+    # enabled.
+
+    __slots__ = ('_function', '_args')
+
+    def __init__(self, function, *args):
+        self._function = function
+        self._args = args
+
+    def __str__(self):
+        return str(self._function(*self._args))
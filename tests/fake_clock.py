@@ -0,0 +1,19 @@
+import time
+
+import timer
+
+class FakeClock:
+
+    # Replaces the monotonic clock (from which the remaining lifetime of the TIEs is computed) and
+    # the clock of the timer scheduler, so that a test can advance time without sleeping. Both
+    # clocks start at a whole second, so that advancing them by binary fractions of a second (e.g.
+    # 0.125) gives exactly the same expiry times as the timers compute.
+    def __init__(self, monkeypatch):
+        self._monotonic = float(int(time.monotonic()) + 1)
+        self._timer_now = float(int(timer.TIMER_SCHEDULER.now()) + 1)
+        monkeypatch.setattr(time, "monotonic", lambda: self._monotonic)
+        monkeypatch.setattr(timer.TIMER_SCHEDULER, "now", lambda: self._timer_now)
+
+    def advance(self, secs):
+        self._monotonic += secs
+        self._timer_now += secs
@@ -0,0 +1,106 @@
+import common.ttypes
+import decode_cache
+import encoding.ttypes
+import packet_common
+
+# Allow long names for test functions
+# pylint: disable=invalid-name
+
+SOUTH = common.ttypes.TieDirectionType.South
+
+def make_lie_protocol_packet(nonce, last_neighbor_nonce=None, name="name"):
+    packet_common.add_missing_methods_to_thrift()
+    lie_packet = encoding.ttypes.LIEPacket(
+        name=name,
+        local_id=1,
+        flood_port=10001,
+        link_mtu_size=1400,
+        pod=0,
+        nonce=nonce,
+        last_neighbor_nonce=last_neighbor_nonce,
+        holdtime=3)
+    return encoding.ttypes.ProtocolPacket(
+        header=encoding.ttypes.PacketHeader(sender=1, level=1),
+        content=encoding.ttypes.PacketContent(lie=lie_packet))
+
+def make_tie_protocol_packet(seq_nr):
+    packet_common.add_missing_methods_to_thrift()
+    tie_packet = packet_common.make_prefix_tie_packet(SOUTH, 1, 2, seq_nr, 600)
+    packet_common.add_ipv4_prefix_to_prefix_tie(tie_packet, "1.2.3.0/24", 1)
+    return encoding.ttypes.ProtocolPacket(
+        header=encoding.ttypes.PacketHeader(sender=1, level=1),
+        content=encoding.ttypes.PacketContent(tie=tie_packet))
+
+def decode(cache, protocol_packet, content_type):
+    message = packet_common.encode_protocol_packet(protocol_packet)
+    return cache.decode(message, content_type)
+
+def test_lie_nonce_masked():
+    cache = decode_cache.DecodeCache()
+    (decoded, cache_hit) = decode(cache, make_lie_protocol_packet(111, 222), "lie")
+    assert cache_hit is False
+    assert decoded.content.lie.nonce == 111
+    assert decoded.content.lie.last_neighbor_nonce == 222
+    (decoded, cache_hit) = decode(cache, make_lie_protocol_packet(packet_common.MAX_U64, 444),
+                                  "lie")
+    assert cache_hit is True
+    assert decoded.content.lie.nonce == packet_common.MAX_U64
+    assert decoded.content.lie.last_neighbor_nonce == 444
+    assert decoded == make_lie_protocol_packet(packet_common.MAX_U64, 444)
+    # A LIE with different content (other than the nonces) is a miss
+    (decoded, cache_hit) = decode(cache, make_lie_protocol_packet(555, 666, name="else"), "lie")
+    assert cache_hit is False
+    assert decoded.content.lie.name == "else"
+    # A LIE without last neighbor nonce has a different layout
+    (decoded, cache_hit) = decode(cache, make_lie_protocol_packet(777), "lie")
+    assert cache_hit is False
+    assert decoded.content.lie.last_neighbor_nonce is None
+    (decoded, cache_hit) = decode(cache, make_lie_protocol_packet(888), "lie")
+    assert cache_hit is True
+    assert decoded.content.lie.nonce == 888
+    assert decoded.content.lie.last_neighbor_nonce is None
+    assert len(cache) == 3
+
+def test_tie_copied():
+    cache = decode_cache.DecodeCache()
+    (decoded_1, cache_hit) = decode(cache, make_tie_protocol_packet(5), "tie")
+    assert cache_hit is False
+    # Modifying the header of a decoded TIE does not affect the cached TIE
+    decoded_1.content.tie.header.remaining_lifetime = 1
+    (decoded_2, cache_hit) = decode(cache, make_tie_protocol_packet(5), "tie")
+    assert cache_hit is True
+    assert decoded_2 is not decoded_1
+    assert decoded_2.content.tie.header.remaining_lifetime == 600
+    assert decoded_2.content.tie.element == make_tie_protocol_packet(5).content.tie.element
+    (_decoded, cache_hit) = decode(cache, make_tie_protocol_packet(6), "tie")
+    assert cache_hit is False
+
+def test_not_cached():
+    cache = decode_cache.DecodeCache()
+    tide_packet = packet_common.make_tide_packet(
+        start_range=packet_common.make_tie_id(SOUTH, 0, 0, 0),
+        end_range=packet_common.make_tie_id(SOUTH, 10, 0, 0))
+    protocol_packet = encoding.ttypes.ProtocolPacket(
+        header=encoding.ttypes.PacketHeader(sender=1, level=1),
+        content=encoding.ttypes.PacketContent(tide=tide_packet))
+    for _ in range(2):
+        (decoded, cache_hit) = decode(cache, protocol_packet, "tide")
+        assert cache_hit is None
+        assert decoded.content.tide is not None
+    assert len(cache) == 0
+    (decoded, cache_hit) = cache.decode(b'garbage', "tie")
+    assert decoded is None
+    assert cache_hit is False
+
+def test_lru_eviction():
+    cache = decode_cache.DecodeCache(max_entries=2)
+    decode(cache, make_tie_protocol_packet(1), "tie")
+    decode(cache, make_tie_protocol_packet(2), "tie")
+    (_decoded, cache_hit) = decode(cache, make_tie_protocol_packet(1), "tie")
+    assert cache_hit is True
+    decode(cache, make_tie_protocol_packet(3), "tie")
+    assert len(cache) == 2
+    (_decoded, cache_hit) = decode(cache, make_tie_protocol_packet(1), "tie")
+    assert cache_hit is True
+    (_decoded, cache_hit) = decode(cache, make_tie_protocol_packet(2), "tie")
+    assert cache_hit is False
@@ -1,3 +1,4 @@
+import errno
 import re
 
 import constants
@@ -12,6 +13,8 @@ import route
 def test_create_kernel():
     _kernel_1 = kernel.Kernel(log=None, log_id="", table_name="main")
     _kernel_2 = kernel.Kernel(log=None, log_id="", table_name=3)
+    _kernel_1.close()
+    _kernel_2.close()
 
 def test_cli_addresses_table():
     kern = kernel.Kernel(log=None, log_id="", table_name="main")
@@ -29,6 +32,7 @@ def test_cli_addresses_table():
                r"(.|[\n])*"
                r"[|] lo +[|] 127\.0\.0\.1 +[|] 127\.0\.0\.1 +[|] +[|] +[|]\n")
     assert re.search(pattern, tab_str) is not None
+    kern.close()
 
 def test_cli_links_table():
     kern = kernel.Kernel(log=None, log_id="", table_name="main")
@@ -49,6 +53,7 @@ def test_cli_links_table():
                r"(.|[\n])*"
                r"[|] lo +[|] +[0-9]+ +[|] +[0-9:]+ +[|] +[0-9:]+ +[|] + +[|] +[0-9 ]+[|] +UP +[|]\n")
     assert re.search(pattern, tab_str) is not None
+    kern.close()
 
 def test_cli_routes_table():
     packet_common.add_missing_methods_to_thrift()
@@ -69,6 +74,7 @@ def test_cli_routes_table():
                r"(.|[\n])*"
                r"[|] Main +[|] IPv4 +[|] 0\.0\.0\.0/0 +[|] Unicast +[|] Boot +[|]")
     assert re.search(pattern, tab_str) is not None
+    kern.close()
 
 def test_cli_route_prefix_table():
     kern = kernel.Kernel(log=None, log_id="", table_name="main")
@@ -103,6 +109,7 @@ def test_cli_route_prefix_table():
                r"[|] Protocol +[|] Boot +[|]\n"
                r"[|] Scope +[|] Universe +[|]\n")
     assert re.search(pattern, tab_str) is not None
+    kern.close()
 
 def test_put_del_route():
     kern = kernel.Kernel(log=None, log_id="", table_name="5")
@@ -143,6 +150,7 @@ def test_put_del_route():
     assert re.search(pattern, tab_str) is not None
     # Delete route just added
     assert kern.del_route(prefix)
+    kern.close()
 
 def test_put_del_route_errors():
     kern = kernel.Kernel(log=None, log_id="", table_name="main")
@@ -153,6 +161,168 @@ def test_put_del_route_errors():
     nhops = [next_hop.NextHop("nonsense", None)]
     rte = route.Route(prefix, constants.OWNER_S_SPF, nhops)
     assert not kern.put_route(rte)
+    kern.close()
+
+def test_route_queue():
+    # pylint:disable=protected-access
+    kern = kernel.Kernel(log=None, log_id="", table_name="5")
+    if not kern.platform_supported:
+        return
+    prefix_1 = packet_common.make_ip_prefix("99.99.99.1/32")
+    prefix_2 = packet_common.make_ip_prefix("99.99.99.2/32")
+    nhops = [next_hop.NextHop("lo", None)]
+    # Multiple updates for the same prefix are coalesced; nothing is programmed until the flush
+    kern.queue_put_route(route.Route(prefix_1, constants.OWNER_S_SPF, nhops))
+    kern.queue_put_route(route.Route(prefix_2, constants.OWNER_S_SPF, nhops))
+    kern.queue_del_route(prefix_2)
+    kern.queue_put_route(route.Route(prefix_1, constants.OWNER_N_SPF, nhops))
+    assert kern.route_queue_depth() == 2
+    assert "99.99.99.1/32" not in kern.cli_routes_table(5).to_string()
+    # The flush writes the requests to the netlink socket without waiting for the ACKs
+    kern.flush_route_queue()
+    assert kern.route_queue_depth() == 0
+    assert kern._netlink.nr_outstanding() == 2
+    tab_str = kern.cli_routes_table(5).to_string()
+    assert "99.99.99.1/32" in tab_str
+    assert "99.99.99.2/32" not in tab_str
+    attributes = dict(kern.cli_route_queue_attributes())
+    assert attributes["Queued Updates"] == 4
+    assert attributes["Coalesced Updates"] == 2
+    assert attributes["Flushes"] == 1
+    assert attributes["Last Batch Size"] == 2
+    # Process the ACKs (the delete of the non-existing route is not an error)
+    kern._netlink.ready_to_read()
+    assert kern._netlink.nr_outstanding() == 0
+    attributes = dict(kern._netlink.cli_attributes())
+    assert attributes["Acknowledged Requests"] == 1
+    assert attributes["Ignored Errors"] == 1
+    assert attributes["Failed Requests"] == 0
+    assert kern.del_route(prefix_1)
+    kern.close()
+
+def test_route_queue_retries():
+    # pylint:disable=protected-access
+    kern = kernel.Kernel(log=None, log_id="", table_name="5")
+    if not kern.platform_supported:
+        return
+    # The gateway is not reachable, so the kernel rejects the route
+    prefix = packet_common.make_ip_prefix("99.99.99.3/32")
+    nhops = [next_hop.NextHop("lo", packet_common.make_ip_address("192.0.2.1"))]
+    kern.queue_put_route(route.Route(prefix, constants.OWNER_S_SPF, nhops))
+    kern.flush_route_queue()
+    for _ in range(kern._netlink.MAX_RETRIES + 1):
+        kern._netlink.ready_to_read()
+    attributes = dict(kern._netlink.cli_attributes())
+    assert attributes["Sent Requests"] == kern._netlink.MAX_RETRIES + 1
+    assert attributes["Retries"] == kern._netlink.MAX_RETRIES
+    assert attributes["Failed Requests"] == 1
+    # A failed request is not retried if a more recent request for the same prefix was sent
+    kern.queue_put_route(route.Route(prefix, constants.OWNER_S_SPF, nhops))
+    kern.flush_route_queue()
+    kern.queue_del_route(prefix)
+    kern.flush_route_queue()
+    kern._netlink.ready_to_read()
+    attributes = dict(kern._netlink.cli_attributes())
+    assert attributes["Outstanding Requests"] == 0
+    assert attributes["Queued Retries"] == 0
+    assert attributes["Retries"] == kern._netlink.MAX_RETRIES
+    kern.close()
+
+class BlockedSocket:
+
+    # Wraps the netlink socket of a kernel, and fails every send as if the socket were full
+    def __init__(self, sock):
+        self._sock = sock
+
+    def send(self, _data):
+        raise BlockingIOError(errno.EAGAIN, "Resource temporarily unavailable")
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+def test_route_queue_blocked_socket():
+    # pylint:disable=protected-access
+    kern = kernel.Kernel(log=None, log_id="", table_name="5")
+    if not kern.platform_supported:
+        return
+    prefix = packet_common.make_ip_prefix("99.99.99.5/32")
+    nhops = [next_hop.NextHop("lo", None)]
+    sock = kern._netlink._sock
+    kern._netlink._sock = BlockedSocket(sock)
+    # A full socket is not a failure of the request: it is queued without counting a retry
+    kern.queue_put_route(route.Route(prefix, constants.OWNER_S_SPF, nhops))
+    kern.flush_route_queue()
+    attributes = dict(kern._netlink.cli_attributes())
+    assert attributes["Blocked Sends"] == 1
+    assert attributes["Queued Retries"] == 1
+    assert attributes["Retries"] == 0
+    assert attributes["Sent Requests"] == 0
+    # Still blocked: the request stays at the head of the queue
+    kern._netlink.transmit_retries()
+    attributes = dict(kern._netlink.cli_attributes())
+    assert attributes["Blocked Sends"] == 2
+    assert attributes["Queued Retries"] == 1
+    # Once the socket has room again, the queued request is sent
+    kern._netlink._sock = sock
+    kern._netlink.transmit_retries()
+    kern._netlink.ready_to_read()
+    attributes = dict(kern._netlink.cli_attributes())
+    assert attributes["Queued Retries"] == 0
+    assert attributes["Acknowledged Requests"] == 1
+    assert attributes["Retries"] == 0
+    assert attributes["Failed Requests"] == 0
+    assert "99.99.99.5/32" in kern.cli_routes_table(5).to_string()
+    assert kern.del_route(prefix)
+    kern.close()
+
+def test_stale_route_reconciliation():
+    # pylint:disable=protected-access
+    previous_kern = kernel.Kernel(log=None, log_id="", table_name="5")
+    if not previous_kern.platform_supported:
+        return
+    # Routes left behind by a previous instance
+    prefix_1 = packet_common.make_ip_prefix("99.99.99.1/32")
+    prefix_2 = packet_common.make_ip_prefix("99.99.99.2/32")
+    prefix_3 = packet_common.make_ip_prefix("99.99.99.3/32")
+    lo_nhops = [next_hop.NextHop("lo", None)]
+    gateway_nhops = [next_hop.NextHop("lo", packet_common.make_ip_address("127.0.0.1"))]
+    prefix_4 = packet_common.make_ip_prefix("99.99.99.4/32")
+    # ECMP route with one next-hop without a gateway and one next-hop with a gateway on the same
+    # interface
+    mixed_nhops = [next_hop.NextHop("lo", packet_common.make_ip_address("127.0.0.2")),
+                   next_hop.NextHop("lo", None)]
+    for prefix in [prefix_1, prefix_2, prefix_3]:
+        assert previous_kern.put_route(route.Route(prefix, constants.OWNER_S_SPF, lo_nhops))
+    assert previous_kern.put_route(route.Route(prefix_4, constants.OWNER_S_SPF, mixed_nhops))
+    # The new instance loads them as stale routes
+    kern = kernel.Kernel(log=None, log_id="", table_name="5", grace_period=30.0)
+    assert dict(kern.cli_attributes())["Stale Routes"] == 4
+    # Identical routes: not sent to the kernel. Different route: replaced.
+    kern.queue_put_route(route.Route(prefix_1, constants.OWNER_S_SPF, lo_nhops))
+    kern.queue_put_route(route.Route(prefix_2, constants.OWNER_S_SPF, gateway_nhops))
+    kern.queue_put_route(route.Route(prefix_4, constants.OWNER_S_SPF, list(reversed(mixed_nhops))))
+    kern.flush_route_queue()
+    kern._netlink.ready_to_read()
+    assert dict(kern._netlink.cli_attributes())["Sent Requests"] == 1
+    attributes = dict(kern.cli_attributes())
+    assert attributes["Stale Routes"] == 1
+    assert attributes["Kept Identical Stale Routes"] == 2
+    # End of the grace period: the left-over route is deleted
+    kern.delete_stale_routes()
+    kern.flush_route_queue()
+    kern._netlink.ready_to_read()
+    attributes = dict(kern.cli_attributes())
+    assert attributes["Stale Routes"] == 0
+    assert attributes["Deleted Stale Routes"] == 1
+    tab_str = kern.cli_routes_table(5).to_string()
+    assert "99.99.99.1/32" in tab_str
+    assert "99.99.99.2/32" in tab_str
+    assert "99.99.99.3/32" not in tab_str
+    assert kern.del_route(prefix_1)
+    assert kern.del_route(prefix_2)
+    assert kern.del_route(prefix_4)
+    kern.close()
+    previous_kern.close()
 
 def test_table_nr_to_name():
     assert kernel.Kernel.table_nr_to_name(255) == "Local"
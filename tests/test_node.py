@@ -1,11 +1,14 @@
 import time
 
+import pytest
+
 import common.ttypes
 import constants
 import encoding.ttypes
 import node
 import packet_common
 import timer
+from fake_clock import FakeClock
 
 # pylint: disable=line-too-long
 
@@ -323,6 +326,28 @@ def test_process_tide():
     # whether the TIE in the TIE-DB in the gap before TIDE-1 is put on the send queue again.
     check_process_tide_1(test_node)
 
+def test_process_tide_unusual_headers():
+    packet_common.add_missing_methods_to_thrift()
+    db_tie_info_list = [
+        # pylint:disable=bad-whitespace
+        # Direction Origin Type     TieNr SeqNr Lifetime
+        ( SOUTH,    10,    PREFIX,  1,    2,    100),
+        ( SOUTH,    10,    PREFIX,  2,    5,    100),
+        ( SOUTH,    10,    PREFIX,  3,    5,    100)]
+    test_node = make_test_node(db_tie_info_list)
+    start_range = packet_common.make_tie_id(SOUTH, 10, PREFIX, 1)
+    end_range = packet_common.make_tie_id(SOUTH, 10, PREFIX, 1)
+    tide_packet = packet_common.make_tide_packet(start_range, end_range)
+    # The same TIE-ID twice, and a TIE-ID beyond the end of the range of the TIDE
+    for (tie_nr, seq_nr) in [(1, 2), (1, 2), (3, 5)]:
+        tie_header = packet_common.make_tie_header(SOUTH, 10, PREFIX, tie_nr, seq_nr, 100)
+        packet_common.add_tie_header_to_tide(tide_packet, tie_header)
+    result = test_node.process_received_tide_packet(tide_packet)
+    (request_tie_headers, start_sending_tie_headers, stop_sending_tie_headers) = result
+    assert request_tie_headers == []
+    assert [header.tieid.tie_nr for header in start_sending_tie_headers] == [2]
+    assert [header.tieid.tie_nr for header in stop_sending_tie_headers] == [1, 1, 3]
+
 def compare_header_lists(headers1, headers2):
     # Order does not matter in comparison. This is maybe not the most efficient way of doing it,
     # but it makes it easier to debug test failures (most clear error messages)
@@ -567,8 +592,66 @@ def test_generate_tide_packet():
     expected_header = packet_common.make_tie_header(SOUTH, MY_SYSTEM_ID, PREFIX, 18, 903, 400)
     assert tide_packet.headers[0] == expected_header
 
-def test_age_ties():
+def test_tie_db_generation():
+    # pylint:disable=protected-access
+    packet_common.add_missing_methods_to_thrift()
+    db_tie_info_list = [
+        # pylint:disable=bad-whitespace
+        # Direction Origin         Type     TieNr SeqNr Lifetime
+        ( SOUTH,     55,           NODE,    2,    4,    600),
+        ( SOUTH,     MY_SYSTEM_ID, PREFIX,  18,   903,  600)]
+    test_node = make_test_node(db_tie_info_list)
+    generation = test_node._tie_db_generation
+    # Aging changes the remaining lifetime, but not the generation
+    test_node.age_ties()
+    assert test_node._tie_db_generation == generation
+    test_node.store_tie(packet_common.make_prefix_tie_packet(NORTH, 66, 1, 1, 600))
+    assert test_node._tie_db_generation == generation + 1
+    tie_id = packet_common.make_tie_id(SOUTH, MY_SYSTEM_ID, PREFIX, 18)
+    rx_tie_header = packet_common.make_tie_header(SOUTH, MY_SYSTEM_ID, PREFIX, 18, 910, 600)
+    test_node.bump_own_tie(test_node.find_tie(tie_id), rx_tie_header)
+    assert test_node.find_tie(tie_id).header.seq_nr == 911
+    assert test_node._tie_db_generation == generation + 2
+    test_node.remove_tie(tie_id)
+    assert test_node._tie_db_generation == generation + 3
+    # Removing a TIE which is not in the TIE-DB does not change the TIE-DB
+    test_node.remove_tie(tie_id)
+    assert test_node._tie_db_generation == generation + 3
+
+def test_ties_of_type():
+    # pylint:disable=protected-access
+    packet_common.add_missing_methods_to_thrift()
+    db_tie_info_list = [
+        # pylint:disable=bad-whitespace
+        # Direction Origin         Type     TieNr SeqNr Lifetime
+        ( SOUTH,     55,           NODE,    2,    4,    600),
+        ( SOUTH,     55,           NODE,    1,    4,    600),
+        ( NORTH,     55,           NODE,    1,    4,    600),
+        ( SOUTH,     55,           PREFIX,  1,    4,    600),
+        ( SOUTH,     56,           NODE,    1,    4,    600)]
+    test_node = make_test_node(db_tie_info_list)
+    node_ties = test_node.node_ties(SOUTH, 55)
+    assert [tie.header.tieid.tie_nr for tie in node_ties] == [1, 2]
+    assert [tie.header.tieid.direction for tie in node_ties] == [SOUTH, SOUTH]
+    assert len(test_node.node_ties(NORTH, 55)) == 1
+    assert len(test_node.prefix_ties(SOUTH, 55)) == 1
+    assert test_node.prefix_ties(NORTH, 55) == []
+    assert test_node.node_ties(SOUTH, 57) == []
+    # A new version of a TIE replaces the old version in the index
+    new_tie = packet_common.make_node_tie_packet(MY_NAME, MY_LEVEL, SOUTH, 55, 2, 5, 600)
+    test_node.store_tie(new_tie)
+    assert test_node.node_ties(SOUTH, 55)[1] is new_tie
+    # Removing the last TIE of an originator removes the originator from the index
+    test_node.remove_tie(packet_common.make_tie_id(SOUTH, 56, NODE, 1))
+    assert test_node.node_ties(SOUTH, 56) == []
+    assert (SOUTH, 56, NODE) not in test_node._ties_by_originator
+    rx_tie_header = packet_common.make_tie_header(SOUTH, 55, NODE, 7, 1, 600)
+    real_node_tie = test_node.find_according_real_node_tie(rx_tie_header)
+    assert real_node_tie.header.tieid == packet_common.make_tie_id(SOUTH, 55, NODE, 1)
+
+def test_age_ties(monkeypatch):
     packet_common.add_missing_methods_to_thrift()
+    clock = FakeClock(monkeypatch)
     db_tie_info_list = [
         # pylint:disable=bad-whitespace
         # Direction Origin         Type     TieNr SeqNr Lifetime
@@ -579,6 +662,9 @@ def test_age_ties():
     tie_id_2 = packet_common.make_tie_id(SOUTH, MY_SYSTEM_ID, PREFIX, 18)
     assert test_node.find_tie(tie_id_1) is not None
     assert test_node.find_tie(tie_id_2) is not None
+    # The remaining lifetime is computed from the expiry time when the TIE is looked up. The TIE
+    # with remaining lifetime 1 is removed when the expiry timer expires.
+    clock.advance(1.1)
     test_node.age_ties()
     tie_1 = test_node.find_tie(tie_id_1)
     assert tie_1 is not None
@@ -586,6 +672,78 @@ def test_age_ties():
     assert tie_1.header.remaining_lifetime == 599
     assert test_node.find_tie(tie_id_2) is None
 
+def test_tie_expiry_timer(monkeypatch):
+    # pylint:disable=protected-access
+    packet_common.add_missing_methods_to_thrift()
+    clock = FakeClock(monkeypatch)
+    db_tie_info_list = [
+        # pylint:disable=bad-whitespace
+        # Direction Origin         Type     TieNr SeqNr Lifetime
+        ( SOUTH,     55,           NODE,    2,    4,    600),
+        ( SOUTH,     56,           NODE,    2,    4,    1),
+        ( SOUTH,     57,           NODE,    2,    4,    1)]
+    test_node = make_test_node(db_tie_info_list)
+    tie_id_1 = packet_common.make_tie_id(SOUTH, 55, NODE, 2)
+    tie_id_2 = packet_common.make_tie_id(SOUTH, 56, NODE, 2)
+    tie_id_3 = packet_common.make_tie_id(SOUTH, 57, NODE, 2)
+    # The expiry timer runs for the TIEs that expire first
+    assert test_node._tie_expiry_timer.running()
+    assert test_node._tie_expiry_timer.interval() == 1.0
+    # Store a new version of one of them with a longer lifetime; its old expiry time is ignored
+    test_node.store_tie(packet_common.make_node_tie_packet(MY_NAME, MY_LEVEL, SOUTH, 57, 2, 5, 300))
+    # Not yet expired
+    clock.advance(0.9)
+    timer.TIMER_SCHEDULER.trigger_all_expired_timers()
+    assert test_node.find_tie(tie_id_2) is not None
+    clock.advance(0.2)
+    timer.TIMER_SCHEDULER.trigger_all_expired_timers()
+    assert test_node.find_tie(tie_id_1) is not None
+    assert test_node.find_tie(tie_id_2) is None
+    assert test_node.find_tie(tie_id_3).header.remaining_lifetime == 299
+    # Now the expiry timer runs for the TIE that was stored again
+    assert test_node._tie_expiry_timer.running()
+    assert test_node._tie_expiry_timer.interval() == pytest.approx(298.9)
+
+def test_tie_protocol_packet_cache(monkeypatch):
+    # pylint:disable=too-many-locals
+    packet_common.add_missing_methods_to_thrift()
+    clock = FakeClock(monkeypatch)
+    db_tie_info_list = [
+        # pylint:disable=bad-whitespace
+        # Direction Origin         Type     TieNr SeqNr Lifetime
+        ( SOUTH,     55,           NODE,    2,    4,    600)]
+    test_node = make_test_node(db_tie_info_list)
+    tie_id = packet_common.make_tie_id(SOUTH, 55, NODE, 2)
+    db_tie = test_node.find_tie(tie_id)
+    # The first time the TIE is flooded, it is encoded
+    (protocol_packet_1, encoded_1) = test_node.tie_protocol_packet(db_tie)
+    assert protocol_packet_1.content.tie == db_tie
+    assert protocol_packet_1.header.sender == MY_SYSTEM_ID
+    decoded_protocol_packet = packet_common.decode_protocol_packet(encoded_1)
+    assert decoded_protocol_packet.content.tie.header == db_tie.header
+    # The second time the TIE is flooded (e.g. to another neighbor) the cached encoding is used
+    (protocol_packet_2, encoded_2) = test_node.tie_protocol_packet(db_tie)
+    assert protocol_packet_2 is protocol_packet_1
+    assert encoded_2 is encoded_1
+    # A change in the remaining lifetime of the TIE invalidates the cached encoding
+    clock.advance(1.1)
+    (_, encoded_3) = test_node.tie_protocol_packet(db_tie)
+    assert encoded_3 is not encoded_1
+    decoded_protocol_packet = packet_common.decode_protocol_packet(encoded_3)
+    assert decoded_protocol_packet.content.tie.header.remaining_lifetime == 599
+    # Storing a new version of the TIE invalidates the cached encoding
+    new_tie = packet_common.make_node_tie_packet(MY_NAME, MY_LEVEL, SOUTH, 55, 2, 5, 600)
+    test_node.store_tie(new_tie)
+    (_, encoded_4) = test_node.tie_protocol_packet(new_tie)
+    decoded_protocol_packet = packet_common.decode_protocol_packet(encoded_4)
+    assert decoded_protocol_packet.content.tie.header.seq_nr == 5
+    # Bumping the sequence number of the TIE invalidates the cached encoding
+    rx_tie_header = packet_common.make_tie_header(SOUTH, 55, NODE, 2, 10, 600)
+    test_node.bump_own_tie(new_tie, rx_tie_header)
+    (_, encoded_5) = test_node.tie_protocol_packet(new_tie)
+    decoded_protocol_packet = packet_common.decode_protocol_packet(encoded_5)
+    assert decoded_protocol_packet.content.tie.header.seq_nr == 11
+
 def test_trigger_spf():
     # Make sure there are no timers running from previous tests
     timer.TIMER_SCHEDULER.stop_all_timers()
@@ -638,4 +796,6 @@ def test_trigger_spf():
     assert test_node._spf_triggers_deferred_count == 3
     assert test_node._spf_runs_count == 4
     # Check history
-    assert list(test_node._spf_trigger_history) == ["Test 5", "Test 4", "Test 3", "Test 2", "Test 1"]
+    for direction in [SOUTH, NORTH]:
+        assert list(test_node._spf_trigger_history[direction]) == ["Test 5", "Test 4", "Test 3", "Test 2", "Test 1"]
+        assert test_node._spf_direction_runs_count[direction] == 4
@@ -1,3 +1,9 @@
+import copy
+
+import thrift.protocol.TBinaryProtocol
+import thrift.Thrift
+import thrift.transport.TTransport
+
 import common.ttypes
 import packet_common
 
@@ -404,3 +410,193 @@ def test_fix_key_value_tie_packet():
     encoded_packet = packet_common.encode_protocol_packet(tie_protocol_packet)
     decoded_tie_protocol_packet = packet_common.decode_protocol_packet(encoded_packet)
     assert tie_protocol_packet == decoded_tie_protocol_packet
+
+def test_encode_does_not_modify_packet():
+    packet_common.add_missing_methods_to_thrift()
+    tie_header = max_tie_header()
+    tie_protocol_packet = encoding.ttypes.ProtocolPacket(
+        header=encoding.ttypes.PacketHeader(
+            major_version=packet_common.MAX_U16,
+            minor_version=packet_common.MAX_U16,
+            sender=packet_common.MAX_U64,
+            level=packet_common.MAX_U16
+        ),
+        content=encoding.ttypes.PacketContent(
+            tie=encoding.ttypes.TIEPacket(
+                header=tie_header,
+                element=encoding.ttypes.TIEElement(
+                    prefixes=max_prefix_tie_element()
+                )
+            )
+        )
+    )
+    encoded_packet = packet_common.encode_protocol_packet(tie_protocol_packet)
+    # The packet that was encoded still contains the unsigned values
+    assert tie_protocol_packet.header.sender == packet_common.MAX_U64
+    assert tie_protocol_packet.content.tie.header is tie_header
+    assert tie_header.tieid.originator == packet_common.MAX_U64
+    assert tie_header.seq_nr == packet_common.MAX_U32
+    for prefix, attributes in tie_protocol_packet.content.tie.element.prefixes.prefixes.items():
+        assert prefix.ipv4prefix is None or prefix.ipv4prefix.prefixlen == packet_common.MAX_U8
+        assert attributes.metric == packet_common.MAX_U32
+    # The encoding is the same as what we get from fixing a copy of the packet the slow way
+    slow_fixed_protocol_packet = copy.deepcopy(tie_protocol_packet)
+    packet_common.fix_prot_packet_before_encode(slow_fixed_protocol_packet)
+    transport_out = thrift.transport.TTransport.TMemoryBuffer()
+    protocol_out = thrift.protocol.TBinaryProtocol.TBinaryProtocol(transport_out)
+    slow_fixed_protocol_packet.write(protocol_out)
+    assert encoded_packet == transport_out.getvalue()
+
+def test_thrift_codec(monkeypatch):
+    packet_common.add_missing_methods_to_thrift()
+    protocol_packet = encoding.ttypes.ProtocolPacket(
+        header=encoding.ttypes.PacketHeader(sender=packet_common.MAX_U64, level=0),
+        content=encoding.ttypes.PacketContent(
+            lie=encoding.ttypes.LIEPacket(name="codec", local_id=1, flood_port=10001)))
+    accelerated_usable = packet_common.ACCELERATED_THRIFT_PROTOCOL_PROBLEM is None
+    encodings = []
+    for (problem, expected_class, expected_codec) in [
+            ("forced problem",
+             thrift.protocol.TBinaryProtocol.TBinaryProtocol,
+             "Pure Python binary protocol (forced problem)"),
+            (None,
+             thrift.protocol.TBinaryProtocol.TBinaryProtocolAccelerated,
+             "Accelerated binary protocol (fastbinary)")]:
+        (protocol_class, codec) = packet_common.select_thrift_protocol(problem)
+        assert protocol_class == expected_class
+        assert codec == expected_codec
+        if problem is None and not accelerated_usable:
+            # The accelerated protocol does not work with this Thrift library; that is exactly
+            # the problem that was detected, so it can't be used for encoding here.
+            continue
+        # Encode and decode with the selected protocol class
+        monkeypatch.setattr(packet_common, "THRIFT_PROTOCOL_CLASS", protocol_class)
+        encoded_packet = packet_common.encode_protocol_packet(protocol_packet)
+        decoded_packet = packet_common.decode_protocol_packet(encoded_packet)
+        assert decoded_packet == protocol_packet
+        encodings.append(encoded_packet)
+    # If both protocols can be used, they produce exactly the same encoding
+    assert len(encodings) == (2 if accelerated_usable else 1)
+    assert encodings[0] == encodings[-1]
+    # The module selected the protocol class which matches the detected problem (if any)
+    (protocol_class, codec) = packet_common.select_thrift_protocol(
+        packet_common.ACCELERATED_THRIFT_PROTOCOL_PROBLEM)
+    assert packet_common.THRIFT_PROTOCOL_CLASS == protocol_class
+    assert packet_common.THRIFT_CODEC == codec
+    # Without the fastbinary module, the pure Python protocol is used
+    monkeypatch.setattr(packet_common.importlib.util, "find_spec", lambda _name: None)
+    problem = packet_common.accelerated_thrift_protocol_problem()
+    assert problem == "fastbinary not available"
+    assert (packet_common.select_thrift_protocol(problem)[0] ==
+            thrift.protocol.TBinaryProtocol.TBinaryProtocol)
+
+def test_decode_protocol_packet_header():
+    packet_common.add_missing_methods_to_thrift()
+    packet_header = encoding.ttypes.PacketHeader(
+        sender=packet_common.MAX_U64,
+        level=packet_common.MAX_U16)
+    tide_packet = encoding.ttypes.TIDEPacket(
+        start_range=max_tieid(),
+        end_range=max_tieid(),
+        headers=[max_tie_header()])
+    tide_protocol_packet = encoding.ttypes.ProtocolPacket(
+        header=packet_header,
+        content=encoding.ttypes.PacketContent(tide=tide_packet))
+    encoded_packet = packet_common.encode_protocol_packet(tide_protocol_packet)
+    (decoded_header, content_type) = packet_common.decode_protocol_packet_header(encoded_packet)
+    assert decoded_header == packet_header
+    assert content_type == "tide"
+    # Packet without content
+    empty_protocol_packet = encoding.ttypes.ProtocolPacket(
+        header=packet_header,
+        content=encoding.ttypes.PacketContent())
+    encoded_packet = packet_common.encode_protocol_packet(empty_protocol_packet)
+    (decoded_header, content_type) = packet_common.decode_protocol_packet_header(encoded_packet)
+    assert decoded_header == packet_header
+    assert content_type is None
+    # Packet where the content is encoded before the header
+    fixed_protocol_packet = copy.deepcopy(tide_protocol_packet)
+    packet_common.fix_prot_packet_before_encode(fixed_protocol_packet)
+    transport_out = thrift.transport.TTransport.TMemoryBuffer()
+    protocol_out = thrift.protocol.TBinaryProtocol.TBinaryProtocol(transport_out)
+    protocol_out.writeStructBegin('ProtocolPacket')
+    protocol_out.writeFieldBegin('content', thrift.Thrift.TType.STRUCT, 2)
+    fixed_protocol_packet.content.write(protocol_out)
+    protocol_out.writeFieldBegin('header', thrift.Thrift.TType.STRUCT, 1)
+    fixed_protocol_packet.header.write(protocol_out)
+    protocol_out.writeFieldStop()
+    encoded_packet = transport_out.getvalue()
+    (decoded_header, content_type) = packet_common.decode_protocol_packet_header(encoded_packet)
+    assert decoded_header == packet_header
+    assert content_type == "tide"
+    assert packet_common.decode_protocol_packet(encoded_packet) == tide_protocol_packet
+    # Garbage
+    assert packet_common.decode_protocol_packet_header(b"garbage") is None
+
+def test_tide_fits_in_mtu():
+    packet_common.add_missing_methods_to_thrift()
+    mtu = 1400
+    tide_packet = packet_common.make_tide_packet(
+        start_range=packet_common.make_tie_id(common.ttypes.TieDirectionType.South, 0, 0, 0),
+        end_range=packet_common.make_tie_id(common.ttypes.TieDirectionType.North,
+                                            packet_common.MAX_U64, 0, packet_common.MAX_U32))
+    headers_size = 0
+    tie_nr = 1
+    while True:
+        tie_header = packet_common.make_tie_header(
+            common.ttypes.TieDirectionType.North, packet_common.MAX_U64 - tie_nr,
+            common.ttypes.TIETypeType.PrefixTIEType, tie_nr, 1, 600)
+        if tie_nr % 2 == 0:
+            tie_header.origination_time = common.ttypes.IEEE802_1ASTimeStampType(AS_sec=1,
+                                                                                 AS_nsec=2)
+        size = packet_common.tide_tie_header_size(tie_header)
+        if headers_size + size > packet_common.tide_headers_max_size(mtu):
+            break
+        packet_common.add_tie_header_to_tide(tide_packet, tie_header)
+        headers_size += size
+        tie_nr += 1
+    protocol_packet = encoding.ttypes.ProtocolPacket(
+        header=encoding.ttypes.PacketHeader(sender=packet_common.MAX_U64, level=1),
+        content=encoding.ttypes.PacketContent(tide=tide_packet))
+    encoded_size = len(packet_common.encode_protocol_packet(protocol_packet))
+    assert encoded_size == packet_common.TIDE_OVERHEAD_SIZE + headers_size
+    assert encoded_size <= mtu - packet_common.IP_AND_UDP_HEADERS_SIZE
+
+def test_cached_keys():
+    packet_common.add_missing_methods_to_thrift()
+    south = common.ttypes.TieDirectionType.South
+    north = common.ttypes.TieDirectionType.North
+    node = common.ttypes.TIETypeType.NodeTIEType
+    prefix = common.ttypes.TIETypeType.PrefixTIEType
+    tie_ids = [
+        packet_common.make_tie_id(north, 1, node, 1),
+        packet_common.make_tie_id(south, packet_common.MAX_U64, node, 1),
+        packet_common.make_tie_id(south, 2, prefix, 1),
+        packet_common.make_tie_id(south, 2, node, packet_common.MAX_U32),
+        packet_common.make_tie_id(south, 2, node, 1)]
+    # TIE-IDs are ordered by (direction, originator, tietype, tie_nr)
+    assert sorted(tie_ids) == sorted(tie_ids, key=packet_common.tie_id_tup)
+    # The cached key does not end up in the string representation or the encoded TIE-ID
+    tie_id = tie_ids[1]
+    assert hash(tie_id) == hash(packet_common.tie_id_key(tie_id))
+    assert "_key" not in repr(tie_id)
+    assert copy.deepcopy(tie_id) == tie_id
+    # The key of the signed (encoded) and unsigned (decoded) form of a TIE-ID are the same
+    signed_tie_id = packet_common.make_tie_id(south, -1, node, 1)
+    assert signed_tie_id == tie_id
+    assert hash(signed_tie_id) == hash(tie_id)
+    assert tie_id != tie_ids[0]
+    prefixes = [
+        packet_common.make_ipv6_prefix("::/0"),
+        packet_common.make_ipv4_prefix("10.0.0.0/16"),
+        packet_common.make_ipv4_prefix("10.0.0.0/8"),
+        packet_common.make_ipv6_prefix("1::/64"),
+        packet_common.make_ipv4_prefix("255.255.255.255/32")]
+    # IPv4 prefixes sort before IPv6 prefixes
+    assert sorted(prefixes) == sorted(prefixes, key=packet_common.ip_prefix_tup)
+    assert prefixes[1] == packet_common.make_ipv4_prefix("10.0.0.0/16")
+    assert prefixes[1] != prefixes[2]
+    assert prefixes[0] != prefixes[2]
+    assert prefixes[0] == packet_common.make_ipv6_prefix("::/0")
+    assert len(set(prefixes + [packet_common.make_ipv4_prefix("10.0.0.0/8")])) == 5
+    assert "_key" not in repr(prefixes[3])
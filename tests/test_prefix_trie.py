@@ -0,0 +1,75 @@
+import random
+
+import prefix_trie
+
+def test_longest_prefix_match():
+    trie = prefix_trie.PrefixTrie(32)
+    assert trie.lookup(0x0a000001) is None
+    trie.put(0x0a000000, 8, "10/8")
+    trie.put(0x0a010000, 16, "10.1/16")
+    trie.put(0x0a010100, 24, "10.1.1/24")
+    trie.put(0x0b000000, 8, "11/8")
+    assert len(trie) == 4
+    assert trie.lookup(0x0a010101) == "10.1.1/24"
+    assert trie.lookup(0x0a010201) == "10.1/16"
+    assert trie.lookup(0x0a020101) == "10/8"
+    assert trie.lookup(0x0b020101) == "11/8"
+    assert trie.lookup(0x0c000000) is None
+    trie.put(0, 0, "default")
+    assert trie.lookup(0x0c000000) == "default"
+    # Host bits are ignored
+    assert trie.get(0x0a0101ff, 24) == "10.1.1/24"
+    assert trie.get(0x0a010100, 23) is None
+    # Replace
+    trie.put(0x0a010000, 16, "10.1/16 again")
+    assert len(trie) == 5
+    assert trie.lookup(0x0a010201) == "10.1/16 again"
+
+def test_delete():
+    trie = prefix_trie.PrefixTrie(32)
+    trie.put(0x0a010100, 24, "10.1.1/24")
+    trie.put(0x0a010200, 24, "10.1.2/24")
+    # Creates a glue node for 10.1.0.0/22 which has the two /24 prefixes as children
+    assert trie.lookup(0x0a010000) is None
+    trie.put(0x0a010000, 22, "10.1/22")
+    assert trie.lookup(0x0a010000) == "10.1/22"
+    assert trie.delete(0x0a010000, 22)
+    assert not trie.delete(0x0a010000, 22)
+    assert not trie.delete(0x0a010000, 16)
+    assert trie.lookup(0x0a010000) is None
+    assert trie.lookup(0x0a010201) == "10.1.2/24"
+    assert trie.delete(0x0a010200, 24)
+    assert trie.lookup(0x0a010201) is None
+    assert trie.lookup(0x0a010101) == "10.1.1/24"
+    assert trie.delete(0x0a010100, 24)
+    assert len(trie) == 0
+    assert trie.lookup(0x0a010101) is None
+
+def test_random_against_linear_scan():
+    rng = random.Random(1)
+    trie = prefix_trie.PrefixTrie(32)
+    prefixes = {}
+    for _ in range(2000):
+        prefixlen = rng.randint(0, 32)
+        address = rng.getrandbits(8) << 24 | rng.getrandbits(24)
+        address = (address >> (32 - prefixlen)) << (32 - prefixlen)
+        if (address, prefixlen) in prefixes and rng.random() < 0.5:
+            del prefixes[(address, prefixlen)]
+            assert trie.delete(address, prefixlen)
+        else:
+            prefixes[(address, prefixlen)] = (address, prefixlen)
+            trie.put(address, prefixlen, (address, prefixlen))
+    assert len(trie) == len(prefixes)
+    for (address, prefixlen) in list(prefixes)[::2]:
+        del prefixes[(address, prefixlen)]
+        assert trie.delete(address, prefixlen)
+    for _ in range(2000):
+        address = rng.getrandbits(32)
+        best = None
+        best_prefixlen = -1
+        for (prefix_address, prefixlen) in prefixes:
+            if (address ^ prefix_address) >> (32 - prefixlen) == 0:
+                if prefixlen > best_prefixlen:
+                    best = (prefix_address, prefixlen)
+                    best_prefixlen = prefixlen
+        assert trie.lookup(address) == best
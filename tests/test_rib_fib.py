@@ -1,5 +1,6 @@
 import pytest
 
+import common.ttypes
 import constants
 import fib
 import next_hop
@@ -416,3 +417,83 @@ def test_mark_and_del_stale():
     route_table.put_route(mkr("3.3.0.0/16", N))
     # Delete the one remaining stale route
     assert route_table.del_stale_routes() == 1
+
+def test_owner_routes():
+    packet_common.add_missing_methods_to_thrift()
+    route_table = mkrt(constants.ADDRESS_FAMILY_IPV4)
+    assert route_table.nr_owner_routes(S) == 0
+    assert list(route_table.all_owner_routes(N)) == []
+    route_table.put_route(mkr("0.0.0.0/0", S))
+    route_table.put_route(mkr("1.1.1.0/24", S))
+    route_table.put_route(mkr("1.1.1.0/24", N))
+    route_table.put_route(mkr("2.2.2.0/24", N))
+    # Replacing a route does not change the counts
+    route_table.put_route(mkr("2.2.2.0/24", N, [mknh("if1", None)]))
+    assert route_table.nr_owner_routes(S) == 2
+    assert route_table.nr_owner_routes(N) == 2
+    assert route_table.nr_routes() == 4
+    assert sorted(str(rte.prefix.ipv4prefix) for rte in route_table.all_owner_routes(N)) == \
+        sorted(str(rte.prefix.ipv4prefix) for rte in route_table.all_routes() if rte.owner == N)
+    route_table.del_route(mkp("1.1.1.0/24"), N)
+    # Deleting a route which is not present does not change the counts
+    route_table.del_route(mkp("1.1.1.0/24"), N)
+    assert route_table.nr_owner_routes(N) == 1
+    assert route_table.nr_routes() == 3
+    # Only the routes of the owner marked stale are deleted
+    assert route_table.mark_owner_routes_stale(S) == 2
+    route_table.put_route(mkr("0.0.0.0/0", S))
+    assert route_table.del_stale_routes() == 1
+    assert route_table.nr_owner_routes(S) == 1
+    assert route_table.nr_owner_routes(N) == 1
+    assert route_table.nr_routes() == 2
+
+def test_forwarding_table_lookup():
+    packet_common.add_missing_methods_to_thrift()
+    for (address_family, prefix_strs, address_str, expected_prefix_str) in [
+            (constants.ADDRESS_FAMILY_IPV4,
+             ["0.0.0.0/0", "10.0.0.0/8", "10.1.0.0/16", "10.1.1.0/24"],
+             "10.1.2.3", "10.1.0.0/16"),
+            (constants.ADDRESS_FAMILY_IPV6,
+             ["::/0", "1111::/16", "1111:2222::/32", "1111:2222:3333::/48"],
+             "1111:2222:4444::1", "1111:2222::/32")]:
+        forwarding_table = fib.ForwardingTable(address_family, kernel=None, log=None, log_id="")
+        for prefix_str in prefix_strs:
+            forwarding_table.put_route(mkr(prefix_str, S))
+        address = packet_common.make_ip_address(address_str)
+        assert forwarding_table.lookup(address).prefix == mkp(expected_prefix_str)
+        # After deleting the matching route, the next less specific route is used
+        assert forwarding_table.del_route(mkp(expected_prefix_str))
+        assert forwarding_table.lookup(address).prefix != mkp(expected_prefix_str)
+        for prefix_str in prefix_strs:
+            forwarding_table.del_route(mkp(prefix_str))
+        assert forwarding_table.lookup(address) is None
+
+def mk_host_bits_prefix(address_str, prefixlen):
+    # make_ip_prefix rejects prefixes with host bits set, but they can be received in packets
+    address = int(packet_common.make_ip_address(address_str))
+    return common.ttypes.IPPrefixType(ipv4prefix=common.ttypes.IPv4PrefixType(address, prefixlen))
+
+def test_forwarding_table_host_bits():
+    packet_common.add_missing_methods_to_thrift()
+    forwarding_table = fib.ForwardingTable(constants.ADDRESS_FAMILY_IPV4, kernel=None, log=None,
+                                           log_id="")
+    address = packet_common.make_ip_address("10.2.3.4")
+    prefix_1 = mk_host_bits_prefix("10.0.0.1", 8)
+    prefix_2 = mk_host_bits_prefix("10.0.0.2", 8)
+    # Prefixes which only differ in their host bits are different routes, but the same trie node
+    forwarding_table.put_route(route.Route(prefix_1, S, []))
+    forwarding_table.put_route(route.Route(prefix_2, S, []))
+    assert forwarding_table.nr_routes() == 2
+    assert forwarding_table.lookup(address).prefix == prefix_2
+    # Deleting the route in the trie node: the surviving route with the same network takes over
+    assert forwarding_table.del_route(prefix_2)
+    assert forwarding_table.lookup(address).prefix == prefix_1
+    # Putting a route again makes it the one in the trie node
+    forwarding_table.put_route(route.Route(prefix_2, S, []))
+    forwarding_table.put_route(route.Route(prefix_1, S, []))
+    assert forwarding_table.lookup(address).prefix == prefix_1
+    # Deleting the route which is not in the trie node does not affect the lookup
+    assert forwarding_table.del_route(prefix_2)
+    assert forwarding_table.lookup(address).prefix == prefix_1
+    assert forwarding_table.del_route(prefix_1)
+    assert forwarding_table.lookup(address) is None
@@ -0,0 +1,261 @@
+import common.ttypes
+import constants
+import encoding.ttypes
+import node
+import packet_common
+import timer
+from fake_clock import FakeClock
+
+# pylint: disable=line-too-long
+
+MY_NAME = "name"
+MY_SYSTEM_ID = 999
+
+SOUTH = constants.DIR_SOUTH
+NORTH = constants.DIR_NORTH
+
+NODE = common.ttypes.TIETypeType.NodeTIEType
+PREFIX = common.ttypes.TIETypeType.PrefixTIEType
+
+def make_spf_backoff_test_node(initial_delay):
+    config = {
+        "name": "test",
+        "systemid": MY_SYSTEM_ID,
+        "skip-self-orginated-ties": True,
+        "spf_initial_delay": initial_delay,
+        "spf_secondary_wait": 0.125,
+        "spf_max_wait": 0.5,
+        "spf_quiet_period": 2.0
+    }
+    return node.Node(config)
+
+def advance_and_trigger_expired_timers(clock, secs):
+    clock.advance(secs)
+    timer.TIMER_SCHEDULER.trigger_all_expired_timers()
+
+def test_spf_backoff(monkeypatch):
+    # pylint:disable=protected-access
+    timer.TIMER_SCHEDULER.stop_all_timers()
+    clock = FakeClock(monkeypatch)
+    test_node = make_spf_backoff_test_node(0.0)
+    assert test_node.spf_backoff_state_str() == "Quiet"
+    # The first trigger runs immediately
+    test_node.trigger_spf("Test 1")
+    assert test_node._spf_runs_count == 1
+    assert test_node.spf_backoff_state_str() == "Holding"
+    # While triggers keep coming, the wait doubles after each deferred run: 0.125, 0.25, 0.5, 0.5.
+    # The deferred run happens exactly when the wait expires, and not before.
+    for (wait, runs_count) in [(0.125, 2), (0.25, 3), (0.5, 4), (0.5, 5)]:
+        test_node.trigger_spf("Test")
+        assert test_node.spf_backoff_state_str() == "Deferred"
+        assert test_node._spf_backoff_wait == wait
+        advance_and_trigger_expired_timers(clock, wait - 0.0625)
+        assert test_node.spf_backoff_state_str() == "Deferred"
+        assert test_node._spf_runs_count == runs_count - 1
+        advance_and_trigger_expired_timers(clock, 0.0625)
+        assert test_node.spf_backoff_state_str() == "Holding"
+        assert test_node._spf_runs_count == runs_count
+    # Without triggers, the timer expires without running SPF
+    advance_and_trigger_expired_timers(clock, 0.5 - 0.0625)
+    assert test_node.spf_backoff_state_str() == "Holding"
+    advance_and_trigger_expired_timers(clock, 0.0625)
+    assert test_node.spf_backoff_state_str() == "Quiet"
+    assert test_node._spf_runs_count == 5
+    # A trigger within the quiet period (1 second after the last trigger) runs immediately but
+    # the wait is not reset
+    test_node.trigger_spf("Test 6")
+    assert test_node._spf_runs_count == 6
+    assert test_node._spf_backoff_wait == 0.5
+    # A trigger exactly at the end of the quiet period resets the wait
+    advance_and_trigger_expired_timers(clock, 2.0)
+    test_node.trigger_spf("Test 7")
+    assert test_node._spf_runs_count == 7
+    assert test_node._spf_backoff_wait == 0.125
+    assert test_node._spf_triggers_deferred_count == 4
+
+def test_spf_backoff_initial_delay(monkeypatch):
+    # pylint:disable=protected-access
+    timer.TIMER_SCHEDULER.stop_all_timers()
+    clock = FakeClock(monkeypatch)
+    test_node = make_spf_backoff_test_node(0.125)
+    # The first trigger runs after the initial delay, together with the triggers in the delay
+    test_node.trigger_spf("Test 1")
+    test_node.trigger_spf("Test 2")
+    assert test_node.spf_backoff_state_str() == "Initial Delay"
+    assert test_node._spf_runs_count == 0
+    advance_and_trigger_expired_timers(clock, 0.0625)
+    assert test_node.spf_backoff_state_str() == "Initial Delay"
+    assert test_node._spf_runs_count == 0
+    advance_and_trigger_expired_timers(clock, 0.0625)
+    assert test_node._spf_runs_count == 1
+    # The run after the initial delay is followed by the secondary wait
+    assert test_node.spf_backoff_state_str() == "Holding"
+    assert test_node._spf_backoff_wait == 0.125
+    attributes = dict((row[0], row[1]) for row in test_node.cli_spf_backoff_attributes())
+    assert attributes["Backoff State"] == "Holding"
+    assert attributes["Initial Delay"] == "0.125 secs"
+
+def make_spf_test_node(spf_engine="heap"):
+    # A node at level 1 with two leaf nodes (10 and 11) below it and two top-of-fabric nodes (1 and
+    # 2) above it. Both leafs advertise their own prefix and the same anycast prefix north, and both
+    # top-of-fabric nodes advertise a default route south.
+    config = {
+        "name": "test",
+        "systemid": MY_SYSTEM_ID,
+        "level": 1,
+        "skip-self-orginated-ties": True,
+        "spf_engine": spf_engine
+    }
+    test_node = node.Node(config)
+    levels = {MY_SYSTEM_ID: 1, 1: 2, 2: 2, 10: 0, 11: 0}
+    neighbors = {MY_SYSTEM_ID: [1, 2, 10, 11], 1: [MY_SYSTEM_ID], 2: [MY_SYSTEM_ID],
+                 10: [MY_SYSTEM_ID], 11: [MY_SYSTEM_ID]}
+    for system_id, level in levels.items():
+        for direction in [SOUTH, NORTH]:
+            node_tie = packet_common.make_node_tie_packet(MY_NAME, level, direction, system_id,
+                                                          1, 1, 600)
+            for nbr_system_id in neighbors[system_id]:
+                link_id_pair = encoding.ttypes.LinkIDPair(system_id, nbr_system_id)
+                node_tie.element.node.neighbors[nbr_system_id] = \
+                    encoding.ttypes.NodeNeighborsTIEElement(levels[nbr_system_id], 1,
+                                                            set([link_id_pair]), 100)
+            test_node.store_tie(node_tie)
+    for leaf_system_id in [10, 11]:
+        prefix_tie = packet_common.make_prefix_tie_packet(NORTH, leaf_system_id, 1, 1, 600)
+        packet_common.add_ipv4_prefix_to_prefix_tie(prefix_tie, "10.0.{}.0/24".format(leaf_system_id), 1)
+        packet_common.add_ipv4_prefix_to_prefix_tie(prefix_tie, "10.99.0.0/16", 1)
+        test_node.store_tie(prefix_tie)
+    for tof_system_id in [1, 2]:
+        prefix_tie = packet_common.make_prefix_tie_packet(SOUTH, tof_system_id, 1, 1, 600)
+        packet_common.add_ipv4_prefix_to_prefix_tie(prefix_tie, "0.0.0.0/0", 1)
+        test_node.store_tie(prefix_tie)
+    return test_node
+
+def spf_results(test_node):
+    # pylint:disable=protected-access
+    results = []
+    for direction in [SOUTH, NORTH]:
+        for destination in sorted(test_node._spf_destinations[direction].values()):
+            results.append((direction, destination.cli_summary_attributes(), destination.best))
+    for rte in list(test_node._ipv4_rib.all_routes()) + list(test_node._ipv6_rib.all_routes()):
+        results.append(rte.cli_summary_attributes())
+    return results
+
+def test_spf_partial_run():
+    # pylint:disable=protected-access
+    timer.TIMER_SCHEDULER.stop_all_timers()
+    packet_common.add_missing_methods_to_thrift()
+    test_node = make_spf_test_node()
+    test_node.spf_run()
+    full_runs_count = test_node._spf_full_runs_count
+    partial_runs_count = test_node._spf_partial_runs_count
+    assert "10.99.0.0/16" in str(spf_results(test_node))
+    # Change the metric of the anycast prefix of leaf 10, so that only leaf 11 is on the best path
+    # to it, and add a prefix
+    prefix_tie = packet_common.make_prefix_tie_packet(NORTH, 10, 1, 2, 600)
+    packet_common.add_ipv4_prefix_to_prefix_tie(prefix_tie, "10.0.10.0/24", 1)
+    packet_common.add_ipv4_prefix_to_prefix_tie(prefix_tie, "10.99.0.0/16", 5)
+    packet_common.add_ipv6_prefix_to_prefix_tie(prefix_tie, "1::/64", 1)
+    test_node.store_tie(prefix_tie)
+    # Remove the default route of one of the top-of-fabric nodes
+    test_node.remove_tie(packet_common.make_tie_id(SOUTH, 2, PREFIX, 1))
+    test_node.spf_run()
+    assert test_node._spf_full_runs_count == full_runs_count
+    assert test_node._spf_partial_runs_count == partial_runs_count + 1
+    partial_results = spf_results(test_node)
+    assert "1::/64" in str(partial_results)
+    # The result of the partial SPF run is the same as the result of a full SPF run
+    test_node._spf_full_run_needed = {SOUTH: True, NORTH: True}
+    test_node.spf_run()
+    assert test_node._spf_full_runs_count == full_runs_count + 1
+    assert spf_results(test_node) == partial_results
+    # A change in a node TIE requires a full SPF run
+    test_node.remove_tie(packet_common.make_tie_id(NORTH, 11, NODE, 1))
+    test_node.spf_run()
+    assert test_node._spf_full_runs_count == full_runs_count + 2
+    assert test_node._spf_partial_runs_count == partial_runs_count + 1
+
+def test_spf_direction_selective():
+    # pylint:disable=protected-access
+    timer.TIMER_SCHEDULER.stop_all_timers()
+    packet_common.add_missing_methods_to_thrift()
+    test_node = make_spf_test_node()
+    test_node.spf_run()
+    runs_count = dict(test_node._spf_direction_runs_count)
+    # A South-Prefix-TIE from another node is only used by North-SPF
+    prefix_tie = packet_common.make_prefix_tie_packet(SOUTH, 1, 1, 2, 600)
+    packet_common.add_ipv4_prefix_to_prefix_tie(prefix_tie, "0.0.0.0/0", 2)
+    test_node.store_tie(prefix_tie)
+    test_node.spf_run()
+    assert test_node._spf_direction_runs_count[SOUTH] == runs_count[SOUTH]
+    assert test_node._spf_direction_runs_count[NORTH] == runs_count[NORTH] + 1
+    assert test_node._spf_trigger_history[NORTH][0] == "TIE South:1:Prefix:1 changed"
+    # A North-Node-TIE from another node is only used by South-SPF
+    test_node.remove_tie(packet_common.make_tie_id(NORTH, 11, NODE, 1))
+    test_node.spf_run()
+    assert test_node._spf_direction_runs_count[SOUTH] == runs_count[SOUTH] + 1
+    assert test_node._spf_direction_runs_count[NORTH] == runs_count[NORTH] + 1
+    assert test_node._spf_trigger_history[SOUTH][0] == "TIE North:11:Node:1 removed"
+    assert test_node._spf_trigger_history[NORTH][0] == "TIE South:1:Prefix:1 changed"
+    # A self-originated North-TIE is used by both South-SPF and North-SPF
+    prefix_tie = packet_common.make_prefix_tie_packet(NORTH, MY_SYSTEM_ID, 1, 1, 600)
+    packet_common.add_ipv4_prefix_to_prefix_tie(prefix_tie, "10.1.1.0/24", 2)
+    test_node.store_tie(prefix_tie)
+    test_node.spf_run()
+    assert test_node._spf_direction_runs_count[SOUTH] == runs_count[SOUTH] + 2
+    assert test_node._spf_direction_runs_count[NORTH] == runs_count[NORTH] + 2
+    # The results are the same as a full SPF run in both directions
+    results = spf_results(test_node)
+    test_node._spf_full_run_needed = {SOUTH: True, NORTH: True}
+    test_node.spf_run()
+    assert spf_results(test_node) == results
+
+def test_spf_csr_engine():
+    # pylint:disable=protected-access
+    timer.TIMER_SCHEDULER.stop_all_timers()
+    packet_common.add_missing_methods_to_thrift()
+    heap_node = make_spf_test_node("heap")
+    csr_node = make_spf_test_node("csr")
+    for test_node in [heap_node, csr_node]:
+        test_node.spf_run()
+    assert spf_results(csr_node) == spf_results(heap_node)
+    # Make the path via top-of-fabric node 1 more expensive than via top-of-fabric node 2, remove
+    # leaf 11, and check that both engines still produce the same routes.
+    node_tie = packet_common.make_node_tie_packet(MY_NAME, 1, NORTH, MY_SYSTEM_ID, 1, 2, 600)
+    for (nbr_system_id, level, cost) in [(1, 2, 5), (2, 2, 1), (10, 0, 1), (11, 0, 1)]:
+        link_id_pair = encoding.ttypes.LinkIDPair(MY_SYSTEM_ID, nbr_system_id)
+        node_tie.element.node.neighbors[nbr_system_id] = \
+            encoding.ttypes.NodeNeighborsTIEElement(level, cost, set([link_id_pair]), 100)
+    for test_node in [heap_node, csr_node]:
+        test_node.store_tie(node_tie)
+        test_node.remove_tie(packet_common.make_tie_id(NORTH, 11, NODE, 1))
+        test_node.spf_run()
+    assert spf_results(csr_node) == spf_results(heap_node)
+    assert "10.0.11.0/24" not in str(spf_results(csr_node))
+
+def test_spf_install_routes_in_rib_delta():
+    # pylint:disable=protected-access
+    timer.TIMER_SCHEDULER.stop_all_timers()
+    packet_common.add_missing_methods_to_thrift()
+    test_node = make_spf_test_node()
+    test_node.spf_run()
+    anycast_prefix = packet_common.make_ipv4_prefix("10.99.0.0/16")
+    leaf_prefix = packet_common.make_ipv4_prefix("10.0.11.0/24")
+    anycast_route = test_node._ipv4_rib.get_route(anycast_prefix, constants.OWNER_S_SPF)
+    leaf_route = test_node._ipv4_rib.get_route(leaf_prefix, constants.OWNER_S_SPF)
+    assert sorted(test_node._spf_destinations[SOUTH][anycast_prefix].predecessors) == [10, 11]
+    # A full SPF run with the same result does not touch the routes in the RIB
+    results = spf_results(test_node)
+    test_node._spf_full_run_needed = {SOUTH: True, NORTH: True}
+    test_node.spf_run()
+    assert spf_results(test_node) == results
+    assert test_node._ipv4_rib.get_route(anycast_prefix, constants.OWNER_S_SPF) is anycast_route
+    assert test_node._ipv4_rib.get_route(leaf_prefix, constants.OWNER_S_SPF) is leaf_route
+    # Remove leaf 11: its prefix is removed. The anycast prefix is only reachable via leaf 10, but
+    # the test node has no interfaces, so the next-hops (and hence the route) do not change.
+    test_node.remove_tie(packet_common.make_tie_id(NORTH, 11, NODE, 1))
+    test_node.spf_run()
+    assert test_node._spf_destinations[SOUTH][anycast_prefix].predecessors == [10]
+    assert test_node._ipv4_rib.get_route(leaf_prefix, constants.OWNER_S_SPF) is None
+    assert leaf_prefix not in test_node._spf_rib_next_hops[SOUTH]
+    assert test_node._ipv4_rib.get_route(anycast_prefix, constants.OWNER_S_SPF) is anycast_route
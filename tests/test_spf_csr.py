@@ -0,0 +1,57 @@
+import constants
+import spf_csr
+
+SOUTH = constants.DIR_SOUTH
+
+class Graph:
+
+    # A minimal SPF graph: a dict of lists of (neighbor index, cost, interface-ids) edges indexed by
+    # node index, for the South SPF only
+
+    def __init__(self, edges):
+        self.version = 1
+        self._edges = edges
+
+    def nr_nodes(self):
+        return len(self._edges)
+
+    def edges(self, spf_direction, index):
+        assert spf_direction == SOUTH
+        return self._edges[index]
+
+def csr_edges(csr_graph, index):
+    return sorted(zip(csr_graph.targets[csr_graph.offsets[index]:csr_graph.offsets[index + 1]],
+                      csr_graph.costs[csr_graph.offsets[index]:csr_graph.offsets[index + 1]]))
+
+def test_shortest_paths():
+    # Node 0 is the root; node 3 is reachable via nodes 1 and 2 at the same cost; node 4 has no
+    # node TIEs and node 5 is not reachable.
+    graph = Graph([
+        [(1, 1, (1,)), (2, 1, (2,))],
+        [(3, 2, ())],
+        [(3, 2, ()), (4, 5, ())],
+        [],
+        None,
+        [(0, 1, ())]])
+    csr_graph = spf_csr.CSRGraph(graph, SOUTH)
+    assert csr_graph.nr_nodes == 6
+    assert list(csr_graph.present) == [1, 1, 1, 1, 0, 1]
+    (costs, predecessors, order) = spf_csr.shortest_paths(csr_graph, 0)
+    assert list(costs) == [0, 1, 1, 3, 6, spf_csr.UNREACHED]
+    assert predecessors == [[], [0], [0], [1, 2], [2], None]
+    assert order == [0, 1, 2, 3, 4]
+
+def test_parallel_links():
+    # Node 0 reports node 1 twice (e.g. in two different node TIEs) with the same cost, and node 1
+    # reports node 2 twice with different costs. Only the cheapest parallel edge is kept, so each
+    # predecessor is only recorded once.
+    graph = Graph([
+        [(1, 1, (1,)), (1, 1, (2,))],
+        [(2, 3, ()), (2, 2, ())],
+        []])
+    csr_graph = spf_csr.CSRGraph(graph, SOUTH)
+    assert csr_edges(csr_graph, 0) == [(1, 1)]
+    assert csr_edges(csr_graph, 1) == [(2, 2)]
+    (costs, predecessors, _order) = spf_csr.shortest_paths(csr_graph, 0)
+    assert list(costs) == [0, 1, 3]
+    assert predecessors == [[], [0], [1]]
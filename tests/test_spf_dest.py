@@ -0,0 +1,51 @@
+import next_hop
+import spf_dest
+
+NHOP_1 = next_hop.NextHop("if1", None)
+NHOP_2 = next_hop.NextHop("if2", None)
+
+def test_candidates_ecmp():
+    candidates = spf_dest.SPFCandidates()
+    candidates.add_root(1, "node-1")
+    assert candidates.pop() == 0
+    candidates.consider(2, 1, 1, [NHOP_1], None)
+    candidates.consider(3, 1, 1, [NHOP_2], None)
+    candidates.consider(4, 3, 2, [NHOP_1], None)
+    # Equal cost path: ECMP
+    candidates.consider(4, 3, 3, [NHOP_2, NHOP_2], None)
+    # Worse path: ignored
+    candidates.consider(4, 4, 2, [NHOP_1], None)
+    assert sorted([candidates.pop(), candidates.pop()]) == [1, 2]
+    dest_id = candidates.pop()
+    assert candidates.pop() is None
+    destination = candidates.make_destination(dest_id)
+    assert destination.system_id == 4
+    assert destination.cost == 3
+    assert destination.best
+    assert destination.predecessors == [2, 3]
+    assert destination.next_hops == [NHOP_1, NHOP_2]
+    root = candidates.make_destination(0)
+    assert root.name == "node-1"
+    assert root.predecessors == []
+    assert root.next_hops == []
+
+def test_candidates_lazy_deletion():
+    candidates = spf_dest.SPFCandidates()
+    candidates.add_root(1, "node-1")
+    assert candidates.pop() == 0
+    # Destinations which are not system-ids are prefixes
+    candidates.consider("prefix", 10, 1, [NHOP_1], set(["a"]))
+    candidates.consider(3, 1, 1, [NHOP_2], None)
+    # Better path: the old path (including its next-hops and tags) is replaced
+    candidates.consider("prefix", 5, 3, [NHOP_2], set(["b"]))
+    candidates.consider("prefix", 5, 1, [NHOP_2], set(["c"]))
+    assert candidates.pop() == 2
+    assert candidates.pop() == 1
+    # The stale entry with cost 10 is skipped
+    assert candidates.pop() is None
+    destination = candidates.make_destination(1)
+    assert destination.prefix == "prefix"
+    assert destination.cost == 5
+    assert destination.predecessors == [3, 1]
+    assert destination.next_hops == [NHOP_2]
+    assert destination.tags == set(["b", "c"])
@@ -0,0 +1,110 @@
+import constants
+import encoding.ttypes
+import packet_common
+import spf_graph
+
+# Allow long names for test functions
+# pylint: disable=invalid-name
+
+SOUTH = constants.DIR_SOUTH
+NORTH = constants.DIR_NORTH
+MY_SYSTEM_ID = 999
+
+class TieDB:
+
+    # A minimal TIE-DB with only node TIEs (one per node and direction)
+
+    def __init__(self):
+        self.node_ties_by_key = {}
+
+    def node_ties(self, direction, system_id):
+        node_tie = self.node_ties_by_key.get((direction, system_id))
+        if node_tie is None:
+            return []
+        return [node_tie]
+
+    def store(self, graph, node_tie):
+        tie_id = node_tie.header.tieid
+        self.node_ties_by_key[(tie_id.direction, tie_id.originator)] = node_tie
+        graph.node_tie_changed(tie_id)
+
+    def remove(self, graph, direction, system_id):
+        node_tie = self.node_ties_by_key.pop((direction, system_id))
+        graph.node_tie_changed(node_tie.header.tieid)
+
+def use_tie_direction(system_id, spf_direction):
+    # Same as Node.spf_use_tie_direction
+    if spf_direction == SOUTH or system_id == MY_SYSTEM_ID:
+        return NORTH
+    return SOUTH
+
+def make_node_tie(system_id, level, direction, neighbors, cost=1):
+    # Neighbors is a list of (nbr_system_id, nbr_level, local_id, remote_id)
+    node_tie = packet_common.make_node_tie_packet("node-{}".format(system_id), level, direction,
+                                                  system_id, 1, 1, 600)
+    for (nbr_system_id, nbr_level, local_id, remote_id) in neighbors:
+        link_id_pair = encoding.ttypes.LinkIDPair(local_id, remote_id)
+        node_tie.element.node.neighbors[nbr_system_id] = \
+            encoding.ttypes.NodeNeighborsTIEElement(nbr_level, cost, set([link_id_pair]), 100)
+    return node_tie
+
+def graph_edges(graph, spf_direction, system_id):
+    edges = graph.edges(spf_direction, graph.node_index(system_id))
+    if edges is None:
+        return None
+    return sorted((graph.system_id(nbr_index), cost, interface_ids)
+                  for (nbr_index, cost, interface_ids) in edges)
+
+def make_graph():
+    # This node (level 1) with top-of-fabric node 1 (level 2) above it and leaf 10 (level 0) below
+    # it; link-ids 1 and 2 are the local link-ids of this node.
+    packet_common.add_missing_methods_to_thrift()
+    tie_db = TieDB()
+    graph = spf_graph.SPFGraph(tie_db.node_ties, use_tie_direction)
+    my_neighbors = [(1, 2, 1, 101), (10, 0, 2, 102)]
+    for direction in [SOUTH, NORTH]:
+        tie_db.store(graph, make_node_tie(MY_SYSTEM_ID, 1, direction, my_neighbors))
+        tie_db.store(graph, make_node_tie(1, 2, direction, [(MY_SYSTEM_ID, 1, 101, 1)]))
+        tie_db.store(graph, make_node_tie(10, 0, direction, [(MY_SYSTEM_ID, 1, 102, 2)]))
+    return (tie_db, graph)
+
+def test_bidirectional_edges():
+    packet_common.add_missing_methods_to_thrift()
+    (_tie_db, graph) = make_graph()
+    assert graph_edges(graph, SOUTH, MY_SYSTEM_ID) == [(10, 1, (2,))]
+    assert graph_edges(graph, NORTH, MY_SYSTEM_ID) == [(1, 1, (1,))]
+    assert graph_edges(graph, SOUTH, 10) == []
+    assert graph_edges(graph, NORTH, 1) == []
+    assert graph.name(SOUTH, graph.node_index(MY_SYSTEM_ID)) == "node-999"
+
+def test_incremental_update():
+    packet_common.add_missing_methods_to_thrift()
+    (tie_db, graph) = make_graph()
+    assert graph_edges(graph, SOUTH, MY_SYSTEM_ID) == [(10, 1, (2,))]
+    assert graph_edges(graph, NORTH, MY_SYSTEM_ID) == [(1, 1, (1,))]
+    # The leaf reports the adjacency with the wrong link-ids: no longer bi-directional
+    tie_db.store(graph, make_node_tie(10, 0, NORTH, [(MY_SYSTEM_ID, 1, 102, 3)]))
+    assert graph_edges(graph, SOUTH, MY_SYSTEM_ID) == []
+    # The leaf fixes the link-ids: bi-directional again
+    tie_db.store(graph, make_node_tie(10, 0, NORTH, [(MY_SYSTEM_ID, 1, 102, 2)]))
+    assert graph_edges(graph, SOUTH, MY_SYSTEM_ID) == [(10, 1, (2,))]
+    # The cost of the adjacency changes
+    my_neighbors = [(1, 2, 1, 101), (10, 0, 2, 102)]
+    tie_db.store(graph, make_node_tie(MY_SYSTEM_ID, 1, NORTH, my_neighbors, cost=5))
+    assert graph_edges(graph, SOUTH, MY_SYSTEM_ID) == [(10, 5, (2,))]
+    assert graph_edges(graph, NORTH, MY_SYSTEM_ID) == [(1, 5, (1,))]
+    # The top-of-fabric node disappears
+    tie_db.remove(graph, SOUTH, 1)
+    tie_db.remove(graph, NORTH, 1)
+    assert graph_edges(graph, NORTH, MY_SYSTEM_ID) == []
+    assert graph_edges(graph, SOUTH, 1) is None
+    assert graph_edges(graph, NORTH, 1) is None
+    # The incrementally updated graph is the same as a graph which is rebuilt from scratch
+    rebuilt_graph = spf_graph.SPFGraph(tie_db.node_ties, use_tie_direction)
+    for system_id in [MY_SYSTEM_ID, 1, 10]:
+        rebuilt_graph.node_index(system_id)
+    rebuilt_graph.mark_all_dirty()
+    for spf_direction in [SOUTH, NORTH]:
+        for system_id in [MY_SYSTEM_ID, 1, 10]:
+            assert (graph_edges(graph, spf_direction, system_id) ==
+                    graph_edges(rebuilt_graph, spf_direction, system_id))
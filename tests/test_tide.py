@@ -0,0 +1,128 @@
+import time
+
+import common.ttypes
+import constants
+import node
+import packet_common
+from fake_clock import FakeClock
+
+MY_NAME = "name"
+MY_SYSTEM_ID = 999
+
+SOUTH = constants.DIR_SOUTH
+NORTH = constants.DIR_NORTH
+EW = constants.DIR_EAST_WEST
+
+NODE = common.ttypes.TIETypeType.NodeTIEType
+PREFIX = common.ttypes.TIETypeType.PrefixTIEType
+
+def make_test_node(db_tie_info_list):
+    config = {
+        "name": "test",
+        "systemid": MY_SYSTEM_ID,
+        "level": 2,
+        "skip-self-orginated-ties": True
+    }
+    test_node = node.Node(config)
+    for (direction, originator, tietype, tie_nr, seq_nr, lifetime) in db_tie_info_list:
+        if tietype == NODE:
+            db_tie = packet_common.make_node_tie_packet(MY_NAME, originator % 4, direction,
+                                                        originator, tie_nr, seq_nr, lifetime)
+        else:
+            db_tie = packet_common.make_prefix_tie_packet(direction, originator, tie_nr, seq_nr,
+                                                          lifetime)
+        test_node.store_tie(db_tie)
+    return test_node
+
+def test_tide_tie_headers_for_neighbor():
+    # pylint:disable=too-many-locals
+    packet_common.add_missing_methods_to_thrift()
+    db_tie_info_list = []
+    for direction in [SOUTH, NORTH]:
+        for originator in [10, 11, 12, MY_SYSTEM_ID]:
+            db_tie_info_list.append((direction, originator, NODE, 1, 1, 600))
+            db_tie_info_list.append((direction, originator, PREFIX, 2, 1, 600))
+            db_tie_info_list.append((direction, originator, PREFIX, 3, 1, 600))
+    test_node = make_test_node(db_tie_info_list)
+    for direction in [SOUTH, NORTH, EW]:
+        for neighbor_level in [1, 2, 3]:
+            for neighbor_is_top_of_fabric in [False, True]:
+                tie_headers_by_class = {}
+                for neighbor_system_id in [10, 11, 20]:
+                    expected_tie_headers = test_node.generate_tide_tie_headers(
+                        direction, neighbor_system_id, neighbor_level, neighbor_is_top_of_fabric,
+                        test_node.level_value(), test_node.top_of_fabric())
+                    tie_headers = test_node.tide_tie_headers_for_neighbor(
+                        direction, neighbor_system_id, neighbor_level, neighbor_is_top_of_fabric,
+                        tie_headers_by_class)
+                    assert tie_headers == expected_tie_headers
+                assert len(tie_headers_by_class) == 1
+
+def test_tide_protocol_packets(monkeypatch):
+    # pylint:disable=protected-access,too-many-locals
+    packet_common.add_missing_methods_to_thrift()
+    clock = FakeClock(monkeypatch)
+    db_tie_info_list = [
+        # pylint:disable=bad-whitespace
+        # Direction Origin Type     TieNr SeqNr Lifetime
+        (SOUTH,     10,    PREFIX,  1,    1,    600)]
+    for originator in range(11, 20):
+        db_tie_info_list.append((NORTH, originator, PREFIX, 1, 1, 600))
+    test_node = make_test_node(db_tie_info_list)
+    tie_headers = [tie.header for tie in test_node.ties.values()]
+    # Room for three TIE headers per TIDE
+    max_size = 3 * packet_common.tide_tie_header_size(tie_headers[0])
+    packets_1 = test_node.tide_protocol_packets(tie_headers, max_size)
+    tide_packets = [packet_common.decode_protocol_packet(encoded).content.tide
+                    for (_, encoded) in packets_1]
+    assert [len(tide_packet.headers) for tide_packet in tide_packets] == [3, 3, 3, 1]
+    assert tide_packets[0].start_range == node.Node.MIN_TIE_ID
+    assert tide_packets[0].end_range == tie_headers[2].tieid
+    assert tide_packets[1].start_range == tie_headers[3].tieid
+    assert tide_packets[3].end_range == node.Node.MAX_TIE_ID
+    received_headers = [header for tide_packet in tide_packets for header in tide_packet.headers]
+    assert received_headers == tie_headers
+    # A receiver with the same TIEs stops sending all TIEs and requests none
+    rx_node = make_test_node(db_tie_info_list)
+    for tide_packet in tide_packets:
+        result = rx_node.process_received_tide_packet(tide_packet, "if1")
+        (request_tie_headers, start_sending_tie_headers, stop_sending_tie_headers) = result
+        assert request_tie_headers == []
+        assert start_sending_tie_headers == []
+        assert len(stop_sending_tie_headers) == len(tide_packet.headers)
+    # A receiver with an extra TIE in the gap between two TIDEs starts sending that TIE only
+    rx_node = make_test_node(db_tie_info_list + [(NORTH, 13, PREFIX, 2, 1, 600)])
+    start_sending_tie_ids = []
+    for tide_packet in tide_packets:
+        (_, start_sending_tie_headers, _) = rx_node.process_received_tide_packet(tide_packet, "if1")
+        start_sending_tie_ids.extend([header.tieid for header in start_sending_tie_headers])
+    assert start_sending_tie_ids == [packet_common.make_tie_id(NORTH, 13, PREFIX, 2)]
+    # After the adjacency went down and came back up, the first TIDE received is not treated as a
+    # continuation of the last TIDE received before: the gap before it starts at MIN_TIE_ID
+    rx_node.process_received_tide_packet(tide_packets[0], "if1")
+    rx_node.forget_received_tides("if1")
+    assert "if1" not in rx_node._last_received_tide_end
+    (_, start_sending_tie_headers, _) = rx_node.process_received_tide_packet(tide_packets[2], "if1")
+    assert len(start_sending_tie_headers) == len(tide_packets[0].headers) + 4
+    # Unchanged ranges are not encoded again
+    packets_2 = test_node.tide_protocol_packets(tie_headers, max_size)
+    assert all(encoded_2 is encoded_1
+               for ((_, encoded_1), (_, encoded_2)) in zip(packets_1, packets_2))
+    # Only the range containing an updated TIE is encoded again
+    test_node.store_tie(packet_common.make_prefix_tie_packet(NORTH, 15, 1, 2, 600))
+    tie_headers = [tie.header for tie in test_node.ties.values()]
+    packets_3 = test_node.tide_protocol_packets(tie_headers, max_size)
+    assert [encoded_3 is encoded_1
+            for ((_, encoded_1), (_, encoded_3)) in zip(packets_1, packets_3)] == [
+                True, False, True, True]
+    # Setting the wall clock back does not affect the refresh interval, but after the refresh
+    # interval on the monotonic clock all ranges are encoded again
+    monkeypatch.setattr(time, "time", lambda: 0.0)
+    clock.advance(node.Node.TIDE_REFRESH_INTERVAL - 1.0)
+    packets_4 = test_node.tide_protocol_packets(tie_headers, max_size)
+    assert all(encoded_4 is encoded_3
+               for ((_, encoded_3), (_, encoded_4)) in zip(packets_3, packets_4))
+    clock.advance(1.0)
+    packets_5 = test_node.tide_protocol_packets(tie_headers, max_size)
+    assert not any(encoded_5 is encoded_4
+                   for ((_, encoded_4), (_, encoded_5)) in zip(packets_4, packets_5))
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+# Micro-benchmark for the CPU cost of debug logging on the packet send and receive paths.
+#
+# This measures the time per packet of Interface.send_protocol_packet and
+# Interface.receive_message_common, and compares it to a reference implementation of the same paths
+# which formats the log arguments (the protocol packet and the address and port strings) eagerly,
+# i.e. regardless of whether the logger is enabled. Run it at the default log level (info) to see
+# the cost of formatting log messages which are never emitted.
+#
+# Packets are not actually sent; the send handlers of the interface discard the messages.
+#
+# Run from the root of the repository: tools/benchmark_logging.py
+
+import argparse
+import logging
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rift"))
+
+# pylint:disable=wrong-import-position
+import constants
+import encoding.ttypes
+import node
+import packet_common
+import table
+
+# pylint:disable=protected-access
+
+class BenchmarkEngine:
+
+    # The node is not running (there are no active nodes), so the interfaces don't open sockets
+    tx_src_address = ''
+    active_nodes = []
+    multicast_loopback = True
+
+class DiscardSendHandler:
+
+    def __init__(self, remote_address, port):
+        self.remote_address = remote_address
+        self.port = port
+
+    def send_message(self, message):
+        pass
+
+def reference_tx_debug(intf, msg, *args):
+    intf._tx_log.debug("[%s] %s" % (intf._log_id, msg), *args)
+
+def reference_rx_debug(intf, msg, *args):
+    intf._rx_log.debug("[%s] %s" % (intf._log_id, msg), *args)
+
+def reference_send_protocol_packet(intf, protocol_packet, flood, encoded_protocol_packet=None):
+    if flood:
+        handler = intf._flood_send_handler
+    else:
+        handler = intf._lie_send_handler
+    to_str = "{}:{}".format(handler.remote_address, handler.port)
+    protocol_packet_str = str(protocol_packet)
+    if encoded_protocol_packet is None:
+        encoded_protocol_packet = packet_common.encode_protocol_packet(protocol_packet)
+    handler.send_message(encoded_protocol_packet)
+    reference_tx_debug(intf, "Send %s to %s", protocol_packet_str, to_str)
+
+def reference_receive_message_common(intf, message, from_address_and_port, port_name,
+                                     port_content_types):
+    (address, port) = from_address_and_port
+    from_str = "{}:{}".format(address, port)
+    if intf._rx_fail:
+        reference_rx_debug(intf, "Simulated receive failure from %s", from_str)
+        return None
+    decoded_header = packet_common.decode_protocol_packet_header(message)
+    if decoded_header is None:
+        intf.rx_error("Could not decode message received from %s", from_str)
+        return None
+    (packet_header, content_type) = decoded_header
+    if packet_header.sender == intf._node.system_id:
+        reference_rx_debug(intf, "Looped receive %s from %s", packet_header, from_str)
+        return None
+    if content_type is None:
+        intf.rx_warning("Received packet without content from %s", from_str)
+        return None
+    if packet_header.major_version != constants.RIFT_MAJOR_VERSION:
+        intf.rx_error("Received different major protocol version from %s (local version %d, "
+                      "remote version %d)", from_str, constants.RIFT_MAJOR_VERSION,
+                      packet_header.major_version)
+        return None
+    if content_type not in port_content_types:
+        intf.rx_warning("Received %s packet on %s port (ignored)", content_type.upper(), port_name)
+        return None
+    (protocol_packet, cache_hit) = intf._node.decode_cache.decode(message, content_type)
+    if cache_hit is True:
+        intf._decode_cache_hits += 1
+    elif cache_hit is False:
+        intf._decode_cache_misses += 1
+    if protocol_packet is None:
+        intf.rx_error("Could not decode message received from %s", from_str)
+        return None
+    reference_rx_debug(intf, "Receive %s from %s", protocol_packet, from_str)
+    return protocol_packet
+
+def make_interface():
+    config = {
+        'name': 'benchmark-node',
+        'systemid': 1,
+        'level': 1,
+        'skip-self-orginated-ties': True,
+        'interfaces': [{'name': 'if1'}]
+    }
+    benchmark_node = node.Node(config, BenchmarkEngine())
+    intf = benchmark_node._interfaces_by_name['if1']
+    intf._lie_send_handler = DiscardSendHandler("224.0.0.120", 10000)
+    intf._flood_send_handler = DiscardSendHandler("1.2.3.4", 10001)
+    return intf
+
+def make_tie_protocol_packet(nr_prefixes):
+    tie_packet = packet_common.make_prefix_tie_packet(
+        direction=constants.DIR_SOUTH,
+        originator=2,
+        tie_nr=1,
+        seq_nr=10,
+        lifetime=600)
+    for prefix_nr in range(nr_prefixes):
+        prefix_str = "10.{}.{}.0/24".format(prefix_nr // 256, prefix_nr % 256)
+        packet_common.add_ipv4_prefix_to_prefix_tie(tie_packet, prefix_str, 1)
+    return encoding.ttypes.ProtocolPacket(
+        header=encoding.ttypes.PacketHeader(sender=2, level=1),
+        content=encoding.ttypes.PacketContent(tie=tie_packet))
+
+def microseconds_per_packet(function, iterations):
+    seconds = timeit.timeit(function, number=iterations)
+    return 1000000.0 * seconds / iterations
+
+def parse_command_line_arguments():
+    parser = argparse.ArgumentParser(description='RIFT send and receive logging benchmark')
+    parser.add_argument('-i', '--iterations', type=int, default=5000,
+                        help='Number of times each packet is sent and received')
+    parser.add_argument('-n', '--nr-prefixes', type=int, default=20,
+                        help='Number of prefixes in the TIE packet')
+    parser.add_argument('-l', '--log-level', default='info',
+                        choices=['debug', 'info', 'warning', 'error', 'critical'],
+                        help='Log level')
+    args = parser.parse_args()
+    return args
+
+def main():
+    args = parse_command_line_arguments()
+    logging.basicConfig(stream=open(os.devnull, "w"), level=args.log_level.upper())
+    packet_common.add_missing_methods_to_thrift()
+    intf = make_interface()
+    protocol_packet = make_tie_protocol_packet(args.nr_prefixes)
+    encoded_protocol_packet = packet_common.encode_protocol_packet(protocol_packet)
+    from_address_and_port = ("1.2.3.4", 10001)
+    content_types = ["tie", "tide", "tire"]
+    paths = [
+        ("Send TIE (pre-encoded)",
+         lambda: reference_send_protocol_packet(intf, protocol_packet, True,
+                                                encoded_protocol_packet),
+         lambda: intf.send_protocol_packet(protocol_packet, True, encoded_protocol_packet)),
+        ("Receive TIE",
+         lambda: reference_receive_message_common(intf, encoded_protocol_packet,
+                                                  from_address_and_port, "flood", content_types),
+         lambda: intf.receive_message_common(encoded_protocol_packet, from_address_and_port,
+                                             "flood", content_types))
+    ]
+    tab = table.Table()
+    tab.add_row([
+        "Path",
+        ["Reference", "Usec/Packet"],
+        ["Current", "Usec/Packet"],
+        "Speedup"])
+    for (name, reference_function, function) in paths:
+        reference_usecs = microseconds_per_packet(reference_function, args.iterations)
+        usecs = microseconds_per_packet(function, args.iterations)
+        tab.add_row([
+            name,
+            "{:.2f}".format(reference_usecs),
+            "{:.2f}".format(usecs),
+            "{:.2f}x".format(reference_usecs / usecs)])
+    print("Log level: {}".format(args.log_level))
+    print(tab.to_string())
+
+if __name__ == "__main__":
+    main()
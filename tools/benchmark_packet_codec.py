@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+# Micro-benchmark for encoding and decoding RIFT protocol packets.
+#
+# For each type of packet (LIE, node TIE, prefix TIE, TIDE, TIRE) this measures the throughput of
+# the reference encode/decode path (deep copy of the packet plus the generic fix_... functions which
+# interpret the fixes specification for every field) and of the path that is actually used by
+# packet_common.encode_protocol_packet and packet_common.decode_protocol_packet.
+#
+# Run from the root of the repository: tools/benchmark_packet_codec.py
+
+import argparse
+import copy
+import os
+import sys
+import timeit
+
+import thrift.protocol.TBinaryProtocol
+import thrift.transport.TTransport
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rift"))
+
+# pylint:disable=wrong-import-position
+import common.ttypes
+import encoding.ttypes
+import packet_common
+import table
+
+SOUTH = common.ttypes.TieDirectionType.South
+NORTH = common.ttypes.TieDirectionType.North
+
+def reference_encode_protocol_packet(protocol_packet):
+    fixed_protocol_packet = copy.deepcopy(protocol_packet)
+    packet_common.fix_prot_packet_before_encode(fixed_protocol_packet)
+    transport_out = thrift.transport.TTransport.TMemoryBuffer()
+    protocol_out = thrift.protocol.TBinaryProtocol.TBinaryProtocol(transport_out)
+    fixed_protocol_packet.write(protocol_out)
+    return transport_out.getvalue()
+
+def reference_decode_protocol_packet(encoded_protocol_packet):
+    transport_in = thrift.transport.TTransport.TMemoryBuffer(encoded_protocol_packet)
+    protocol_in = thrift.protocol.TBinaryProtocol.TBinaryProtocol(transport_in)
+    protocol_packet = encoding.ttypes.ProtocolPacket()
+    protocol_packet.read(protocol_in)
+    packet_common.fix_prot_packet_after_decode(protocol_packet)
+    return protocol_packet
+
+def make_protocol_packet(**content):
+    return encoding.ttypes.ProtocolPacket(
+        header=encoding.ttypes.PacketHeader(sender=packet_common.MAX_U64 - 1, level=1),
+        content=encoding.ttypes.PacketContent(**content))
+
+def make_lie_protocol_packet():
+    lie_packet = encoding.ttypes.LIEPacket(
+        name="benchmark-node",
+        local_id=1,
+        flood_port=10001,
+        link_mtu_size=1400,
+        neighbor=encoding.ttypes.Neighbor(originator=packet_common.MAX_U64 - 2, remote_id=2),
+        pod=0,
+        nonce=packet_common.MAX_U64 - 3,
+        last_neighbor_nonce=packet_common.MAX_U64 - 4,
+        capabilities=encoding.ttypes.NodeCapabilities(flood_reduction=True),
+        holdtime=3)
+    return make_protocol_packet(lie=lie_packet)
+
+def make_node_tie_protocol_packet(nr_neighbors):
+    tie_packet = packet_common.make_node_tie_packet(
+        name="benchmark-node",
+        level=1,
+        direction=SOUTH,
+        originator=packet_common.MAX_U64 - 1,
+        tie_nr=1,
+        seq_nr=10,
+        lifetime=600)
+    for neighbor_nr in range(nr_neighbors):
+        link_id_pair = encoding.ttypes.LinkIDPair(neighbor_nr + 1, neighbor_nr + 1001)
+        neighbor = encoding.ttypes.NodeNeighborsTIEElement(
+            level=0,
+            cost=1,
+            link_ids=set([link_id_pair]),
+            bandwidth=100)
+        tie_packet.element.node.neighbors[packet_common.MAX_U64 - 10 - neighbor_nr] = neighbor
+    return make_protocol_packet(tie=tie_packet)
+
+def make_prefix_tie_protocol_packet(nr_prefixes):
+    tie_packet = packet_common.make_prefix_tie_packet(
+        direction=NORTH,
+        originator=packet_common.MAX_U64 - 1,
+        tie_nr=1,
+        seq_nr=10,
+        lifetime=600)
+    for prefix_nr in range(nr_prefixes):
+        prefix_str = "10.{}.{}.0/24".format(prefix_nr // 256, prefix_nr % 256)
+        packet_common.add_ipv4_prefix_to_prefix_tie(tie_packet, prefix_str, 1)
+    return make_protocol_packet(tie=tie_packet)
+
+def make_tie_headers(nr_headers):
+    tie_headers = []
+    for header_nr in range(nr_headers):
+        tie_header = packet_common.make_tie_header(
+            direction=SOUTH,
+            originator=packet_common.MAX_U64 - header_nr,
+            tie_type=common.ttypes.TIETypeType.NodeTIEType,
+            tie_nr=1,
+            seq_nr=header_nr + 1,
+            lifetime=600)
+        tie_headers.append(tie_header)
+    return tie_headers
+
+def make_tide_protocol_packet(nr_headers):
+    tide_packet = packet_common.make_tide_packet(
+        start_range=packet_common.make_tie_id(SOUTH, 0, 0, 0),
+        end_range=packet_common.make_tie_id(NORTH, packet_common.MAX_U64, 0, packet_common.MAX_U32))
+    for tie_header in make_tie_headers(nr_headers):
+        packet_common.add_tie_header_to_tide(tide_packet, tie_header)
+    return make_protocol_packet(tide=tide_packet)
+
+def make_tire_protocol_packet(nr_headers):
+    tire_packet = packet_common.make_tire_packet()
+    for tie_header in make_tie_headers(nr_headers):
+        packet_common.add_tie_header_to_tire(tire_packet, tie_header)
+    return make_protocol_packet(tire=tire_packet)
+
+def packets_per_second(function, argument, iterations):
+    seconds = timeit.timeit(lambda: function(argument), number=iterations)
+    return iterations / seconds
+
+def benchmark_packet(tab, name, protocol_packet, iterations):
+    encoded_protocol_packet = packet_common.encode_protocol_packet(protocol_packet)
+    assert encoded_protocol_packet == reference_encode_protocol_packet(protocol_packet)
+    reference_encode_rate = packets_per_second(reference_encode_protocol_packet, protocol_packet,
+                                               iterations)
+    encode_rate = packets_per_second(packet_common.encode_protocol_packet, protocol_packet,
+                                     iterations)
+    reference_decode_rate = packets_per_second(reference_decode_protocol_packet,
+                                               encoded_protocol_packet, iterations)
+    decode_rate = packets_per_second(packet_common.decode_protocol_packet,
+                                     encoded_protocol_packet, iterations)
+    tab.add_row([
+        name,
+        len(encoded_protocol_packet),
+        "{:.0f}".format(reference_encode_rate),
+        "{:.0f}".format(encode_rate),
+        "{:.2f}x".format(encode_rate / reference_encode_rate),
+        "{:.0f}".format(reference_decode_rate),
+        "{:.0f}".format(decode_rate),
+        "{:.2f}x".format(decode_rate / reference_decode_rate)])
+
+def parse_command_line_arguments():
+    parser = argparse.ArgumentParser(description='RIFT packet encode/decode benchmark')
+    parser.add_argument('-i', '--iterations', type=int, default=2000,
+                        help='Number of times each packet is encoded and decoded')
+    parser.add_argument('-n', '--nr-elements', type=int, default=50,
+                        help='Number of neighbors, prefixes, or TIE headers in each packet')
+    args = parser.parse_args()
+    return args
+
+def main():
+    args = parse_command_line_arguments()
+    packet_common.add_missing_methods_to_thrift()
+    packets = [
+        ("LIE", make_lie_protocol_packet()),
+        ("Node TIE", make_node_tie_protocol_packet(args.nr_elements)),
+        ("Prefix TIE", make_prefix_tie_protocol_packet(args.nr_elements)),
+        ("TIDE", make_tide_protocol_packet(args.nr_elements)),
+        ("TIRE", make_tire_protocol_packet(args.nr_elements))
+    ]
+    tab = table.Table()
+    tab.add_row([
+        "Packet",
+        ["Encoded", "Size"],
+        ["Reference", "Encodes/sec"],
+        ["Current", "Encodes/sec"],
+        ["Encode", "Speedup"],
+        ["Reference", "Decodes/sec"],
+        ["Current", "Decodes/sec"],
+        ["Decode", "Speedup"]])
+    for (name, protocol_packet) in packets:
+        benchmark_packet(tab, name, protocol_packet, args.iterations)
+    print(tab.to_string())
+
+if __name__ == "__main__":
+    main()
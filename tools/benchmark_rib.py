@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+# Micro-benchmark for owner-scoped operations on the RIB (route table).
+#
+# This fills a route table with a large number of North-SPF host routes and a handful of South-SPF
+# routes, and measures the time of refreshing the South-SPF routes (mark the South-SPF routes
+# stale, put them again, and delete the remaining stale routes) and of counting the routes. Each
+# test is run once with a reference implementation which scans all routes in the route table, and
+# once with the current implementation which uses the per-owner route index.
+#
+# Run from the root of the repository: tools/benchmark_rib.py
+
+import argparse
+import functools
+import logging
+import os
+import sys
+import timeit
+import types
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rift"))
+
+# pylint:disable=wrong-import-position
+import constants
+import fib
+import packet_common
+import rib
+import route
+import table
+
+def reference_mark_owner_routes_stale(self, owner):
+    count = 0
+    for rte in self.all_routes():
+        if rte.owner == owner:
+            rte.stale = True
+            count += 1
+    return count
+
+def reference_del_stale_routes(self):
+    routes_to_delete = []
+    for rte in self.all_routes():
+        if rte.stale:
+            routes_to_delete.append((rte.prefix, rte.owner))
+    for (prefix, owner) in routes_to_delete:
+        self.del_route(prefix, owner)
+    return len(routes_to_delete)
+
+def reference_nr_routes(self):
+    count = 0
+    for destination in self.destinations.values():
+        count += len(destination.routes)
+    return count
+
+def install_reference_methods(route_table):
+    route_table.mark_owner_routes_stale = types.MethodType(reference_mark_owner_routes_stale,
+                                                           route_table)
+    route_table.del_stale_routes = types.MethodType(reference_del_stale_routes, route_table)
+    route_table.nr_routes = types.MethodType(reference_nr_routes, route_table)
+
+def install_current_methods(route_table):
+    del route_table.mark_owner_routes_stale
+    del route_table.del_stale_routes
+    del route_table.nr_routes
+
+def make_route_table(nr_north_routes, nr_south_routes):
+    forwarding_table = fib.ForwardingTable(constants.ADDRESS_FAMILY_IPV4, kernel=None, log=None,
+                                           log_id="")
+    route_table = rib.RouteTable(constants.ADDRESS_FAMILY_IPV4, forwarding_table, log=None,
+                                 log_id="")
+    for route_nr in range(nr_north_routes):
+        prefix_str = "10.{}.{}.{}/32".format(route_nr // 65536, (route_nr // 256) % 256,
+                                             route_nr % 256)
+        route_table.put_route(route.Route(packet_common.make_ip_prefix(prefix_str),
+                                          constants.OWNER_N_SPF, []))
+    south_routes = []
+    for route_nr in range(nr_south_routes):
+        prefix_str = "{}.0.0.0/8".format(route_nr + 1)
+        south_routes.append(route.Route(packet_common.make_ip_prefix(prefix_str),
+                                        constants.OWNER_S_SPF, []))
+    return (route_table, south_routes)
+
+def refresh_south_routes(route_table, south_routes):
+    route_table.mark_owner_routes_stale(constants.OWNER_S_SPF)
+    for rte in south_routes:
+        route_table.put_route(rte)
+    assert route_table.del_stale_routes() == 0
+
+def count_routes(route_table, expected_nr_routes):
+    assert route_table.nr_routes() == expected_nr_routes
+
+def milliseconds_per_run(function, iterations):
+    seconds = timeit.timeit(function, number=iterations)
+    return 1000.0 * seconds / iterations
+
+def parse_command_line_arguments():
+    parser = argparse.ArgumentParser(description='RIFT RIB benchmark')
+    parser.add_argument('-i', '--iterations', type=int, default=20,
+                        help='Number of times each test is repeated')
+    parser.add_argument('-n', '--nr-north-routes', type=int, default=100000,
+                        help='Number of North-SPF routes')
+    parser.add_argument('-s', '--nr-south-routes', type=int, default=5,
+                        help='Number of South-SPF routes')
+    args = parser.parse_args()
+    return args
+
+def main():
+    args = parse_command_line_arguments()
+    logging.basicConfig(stream=open(os.devnull, "w"), level=logging.CRITICAL)
+    packet_common.add_missing_methods_to_thrift()
+    (route_table, south_routes) = make_route_table(args.nr_north_routes, args.nr_south_routes)
+    for rte in south_routes:
+        route_table.put_route(rte)
+    nr_routes = args.nr_north_routes + args.nr_south_routes
+    tests = [
+        ("Refresh South-SPF routes",
+         functools.partial(refresh_south_routes, route_table, south_routes)),
+        ("Count routes",
+         functools.partial(count_routes, route_table, nr_routes))
+    ]
+    tab = table.Table()
+    tab.add_row([
+        "Test",
+        ["Reference", "Msec/Run"],
+        ["Current", "Msec/Run"],
+        "Speedup"])
+    for (name, function) in tests:
+        install_reference_methods(route_table)
+        reference_msecs = milliseconds_per_run(function, args.iterations)
+        install_current_methods(route_table)
+        msecs = milliseconds_per_run(function, args.iterations)
+        tab.add_row([
+            name,
+            "{:.3f}".format(reference_msecs),
+            "{:.3f}".format(msecs),
+            "{:.0f}x".format(reference_msecs / msecs)])
+    print("Routes: {}".format(nr_routes))
+    print(tab.to_string())
+
+if __name__ == "__main__":
+    main()
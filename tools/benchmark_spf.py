@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+
+# Micro-benchmark for the CPU cost of the Shortest Path First (SPF) computation.
+#
+# This generates the TIE-DB of a 3-level Clos topology (leafs and spines grouped in pods, and a
+# layer of top-of-fabric nodes), stores it in a node at each level, and measures the time of a
+# complete SPF run (south and north). Instead of giving the size of the Clos topology on the
+# command line, it can also be taken from one of the meta-topology files in directory
+# meta_topology (as used by tools/config_generator.py), scaled up by a given factor.
+#
+# The run is timed with a reference implementation which derives the adjacencies of every visited
+# node from the node TIEs (doing a range lookup in the TIE-DB, which is sorted by TIE-ID, for every
+# visited node and for every neighbor of every visited node) and which uses a heapdict priority
+# queue with an SPFDest object for every considered path, with the current implementation which
+# uses the incrementally maintained SPF graph and a heapq priority queue with integer destination
+# ids, and with the current implementation after all nodes in the SPF graph have been marked dirty
+# (i.e. including the cost of rebuilding the graph from scratch), and with the array-backed (CSR)
+# SPF engine.
+#
+# Run from the root of the repository: tools/benchmark_spf.py
+
+import argparse
+import functools
+import logging
+import os
+import sys
+import timeit
+import types
+
+import heapdict
+import yaml
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rift"))
+
+# pylint:disable=wrong-import-position
+import common.constants
+import constants
+import encoding.ttypes
+import node
+import packet_common
+import spf_dest
+import spf_graph
+import table
+
+# pylint:disable=protected-access
+
+LEAF_LEVEL = 0
+SPINE_LEVEL = 1
+TOF_LEVEL = 2
+
+def reference_ties_of_type(self, direction, system_id, prefix_type):
+    node_ties = []
+    start_tie_id = packet_common.make_tie_id(direction, system_id, prefix_type, 0)
+    end_tie_id = packet_common.make_tie_id(direction, system_id, prefix_type,
+                                           packet_common.MAX_U32)
+    node_tie_ids = self.ties.irange(start_tie_id, end_tie_id, (True, True))
+    for node_tie_id in node_tie_ids:
+        node_tie = self.ties[node_tie_id]
+        node_ties.append(node_tie)
+    return node_ties
+
+def reference_is_neighbor_bidirectional(self, visit_system_id, nbr_system_id, nbr_tie_element,
+                                        spf_direction):
+    reverse_direction = constants.reverse_dir(spf_direction)
+    nbr_node_ties = self.node_ties(reverse_direction, nbr_system_id)
+    if nbr_node_ties == []:
+        return False
+    for nbr_nbr in spf_graph.node_neighbors(nbr_node_ties, reverse_direction):
+        (nbr_nbr_system_id, nbr_nbr_tie_element) = nbr_nbr
+        if nbr_nbr_system_id != visit_system_id:
+            continue
+        for id1 in nbr_tie_element.link_ids:
+            for id2 in nbr_nbr_tie_element.link_ids:
+                if (id1.local_id == id2.remote_id) and (id1.remote_id == id2.local_id):
+                    return True
+    return False
+
+def reference_spf_run_direction(self, spf_direction):
+    self._spf_destinations[spf_direction] = {}
+    dest_table = self._spf_destinations[spf_direction]
+    self._spf_originator_order[spf_direction] = {}
+    self._spf_originator_prefixes[spf_direction] = {}
+    self._spf_prefix_originators[spf_direction] = {}
+    self_destination = spf_dest.make_node_destination(self.system_id, self.name, 0)
+    dest_table[self.system_id] = self_destination
+    candidates = heapdict.heapdict()
+    candidates[self.system_id] = 0
+    while candidates:
+        (dest_key, dest_cost) = candidates.popitem()
+        destination = dest_table[dest_key]
+        if destination.best:
+            continue
+        destination.best = True
+        if isinstance(dest_key, int):
+            reference_spf_add_candidates_from_node(self, dest_key, dest_cost, candidates,
+                                                   spf_direction)
+    self.spf_install_routes_in_rib(spf_direction)
+
+def reference_spf_add_candidates_from_node(self, node_system_id, node_cost, candidates,
+                                           spf_direction):
+    node_ties = self.node_ties(self.spf_use_tie_direction(node_system_id, spf_direction),
+                               node_system_id)
+    if node_ties == []:
+        return
+    dest_table = self._spf_destinations[spf_direction]
+    dest_table[node_system_id].name = node_ties[0].element.node.name
+    for nbr in spf_graph.node_neighbors(node_ties, spf_direction):
+        (nbr_system_id, nbr_tie_element) = nbr
+        if reference_is_neighbor_bidirectional(self, node_system_id, nbr_system_id,
+                                               nbr_tie_element, spf_direction):
+            cost = node_cost + nbr_tie_element.cost
+            destination = spf_dest.make_node_destination(nbr_system_id, None, cost)
+            interface_ids = [link_id_pair.local_id for link_id_pair in nbr_tie_element.link_ids]
+            self.spf_consider_candidate_dest(destination, interface_ids, node_system_id,
+                                             candidates, spf_direction)
+    originator_order = self._spf_originator_order[spf_direction]
+    originator_order[node_system_id] = len(originator_order)
+    originator_prefixes = set()
+    for prefix_tie in self.prefix_ties(self.spf_use_tie_direction(node_system_id, spf_direction),
+                                       node_system_id):
+        prefixes = prefix_tie.element.prefixes.prefixes
+        originator_prefixes.update(prefixes.keys())
+        for prefix, attributes in prefixes.items():
+            cost = node_cost + attributes.metric
+            destination = spf_dest.make_prefix_destintation(prefix, attributes.tags, cost)
+            self.spf_consider_candidate_dest(destination, None, node_system_id, candidates,
+                                             spf_direction)
+    self.spf_set_originator_prefixes(node_system_id, originator_prefixes, spf_direction)
+
+def install_reference_methods(benchmark_node):
+    benchmark_node.ties_of_type = types.MethodType(reference_ties_of_type, benchmark_node)
+    benchmark_node.spf_run_direction = types.MethodType(reference_spf_run_direction,
+                                                        benchmark_node)
+
+def install_current_methods(benchmark_node):
+    del benchmark_node.ties_of_type
+    del benchmark_node.spf_run_direction
+
+class ClosTopology:
+
+    def __init__(self, nr_pods, nr_leafs_per_pod, nr_spines_per_pod, nr_tofs):
+        self.levels = {}           # Level indexed by system-id
+        self.neighbors = {}        # List of (neighbor system-id, local link-id, remote link-id)
+        self.tof_ids = [1 + tof_nr for tof_nr in range(nr_tofs)]
+        self.spine_ids = []
+        self.leaf_ids = []
+        self._next_link_id = 1
+        for system_id in self.tof_ids:
+            self.add_node(system_id, TOF_LEVEL)
+        for pod_nr in range(nr_pods):
+            pod_spine_ids = [1000 + 100 * pod_nr + spine_nr
+                             for spine_nr in range(nr_spines_per_pod)]
+            pod_leaf_ids = [100000 + 1000 * pod_nr + leaf_nr
+                            for leaf_nr in range(nr_leafs_per_pod)]
+            for system_id in pod_spine_ids:
+                self.add_node(system_id, SPINE_LEVEL)
+                for tof_id in self.tof_ids:
+                    self.add_link(system_id, tof_id)
+            for system_id in pod_leaf_ids:
+                self.add_node(system_id, LEAF_LEVEL)
+                for spine_id in pod_spine_ids:
+                    self.add_link(system_id, spine_id)
+            self.spine_ids.extend(pod_spine_ids)
+            self.leaf_ids.extend(pod_leaf_ids)
+
+    def add_node(self, system_id, level):
+        self.levels[system_id] = level
+        self.neighbors[system_id] = []
+
+    def add_link(self, system_id_1, system_id_2):
+        link_id_1 = self._next_link_id
+        link_id_2 = self._next_link_id + 1
+        self._next_link_id += 2
+        self.neighbors[system_id_1].append((system_id_2, link_id_1, link_id_2))
+        self.neighbors[system_id_2].append((system_id_1, link_id_2, link_id_1))
+
+    def ties(self):
+        tie_packets = []
+        for system_id, level in self.levels.items():
+            for direction in [constants.DIR_SOUTH, constants.DIR_NORTH]:
+                tie_packets.append(self.node_tie_packet(system_id, level, direction))
+            tie_packets.append(self.prefix_tie_packet(system_id, level))
+        return tie_packets
+
+    def node_tie_packet(self, system_id, level, direction):
+        tie_packet = packet_common.make_node_tie_packet(
+            name="node-{}".format(system_id),
+            level=level,
+            direction=direction,
+            originator=system_id,
+            tie_nr=node.MY_TIE_NR,
+            seq_nr=1,
+            lifetime=common.constants.default_lifetime)
+        for (nbr_system_id, local_id, remote_id) in self.neighbors[system_id]:
+            link_id_pair = encoding.ttypes.LinkIDPair(local_id, remote_id)
+            tie_packet.element.node.neighbors[nbr_system_id] = \
+                encoding.ttypes.NodeNeighborsTIEElement(
+                    level=self.levels[nbr_system_id],
+                    cost=1,
+                    link_ids=set([link_id_pair]),
+                    bandwidth=100)
+        return tie_packet
+
+    @staticmethod
+    def prefix_tie_packet(system_id, level):
+        # Leafs advertise a prefix north, spines and top-of-fabric nodes advertise a default south
+        if level == LEAF_LEVEL:
+            direction = constants.DIR_NORTH
+            prefix_str = "10.{}.{}.0/24".format((system_id // 256) % 256, system_id % 256)
+        else:
+            direction = constants.DIR_SOUTH
+            prefix_str = "0.0.0.0/0"
+        tie_packet = packet_common.make_prefix_tie_packet(
+            direction=direction,
+            originator=system_id,
+            tie_nr=node.MY_TIE_NR,
+            seq_nr=1,
+            lifetime=common.constants.default_lifetime)
+        packet_common.add_ipv4_prefix_to_prefix_tie(tie_packet, prefix_str, 1)
+        return tie_packet
+
+def meta_topology_clos_topology(file_name, scale):
+    # Leaf nodes per pod are multiplied by the scale factor, and so are the pods if there are
+    # top-of-fabric (superspine) nodes to connect them.
+    with open(file_name, 'r') as stream:
+        meta_config = yaml.safe_load(stream)
+    nr_pods = meta_config.get('nr-pods', 1)
+    nr_leafs_per_pod = scale * meta_config['nr-leaf-nodes-per-pod']
+    nr_spines_per_pod = meta_config['nr-spine-nodes-per-pod']
+    nr_tofs = meta_config.get('nr-superspine-nodes', 0)
+    if nr_tofs > 0:
+        nr_pods *= scale
+    return ClosTopology(nr_pods, nr_leafs_per_pod, nr_spines_per_pod, nr_tofs)
+
+def make_node(topology, system_id):
+    config = {
+        'name': "node-{}".format(system_id),
+        'systemid': system_id,
+        'level': topology.levels[system_id],
+        'skip-self-orginated-ties': True,
+        'kernel_route_table': 'none'
+    }
+    benchmark_node = node.Node(config)
+    for tie_packet in topology.ties():
+        benchmark_node.store_tie(tie_packet)
+    return benchmark_node
+
+def spf_result(benchmark_node):
+    result = []
+    for spf_direction in [constants.DIR_SOUTH, constants.DIR_NORTH]:
+        for dest_key, dest in benchmark_node._spf_destinations[spf_direction].items():
+            result.append((spf_direction, str(dest_key), dest.cost,
+                           sorted(dest.predecessors)))
+    return sorted(result)
+
+def full_spf_run(benchmark_node):
+    for spf_direction in [constants.DIR_SOUTH, constants.DIR_NORTH]:
+        benchmark_node._spf_full_run_needed[spf_direction] = True
+    benchmark_node.spf_run()
+
+def full_spf_run_rebuild_graph(benchmark_node):
+    benchmark_node._spf_graph.mark_all_dirty()
+    full_spf_run(benchmark_node)
+
+def milliseconds_per_run(function, iterations):
+    seconds = timeit.timeit(function, number=iterations)
+    return 1000.0 * seconds / iterations
+
+def parse_command_line_arguments():
+    parser = argparse.ArgumentParser(description='RIFT SPF benchmark')
+    parser.add_argument('-i', '--iterations', type=int, default=10,
+                        help='Number of SPF runs on each node')
+    parser.add_argument('-p', '--nr-pods', type=int, default=8,
+                        help='Number of pods')
+    parser.add_argument('-l', '--nr-leafs-per-pod', type=int, default=16,
+                        help='Number of leaf nodes in each pod')
+    parser.add_argument('-s', '--nr-spines-per-pod', type=int, default=4,
+                        help='Number of spine nodes in each pod')
+    parser.add_argument('-t', '--nr-tofs', type=int, default=4,
+                        help='Number of top-of-fabric nodes')
+    parser.add_argument('-m', '--meta-topology', type=str,
+                        help='Meta-topology file (overrides -p, -l, -s, and -t)')
+    parser.add_argument('-x', '--scale', type=int, default=1,
+                        help='Scale factor for the meta-topology')
+    args = parser.parse_args()
+    return args
+
+def main():
+    args = parse_command_line_arguments()
+    logging.basicConfig(stream=open(os.devnull, "w"), level=logging.CRITICAL)
+    packet_common.add_missing_methods_to_thrift()
+    if args.meta_topology:
+        topology = meta_topology_clos_topology(args.meta_topology, args.scale)
+    else:
+        topology = ClosTopology(args.nr_pods, args.nr_leafs_per_pod, args.nr_spines_per_pod,
+                                args.nr_tofs)
+    tab = table.Table()
+    tab.add_row([
+        "Node",
+        "Level",
+        ["Reference", "Msec/SPF"],
+        ["Current", "Msec/SPF"],
+        "Speedup",
+        ["Current", "Rebuild Graph", "Msec/SPF"],
+        ["Rebuild Graph", "Speedup"],
+        ["CSR Engine", "Msec/SPF"],
+        ["CSR Engine", "Speedup"]])
+    benchmark_nodes = [("Leaf", topology.leaf_ids[0]), ("Spine", topology.spine_ids[0])]
+    if topology.tof_ids:
+        benchmark_nodes.append(("Top-of-Fabric", topology.tof_ids[0]))
+    for (name, system_id) in benchmark_nodes:
+        benchmark_node = make_node(topology, system_id)
+        spf_function = functools.partial(full_spf_run, benchmark_node)
+        rebuild_function = functools.partial(full_spf_run_rebuild_graph, benchmark_node)
+        install_reference_methods(benchmark_node)
+        reference_msecs = milliseconds_per_run(spf_function, args.iterations)
+        reference_result = spf_result(benchmark_node)
+        install_current_methods(benchmark_node)
+        msecs = milliseconds_per_run(spf_function, args.iterations)
+        assert spf_result(benchmark_node) == reference_result
+        rebuild_msecs = milliseconds_per_run(rebuild_function, args.iterations)
+        assert spf_result(benchmark_node) == reference_result
+        # The first run of the CSR engine builds the CSR snapshot of the SPF graph
+        benchmark_node._spf_engine = 'csr'
+        full_spf_run(benchmark_node)
+        csr_msecs = milliseconds_per_run(spf_function, args.iterations)
+        assert spf_result(benchmark_node) == reference_result
+        tab.add_row([
+            name,
+            topology.levels[system_id],
+            "{:.2f}".format(reference_msecs),
+            "{:.2f}".format(msecs),
+            "{:.2f}x".format(reference_msecs / msecs),
+            "{:.2f}".format(rebuild_msecs),
+            "{:.2f}x".format(reference_msecs / rebuild_msecs),
+            "{:.2f}".format(csr_msecs),
+            "{:.2f}x".format(reference_msecs / csr_msecs)])
+    print("Nodes: {}  TIEs: {}".format(len(topology.levels), len(topology.ties())))
+    print(tab.to_string())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+# Micro-benchmark for hashing and comparing TIE-IDs in the TIE-DB.
+#
+# This measures the throughput of inserting TIEs into an empty TIE-DB (a sorted dictionary indexed
+# by TIE-ID) in random order, of looking up TIEs in the TIE-DB, and of processing received TIDE
+# packets. Each test is
+# run once with the current hash and comparison methods of TIE-IDs and IP prefixes (which use a
+# cached key) and once with reference methods which build a tuple of the fields for every hash and
+# comparison.
+#
+# The TIE-IDs that are inserted and looked up, and the TIDEs that are processed, are freshly
+# decoded for every iteration (as they would be when they are received from a neighbor), so the
+# cost of computing the cached keys is included in the measurement.
+#
+# Run from the root of the repository: tools/benchmark_tie_db.py
+
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+
+import sortedcontainers
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rift"))
+
+# pylint:disable=wrong-import-position
+import common.constants
+import common.ttypes
+import constants
+import encoding.ttypes
+import node
+import packet_common
+import table
+
+def install_reference_methods():
+    common.ttypes.IPv4PrefixType.__hash__ = (
+        lambda self: hash(packet_common.ipv4_prefix_tup(self)))
+    common.ttypes.IPv4PrefixType.__eq__ = (
+        lambda self, other: packet_common.ipv4_prefix_tup(self) ==
+        packet_common.ipv4_prefix_tup(other))
+    common.ttypes.IPv6PrefixType.__hash__ = (
+        lambda self: hash(packet_common.ipv6_prefix_tup(self)))
+    common.ttypes.IPv6PrefixType.__eq__ = (
+        lambda self, other: packet_common.ipv6_prefix_tup(self) ==
+        packet_common.ipv6_prefix_tup(other))
+    common.ttypes.IPPrefixType.__hash__ = (
+        lambda self: hash(packet_common.ip_prefix_tup(self)))
+    common.ttypes.IPPrefixType.__eq__ = (
+        lambda self, other: packet_common.ip_prefix_tup(self) ==
+        packet_common.ip_prefix_tup(other))
+    common.ttypes.IPPrefixType.__lt__ = (
+        lambda self, other: packet_common.ip_prefix_tup(self) <
+        packet_common.ip_prefix_tup(other))
+    encoding.ttypes.TIEID.__hash__ = (
+        lambda self: hash(packet_common.tie_id_tup(self)))
+    encoding.ttypes.TIEID.__eq__ = (
+        lambda self, other: packet_common.tie_id_tup(self) == packet_common.tie_id_tup(other))
+    encoding.ttypes.TIEID.__lt__ = (
+        lambda self, other: packet_common.tie_id_tup(self) < packet_common.tie_id_tup(other))
+
+def install_current_methods():
+    packet_common.add_missing_methods_to_thrift()
+
+def make_tie_headers(nr_ties):
+    # The node TIEs and prefix TIEs in both directions of nr_ties / 4 originators
+    tie_headers = []
+    for originator_nr in range(nr_ties // 4):
+        for direction in [constants.DIR_SOUTH, constants.DIR_NORTH]:
+            for tie_type in [common.ttypes.TIETypeType.NodeTIEType,
+                             common.ttypes.TIETypeType.PrefixTIEType]:
+                tie_headers.append(packet_common.make_tie_header(
+                    direction=direction,
+                    originator=packet_common.MAX_U64 - originator_nr,
+                    tie_type=tie_type,
+                    tie_nr=1,
+                    seq_nr=1,
+                    lifetime=common.constants.default_lifetime))
+    return sorted(tie_headers, key=lambda tie_header: packet_common.tie_id_tup(tie_header.tieid))
+
+def encode_tide(tie_headers):
+    tide_packet = packet_common.make_tide_packet(
+        start_range=packet_common.make_tie_id(constants.DIR_SOUTH, 0, 0, 0),
+        end_range=packet_common.make_tie_id(constants.DIR_NORTH, packet_common.MAX_U64,
+                                            common.ttypes.TIETypeType.TIETypeMaxValue,
+                                            packet_common.MAX_U32))
+    for tie_header in tie_headers:
+        packet_common.add_tie_header_to_tide(tide_packet, tie_header)
+    protocol_packet = encoding.ttypes.ProtocolPacket(
+        header=encoding.ttypes.PacketHeader(sender=1, level=1),
+        content=encoding.ttypes.PacketContent(tide=tide_packet))
+    return packet_common.encode_protocol_packet(protocol_packet)
+
+def decode_tide(encoded_tide):
+    return packet_common.decode_protocol_packet(encoded_tide).content.tide
+
+def make_node(tie_headers):
+    config = {
+        'name': "benchmark-node",
+        'systemid': 1,
+        'level': 1,
+        'skip-self-orginated-ties': True,
+        'kernel_route_table': 'none'
+    }
+    benchmark_node = node.Node(config)
+    for tie_header in tie_headers:
+        tie_packet = encoding.ttypes.TIEPacket(header=tie_header, element=None)
+        benchmark_node.ties[tie_header.tieid] = tie_packet
+    return benchmark_node
+
+def insert_tie_ids(_benchmark_node, tides):
+    for tide_packet in tides:
+        ties = sortedcontainers.SortedDict()
+        for tie_header in tide_packet.headers:
+            ties[tie_header.tieid] = tie_header
+
+def shuffle_tides(tides):
+    shuffle_random = random.Random(1)
+    for tide_packet in tides:
+        shuffle_random.shuffle(tide_packet.headers)
+    return tides
+
+def lookup_tie_ids(benchmark_node, tides):
+    for tide_packet in tides:
+        for tie_header in tide_packet.headers:
+            assert benchmark_node.ties.get(tie_header.tieid) is not None
+
+def process_tides(benchmark_node, tides):
+    for tide_packet in tides:
+        benchmark_node.process_received_tide_packet(tide_packet)
+
+def ties_per_second(function, prepare_function, tie_headers, iterations):
+    # The TIE-DB is created after the hash and comparison methods are installed, since the hash of
+    # the TIE-IDs in the TIE-DB depends on them
+    benchmark_node = make_node(tie_headers)
+    encoded_tide = encode_tide(tie_headers)
+    tides = [decode_tide(encoded_tide) for _ in range(iterations)]
+    if prepare_function is not None:
+        tides = prepare_function(tides)
+    start_time = time.perf_counter()
+    function(benchmark_node, tides)
+    seconds = time.perf_counter() - start_time
+    return len(tie_headers) * iterations / seconds
+
+def parse_command_line_arguments():
+    parser = argparse.ArgumentParser(description='RIFT TIE-DB benchmark')
+    parser.add_argument('-i', '--iterations', type=int, default=50,
+                        help='Number of times each test is repeated')
+    parser.add_argument('-n', '--nr-ties', type=int, default=4000,
+                        help='Number of TIEs in the TIE-DB')
+    args = parser.parse_args()
+    return args
+
+def main():
+    args = parse_command_line_arguments()
+    logging.basicConfig(stream=open(os.devnull, "w"), level=logging.CRITICAL)
+    install_current_methods()
+    tie_headers = make_tie_headers(args.nr_ties)
+    tests = [
+        ("TIE-DB insert", insert_tie_ids, shuffle_tides),
+        ("TIE-DB lookup", lookup_tie_ids, None),
+        ("TIDE processing", process_tides, None)
+    ]
+    tab = table.Table()
+    tab.add_row([
+        "Test",
+        ["Reference", "TIEs/sec"],
+        ["Current", "TIEs/sec"],
+        "Speedup"])
+    for (name, function, prepare_function) in tests:
+        install_reference_methods()
+        reference_rate = ties_per_second(function, prepare_function, tie_headers, args.iterations)
+        install_current_methods()
+        rate = ties_per_second(function, prepare_function, tie_headers, args.iterations)
+        tab.add_row([
+            name,
+            "{:.0f}".format(reference_rate),
+            "{:.0f}".format(rate),
+            "{:.2f}x".format(rate / reference_rate)])
+    print("TIEs: {}".format(len(tie_headers)))
+    print(tab.to_string())
+
+if __name__ == "__main__":
+    main()